@@ -0,0 +1,246 @@
+"""
+Offline batch generation for large campaigns.
+
+Instead of calling Groq once per recipient, every generate_invitation request is
+written to an OpenAI-compatible batch JSONL file (one line per recipient, custom_id
+set to the recipient email). The file can be submitted to the Groq/OpenAI batch API
+and processed asynchronously, outside the interactive rate limits. The completed
+results file is then imported into the message store - together with the
+exported profiles, so each record carries the same fields as an interactive
+run - and the next run of v4_improved.py sends the stored bodies without
+calling Groq.
+
+Usage:
+    python batch_jobs.py export data/4_profiles.csv output/batch_input.jsonl
+    python batch_jobs.py fake-process output/batch_input.jsonl output/batch_results.jsonl
+    python batch_jobs.py import output/batch_results.jsonl data/4_profiles.csv
+
+fake-process stands in for the remote batch processor so the whole round trip can
+be exercised locally.
+"""
+import os
+import sys
+import json
+import logging
+from datetime import datetime
+
+from v4_improved import (
+    DEFAULT_CAMPAIGN,
+    GROQ_MODEL,
+    INVITATION_SYSTEM_PROMPT,
+    MESSAGE_STORE_PATH,
+    append_to_message_store,
+    build_invitation_prompt,
+    get_stored_body,
+    is_unsubscribed,
+    is_valid_generated_body,
+    load_message_store,
+    load_profiles,
+    message_store_record,
+    was_already_sent,
+)
+from contact_history import capped_recipients
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def build_batch_request(profile):
+    """Build one batch API request line for a profile."""
+    return {
+        "custom_id": profile['email'].lower(),
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": GROQ_MODEL,
+            "messages": [
+                {"role": "system", "content": INVITATION_SYSTEM_PROMPT},
+                {"role": "user", "content": build_invitation_prompt(profile)}
+            ],
+            "max_tokens": 500,
+            "temperature": 0.8
+        }
+    }
+
+
+def export_batch(csv_path, output_path):
+    """
+    Write a batch input file with one request per sendable profile.
+    Unsubscribed recipients, duplicates, recipients at their frequency cap and
+    recipients that were already sent to or already have a stored body for this
+    event are left out.
+    """
+    profiles, _ = load_profiles(csv_path)
+    message_store = load_message_store()
+    frequency_capped = capped_recipients()
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    seen = set()
+    written = 0
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for _, profile in profiles.iterrows():
+            email = profile['email'].lower()
+            if email in seen:
+                logging.warning(f"Duplicate recipient {profile['email']} - exported once")
+                continue
+            seen.add(email)
+
+            if is_unsubscribed(profile['email']):
+                logging.info(f"Skipping {profile['email']} - unsubscribed")
+                continue
+            if was_already_sent(message_store, profile['email']):
+                logging.info(f"Skipping {profile['email']} - already sent for this event")
+                continue
+            if email in frequency_capped:
+                logging.info(f"Skipping {profile['email']} - frequency cap reached ({frequency_capped[email]})")
+                continue
+            if get_stored_body(message_store, profile['email']):
+                logging.info(f"Skipping {profile['email']} - body already in message store")
+                continue
+
+            f.write(json.dumps(build_batch_request(profile)) + '\n')
+            written += 1
+
+    logging.info(f"Exported {written} batch requests to: {output_path}")
+    return written
+
+
+def extract_batch_body(result):
+    """Return the generated body from one batch result line, or raise ValueError."""
+    if result.get('error'):
+        raise ValueError(f"batch error: {result['error']}")
+
+    response = result.get('response') or {}
+    if response.get('status_code') != 200:
+        raise ValueError(f"status code {response.get('status_code')}")
+
+    try:
+        body = response['body']['choices'][0]['message']['content'].strip()
+    except (KeyError, IndexError, TypeError, AttributeError):
+        raise ValueError("response has no message content")
+
+    if not is_valid_generated_body(body):
+        raise ValueError("generated body failed validation")
+    return body
+
+
+def import_batch_results(results_path, csv_path):
+    """
+    Ingest a completed batch results file into the message store.
+    Each result is matched by custom_id to the profile it was exported from
+    (csv_path), so the record carries the content hash, company and vector
+    fields used by re-runs and the similarity cache. Failed or invalid
+    results, and results without a matching profile, are skipped; those
+    recipients are generated interactively on the next campaign run.
+    """
+    profiles, _ = load_profiles(csv_path)
+    profiles_by_email = {profile['email'].lower(): profile for _, profile in profiles.iterrows()}
+    imported = []
+    failed = 0
+
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+                email = result['custom_id']
+                body = extract_batch_body(result)
+                profile = profiles_by_email[email.lower()]
+            except (ValueError, KeyError) as e:
+                failed += 1
+                logging.warning(f"Skipping batch result {line[:80].strip()}: {e}")
+                continue
+
+            imported.append(message_store_record({
+                'timestamp': datetime.now().isoformat(),
+                'email': email,
+                'body': body,
+                'sent_status': 'generated',
+                'error_message': None
+            }, profile))
+
+    append_to_message_store(imported)
+    logging.info(f"Imported {len(imported)} bodies into {MESSAGE_STORE_PATH} ({failed} failed)")
+    return len(imported), failed
+
+
+def fake_complete(request_body):
+    """Deterministic stand-in for the model, built from the prompt's recipient block."""
+    prompt = request_body['messages'][-1]['content']
+    details = dict(
+        line.strip('- ').split(': ', 1)
+        for line in prompt.splitlines()
+        if line.startswith('- ') and ': ' in line
+    )
+    name = details.get('Name', 'there').split()[0]
+    interests = details.get('Interests', 'your work')
+
+    body = (
+        f"Hi {name},\n\n"
+        f"I thought of you straight away when we started planning {DEFAULT_CAMPAIGN.event_name}. "
+        f"Given your interest in {interests}, I think a few of the sessions would be right up your street, "
+        "and the people in the room are exactly the kind you would enjoy swapping notes with over coffee. "
+        "It is a small, friendly crowd, the talks are practical rather than salesy, and there is plenty of "
+        "time between sessions to actually talk to people.\n\n"
+        "If it sounds interesting, grab a spot on the registration page while there is still room. "
+        "It would be great to see you there and catch up properly.\n\n"
+        "Talk soon!"
+    )
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "model": request_body.get('model'),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": body}, "finish_reason": "stop"}]
+    }
+
+
+def fake_process_batch(input_path, output_path, complete=fake_complete):
+    """
+    Local batch processor: turn a batch input file into a results file in the
+    OpenAI batch output format, using `complete` instead of a remote model.
+    """
+    processed = 0
+
+    with open(input_path, 'r', encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as out:
+        for n, line in enumerate(src, 1):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            try:
+                response = {"status_code": 200, "request_id": f"req_{n}", "body": complete(request['body'])}
+                error = None
+            except Exception as e:
+                response = None
+                error = {"code": "processing_error", "message": str(e)}
+
+            out.write(json.dumps({
+                "id": f"batch_req_{n}",
+                "custom_id": request['custom_id'],
+                "response": response,
+                "error": error
+            }) + '\n')
+            processed += 1
+
+    logging.info(f"Fake-processed {processed} batch requests into: {output_path}")
+    return processed
+
+
+def main(argv):
+    commands = {
+        'export': (export_batch, 2),
+        'import': (import_batch_results, 2),
+        'fake-process': (fake_process_batch, 2),
+    }
+
+    if len(argv) < 1 or argv[0] not in commands or len(argv) - 1 != commands[argv[0]][1]:
+        print(__doc__)
+        return 1
+
+    func, _ = commands[argv[0]]
+    func(*argv[1:])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
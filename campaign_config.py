@@ -0,0 +1,69 @@
+"""
+Per-campaign settings.
+
+The event, its sender and its share of the provider capacity belong to one
+campaign rather than to the process, so that several campaigns can run side by
+side in the service (service.py). CampaignConfig.from_env() gives the .env
+settings that a plain `python v4_improved.py` run uses. from_dict() builds a
+campaign from a job request and falls back to those settings for anything the
+request leaves out.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class CampaignConfig:
+    """
+    One campaign: the event it invites to, the sender and unsubscribe link its
+    messages carry, and its `weight` when campaigns share the Groq and send
+    capacity (a weight-3 campaign gets three turns for every one of a weight-1 campaign).
+    """
+
+    FIELDS = ('event_name', 'event_date', 'event_location', 'sender_email', 'unsubscribe_base_url', 'weight')
+
+    def __init__(self, event_name, event_date=None, event_location=None, sender_email=None,
+                 unsubscribe_base_url=None, weight=1.0):
+        self.event_name = event_name
+        self.event_date = event_date
+        self.event_location = event_location
+        self.sender_email = sender_email
+        self.unsubscribe_base_url = unsubscribe_base_url
+        self.weight = float(weight)
+        if self.weight <= 0:
+            raise ValueError(f"Campaign weight must be positive, got {weight}")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            event_name=os.getenv("EVENT_NAME"),
+            event_date=os.getenv("EVENT_DATE"),
+            event_location=os.getenv("EVENT_LOCATION"),
+            sender_email=os.getenv("SENDER_EMAIL", "events@mariageni.se"),
+            unsubscribe_base_url=os.getenv("UNSUBSCRIBE_BASE_URL", "https://yourdomain.com/unsubscribe"),
+            weight=os.getenv("CAMPAIGN_WEIGHT", "1")
+        )
+
+    @classmethod
+    def from_dict(cls, data, defaults=None):
+        """Campaign from a dict of FIELDS; missing fields come from `defaults`. Raises ValueError."""
+        if not isinstance(data, dict):
+            raise ValueError("Campaign settings must be an object")
+        unknown = sorted(set(data) - set(cls.FIELDS))
+        if unknown:
+            raise ValueError(f"Unknown campaign settings: {', '.join(unknown)}")
+        values = defaults.to_dict() if defaults is not None else {}
+        values.update({key: value for key, value in data.items() if value is not None})
+        if not values.get('event_name'):
+            raise ValueError("Campaign needs an event_name")
+        try:
+            return cls(**values)
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"CampaignConfig({self.event_name!r}, weight={self.weight:g})"
@@ -0,0 +1,228 @@
+"""
+Cross-campaign contact history and frequency caps.
+
+Every successful send is recorded here (recipient, event, time) in a SQLite
+database shared by all campaigns. FREQUENCY_CAP rules such as "1/7,3/30" (at
+most 1 email per 7 days and 3 per 30 days, whatever the event) are checked
+before generation starts, so a capped contact costs neither a Groq call nor a
+send. The check is one aggregate query per rule over an index on the send
+time; it returns only the capped addresses, and candidates are then filtered
+with a set lookup. Capping is off unless FREQUENCY_CAP is set.
+
+Usage:
+    python contact_history.py stats                           # contacts and capped addresses
+    python contact_history.py check someone@example.com       # history of one address
+    python contact_history.py backfill output/message_store.jsonl   # seed from past sends
+    python contact_history.py prune                           # drop history older than the longest rule
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONTACT_HISTORY_DB_PATH = os.getenv("CONTACT_HISTORY_DB_PATH", "data/contact_history.db")
+# Comma-separated "max emails/days" rules; empty disables capping
+FREQUENCY_CAP = os.getenv("FREQUENCY_CAP", "")
+
+
+def parse_frequency_caps(spec=None):
+    """'1/7,3/30' -> [(1, 7.0), (3, 30.0)]."""
+    spec = FREQUENCY_CAP if spec is None else spec
+    rules = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        count, _, days = part.partition('/')
+        try:
+            rule = (int(count), float(days))
+        except ValueError:
+            raise ValueError(f"Invalid FREQUENCY_CAP rule '{part}' (expected e.g. 3/30)")
+        if rule[0] < 1 or rule[1] <= 0:
+            raise ValueError(f"Invalid FREQUENCY_CAP rule '{part}'")
+        rules.append(rule)
+    return rules
+
+
+def describe_rule(rule):
+    count, days = rule
+    return f"{count} per {days:g} days"
+
+
+def connect(path=None):
+    """Open the contact history database, creating it on first use."""
+    path = path or CONTACT_HISTORY_DB_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS contacts (
+            email TEXT NOT NULL,
+            event TEXT,
+            sent_at REAL NOT NULL
+        )
+    """)
+    # (sent_at, email) covers the per-rule aggregate, (email, sent_at) single-address checks
+    conn.execute("CREATE INDEX IF NOT EXISTS contacts_sent_at ON contacts (sent_at, email)")
+    conn.execute("CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email, sent_at)")
+    return conn
+
+
+def record_contacts(entries, path=None):
+    """
+    Commit a batch of sends in one transaction.
+    entries: iterable of (email, event, sent_at) with sent_at a Unix timestamp (None = now).
+    """
+    now = time.time()
+    rows = [(email.strip().lower(), event, sent_at or now) for email, event, sent_at in entries]
+    if not rows:
+        return 0
+
+    conn = connect(path)
+    try:
+        with conn:
+            conn.executemany("INSERT INTO contacts (email, event, sent_at) VALUES (?, ?, ?)", rows)
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def capped_recipients(rules=None, now=None, path=None):
+    """
+    Addresses that may not be contacted now, as {email: rule description}.
+    One GROUP BY query per rule; only addresses at or over a limit are returned.
+    """
+    rules = parse_frequency_caps() if rules is None else rules
+    path = path or CONTACT_HISTORY_DB_PATH
+    if not rules or not os.path.exists(path):
+        return {}
+
+    now = now or time.time()
+    capped = {}
+    conn = connect(path)
+    try:
+        for rule in rules:
+            count, days = rule
+            rows = conn.execute(
+                "SELECT email FROM contacts WHERE sent_at >= ? GROUP BY email HAVING COUNT(*) >= ?",
+                (now - days * 86400, count)
+            )
+            for (email,) in rows:
+                capped.setdefault(email, describe_rule(rule))
+    finally:
+        conn.close()
+    return capped
+
+
+def frequency_cap_reached(email, rules=None, now=None, path=None):
+    """Rule description if this address is capped right now, else None (indexed lookup)."""
+    rules = parse_frequency_caps() if rules is None else rules
+    path = path or CONTACT_HISTORY_DB_PATH
+    if not rules or not os.path.exists(path):
+        return None
+
+    now = now or time.time()
+    conn = connect(path)
+    try:
+        for rule in rules:
+            count, days = rule
+            (sent,) = conn.execute(
+                "SELECT COUNT(*) FROM contacts WHERE email = ? AND sent_at >= ?",
+                (email.strip().lower(), now - days * 86400)
+            ).fetchone()
+            if sent >= count:
+                return describe_rule(rule)
+    finally:
+        conn.close()
+    return None
+
+
+def contact_history(email, path=None):
+    """[(event, sent_at), ...] for one address, most recent first."""
+    conn = connect(path)
+    try:
+        return conn.execute(
+            "SELECT event, sent_at FROM contacts WHERE email = ? ORDER BY sent_at DESC",
+            (email.strip().lower(),)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def prune_contact_history(rules=None, path=None):
+    """Drop contacts older than the longest rule window. Returns rows removed."""
+    rules = parse_frequency_caps() if rules is None else rules
+    if not rules:
+        return 0
+    cutoff = time.time() - max(days for _, days in rules) * 86400
+    conn = connect(path)
+    try:
+        with conn:
+            removed = conn.execute("DELETE FROM contacts WHERE sent_at < ?", (cutoff,)).rowcount
+    finally:
+        conn.close()
+    return removed
+
+
+def backfill_from_message_store(store_path, path=None):
+    """Record the sends found in a message store (JSONL). Returns the number recorded."""
+    entries = []
+    with open(store_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('sent_status') != 'sent' or record.get('dry_run') or not record.get('email'):
+                continue
+            try:
+                sent_at = datetime.fromisoformat(record['timestamp']).timestamp()
+            except (KeyError, TypeError, ValueError):
+                continue
+            entries.append((record['email'], record.get('event'), sent_at))
+    return record_contacts(entries, path)
+
+
+def print_stats(path=None):
+    conn = connect(path)
+    try:
+        (contacts, addresses) = conn.execute("SELECT COUNT(*), COUNT(DISTINCT email) FROM contacts").fetchone()
+    finally:
+        conn.close()
+    rules = parse_frequency_caps()
+    print(f"\nContact history: {contacts} sends to {addresses} addresses")
+    print(f"Frequency caps: {', '.join(describe_rule(rule) for rule in rules) or 'off'}")
+    print(f"Capped right now: {len(capped_recipients(rules, path=path))} addresses")
+
+
+def main(argv):
+    if argv == ['stats']:
+        print_stats()
+    elif len(argv) == 2 and argv[0] == 'check':
+        for event, sent_at in contact_history(argv[1]):
+            print(f"{datetime.fromtimestamp(sent_at).isoformat(timespec='seconds')}  {event}")
+        reason = frequency_cap_reached(argv[1])
+        print(f"Capped ({reason})" if reason else "Not capped")
+    elif len(argv) == 2 and argv[0] == 'backfill':
+        print(f"Recorded {backfill_from_message_store(argv[1])} past sends")
+    elif argv == ['prune']:
+        print(f"Removed {prune_contact_history()} old contacts")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,365 @@
+"""
+Compressed, indexed archive of generated email bodies.
+
+The CSV backups (output/generated_emails_*.csv) and plain-text dumps
+(output/emails_groq_*.txt) store every body uncompressed, and finding one
+recipient means reading the whole file. An archive packs records into blocks of
+JSON lines, compresses each block with zstd (zlib when the zstandard package is
+not installed) and keeps a sidecar index from email to block, so:
+
+- one message is retrieved by decompressing a single block
+- iterating over the whole history streams one block at a time
+- similar bodies compressed together take a fraction of their CSV size
+
+Layout: <path> holds the blocks back to back, <path>.idx.db (SQLite) holds the
+codec, the offset, length and record count of every block and the blocks of
+each email. New blocks are appended, and indexing one is a few inserts, so one
+archive can hold the history of many runs. An older JSON <path>.idx is moved
+into the SQLite index the next time the archive is written.
+
+Usage:
+    python email_archive.py convert output/history.zarc output/generated_emails_*.csv output/emails_groq_*.txt
+    python email_archive.py get output/history.zarc someone@example.com
+    python email_archive.py dump output/history.zarc
+    python email_archive.py stats output/history.zarc
+"""
+import os
+import re
+import sys
+import csv
+import json
+import zlib
+import sqlite3
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock
+    fcntl = None
+
+ARCHIVE_BLOCK_RECORDS = int(os.getenv("ARCHIVE_BLOCK_RECORDS", "256"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "19"))
+
+
+def _compressor(codec, level):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress
+    return lambda data: zlib.compress(data, min(level, 9))
+
+
+def _decompressor(codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("This archive is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+
+def _index_path(path):
+    return path + '.idx.db'
+
+
+def _legacy_index_path(path):
+    # Archives written before the SQLite index kept a zlib-compressed JSON index here
+    return path + '.idx'
+
+
+def _lock_path(path):
+    return path + '.lock'
+
+
+def _connect_index(path):
+    conn = sqlite3.connect(_index_path(path), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blocks (
+            block INTEGER PRIMARY KEY,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            records INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS emails (
+            email TEXT NOT NULL,
+            block INTEGER NOT NULL,
+            PRIMARY KEY (email, block)
+        ) WITHOUT ROWID
+    """)
+    return conn
+
+
+def _migrate_legacy_index(path, conn):
+    """Move a JSON index into the SQLite index (once, under the writer lock)."""
+    legacy = _legacy_index_path(path)
+    if not os.path.exists(legacy):
+        return
+    with open(legacy, 'rb') as f:
+        index = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+    counts = {}
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('codec', ?)", (index['codec'],))
+        for email, blocks in index['emails'].items():
+            conn.executemany("INSERT OR IGNORE INTO emails (email, block) VALUES (?, ?)", [(email, b) for b in blocks])
+            for block in blocks:
+                counts[block] = counts.get(block, 0) + 1
+        # The JSON index kept no per-block record counts; the total goes on the last block
+        rows = [[block, offset, length, 0] for block, (offset, length) in enumerate(index['blocks'])]
+        if rows:
+            rows[-1][3] = index['records']
+        conn.executemany("INSERT OR REPLACE INTO blocks (block, offset, length, records) VALUES (?, ?, ?, ?)", rows)
+    os.remove(legacy)
+    logging.info(f"Archive {path}: moved {len(index['blocks'])} blocks from the JSON index to {_index_path(path)}")
+
+
+class ArchiveWriter:
+    """
+    Append records (dicts with an 'email' key) to an archive. Records are
+    buffered and written as one compressed block every `block_records` records.
+    Each block is indexed in a SQLite transaction that commits on close, after
+    the blocks are synced, so an archive is only extended by complete blocks and
+    an append costs the same however long the history is. A writer holds an
+    exclusive lock on the archive from open to close, so writers in other
+    processes wait for it instead of overwriting its blocks.
+    """
+
+    def __init__(self, path, block_records=None, level=None):
+        self.path = path
+        self.block_records = block_records or ARCHIVE_BLOCK_RECORDS
+        self.level = level
+        self.buffer = []
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock_file = open(_lock_path(path), 'a')
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            self._open()
+        except Exception:
+            self._lock_file.close()
+            raise
+
+    def _open(self):
+        # Runs under the lock: the index and the end of the file are those the last writer left
+        path = self.path
+        self.conn = _connect_index(path)
+        _migrate_legacy_index(path, self.conn)
+
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'codec'").fetchone()
+        self.codec = row[0] if row else ('zstd' if zstandard is not None else 'zlib')
+        if self.codec == 'zstd' and zstandard is None:
+            self.conn.close()
+            raise RuntimeError(f"{path} is zstd-compressed; install the zstandard package to append to it")
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('codec', ?)", (self.codec,))
+
+        self._compress = _compressor(self.codec, self.level or ARCHIVE_COMPRESSION_LEVEL)
+        (end, self._next_block) = self.conn.execute(
+            "SELECT COALESCE(MAX(offset + length), 0), COALESCE(MAX(block) + 1, 0) FROM blocks"
+        ).fetchone()
+        self.file = open(path, 'ab')
+        # Drop any bytes a crashed writer left after the last indexed block
+        self.file.truncate(end)
+        self.file.seek(end)
+
+    def write(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.block_records:
+            self._flush_block()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def _flush_block(self):
+        if not self.buffer:
+            return
+        payload = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in self.buffer)
+        data = self._compress(payload.encode('utf-8'))
+
+        offset = self.file.tell()
+        self.file.write(data)
+        block = self._next_block
+        self._next_block += 1
+        self.conn.execute(
+            "INSERT INTO blocks (block, offset, length, records) VALUES (?, ?, ?, ?)",
+            (block, offset, len(data), len(self.buffer))
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO emails (email, block) VALUES (?, ?)",
+            {(str(record.get('email') or '').lower(), block) for record in self.buffer}
+        )
+        self.buffer = []
+
+    def close(self):
+        try:
+            self._flush_block()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.conn.commit()
+            self.conn.close()
+        finally:
+            # Closing the lock file releases the lock for the next writer
+            self._lock_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArchiveReader:
+    """Random access by email and streaming iteration over an archive."""
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(_index_path(path)):
+            raise FileNotFoundError(f"No archive index for {path}")
+        self.conn = _connect_index(path)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'codec'").fetchone()
+        self.codec = row[0] if row else 'zlib'
+        self._decompress = _decompressor(self.codec)
+        self._cached_block = (None, None)
+
+    def _read_block(self, block, offset, length):
+        if self._cached_block[0] == block:
+            return self._cached_block[1]
+
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        records = [json.loads(line) for line in self._decompress(data).decode('utf-8').splitlines() if line]
+        self._cached_block = (block, records)
+        return records
+
+    def get_all(self, email):
+        """Every archived record for this email, oldest first."""
+        key = email.lower()
+        blocks = self.conn.execute(
+            "SELECT b.block, b.offset, b.length FROM emails e JOIN blocks b ON b.block = e.block "
+            "WHERE e.email = ? ORDER BY b.block",
+            (key,)
+        ).fetchall()
+        return [
+            record
+            for block in blocks
+            for record in self._read_block(*block)
+            if str(record.get('email') or '').lower() == key
+        ]
+
+    def get(self, email):
+        """Most recent archived record for this email, or None."""
+        records = self.get_all(email)
+        return records[-1] if records else None
+
+    def block_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    def recipient_count(self):
+        return self.conn.execute("SELECT COUNT(DISTINCT email) FROM emails").fetchone()[0]
+
+    def __iter__(self):
+        for block in self.conn.execute("SELECT block, offset, length FROM blocks ORDER BY block").fetchall():
+            yield from self._read_block(*block)
+
+    def __contains__(self, email):
+        return self.conn.execute("SELECT 1 FROM emails WHERE email = ? LIMIT 1", (email.lower(),)).fetchone() is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COALESCE(SUM(records), 0) FROM blocks").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def append_records(path, records):
+    """Append records to the archive at `path`, creating it if needed."""
+    with ArchiveWriter(path) as writer:
+        writer.write_many(records)
+
+
+def read_csv_backup(csv_path):
+    """Stream records from a generated_emails_*.csv backup."""
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield {k: (v if v != '' else None) for k, v in row.items()}
+
+
+def read_text_dump(txt_path):
+    """
+    Stream records from an emails_groq_*.txt dump. These dumps have no email
+    column, so records are keyed '<file name>#<email number>'.
+    """
+    with open(txt_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    name = os.path.basename(txt_path)
+    sections = re.split(r"\n={10,}\nEMAIL #(\d+)\n={10,}\n", text)
+    for number, section in zip(sections[1::2], sections[2::2]):
+        header, _, body = section.partition('\n' + '-' * 60 + '\n')
+        record = {'email': f"{name}#{number}", 'source': name}
+        for line in header.splitlines():
+            if ': ' in line:
+                field, value = line.split(': ', 1)
+                record[field.strip().lower().replace(' ', '_')] = value.strip()
+        record['body'] = (body if body else header).strip()
+        yield record
+
+
+def convert(archive_path, source_paths):
+    """Append CSV backups and text dumps to an archive. Returns records written."""
+    written = 0
+    with ArchiveWriter(archive_path) as writer:
+        for source in source_paths:
+            reader = read_text_dump if source.endswith('.txt') else read_csv_backup
+            count = 0
+            for record in reader(source):
+                writer.write(record)
+                count += 1
+            written += count
+            logging.info(f"Archived {count} records from {source}")
+
+    source_size = sum(os.path.getsize(source) for source in source_paths)
+    logging.info(f"Archive {archive_path}: {written} records added ({source_size} bytes of source)")
+    return written
+
+
+def print_stats(archive_path):
+    reader = ArchiveReader(archive_path)
+    size = os.path.getsize(archive_path) + os.path.getsize(_index_path(archive_path))
+    raw = sum(len(json.dumps(record, ensure_ascii=False, default=str)) + 1 for record in reader)
+    print(f"\nArchive: {archive_path} ({reader.codec})")
+    print(f"Records: {len(reader)} in {reader.block_count()} blocks, {reader.recipient_count()} recipients")
+    print(f"Size on disk: {size} bytes (uncompressed {raw} bytes, ratio {raw / size if size else 0:.1f}x)")
+
+
+def main(argv):
+    if len(argv) >= 3 and argv[0] == 'convert':
+        convert(argv[1], argv[2:])
+    elif len(argv) == 3 and argv[0] == 'get':
+        record = ArchiveReader(argv[1]).get(argv[2])
+        if record is None:
+            print(f"No archived message for {argv[2]}")
+            return 1
+        print(json.dumps(record, indent=2, ensure_ascii=False))
+    elif len(argv) == 2 and argv[0] == 'dump':
+        for record in ArchiveReader(argv[1]):
+            print(json.dumps(record, ensure_ascii=False))
+    elif len(argv) == 2 and argv[0] == 'stats':
+        print_stats(argv[1])
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,602 @@
+"""
+Flow control for calls to rate-limited, sometimes unavailable providers.
+
+A fixed number of concurrent generation calls is either too low (quota left
+unused) or too high (429 storms), and the backend's real capacity changes during
+the day. AIMDLimiter grows the number of calls allowed in flight additively
+(+1 per round trip's worth of healthy completions) while latency and error rate
+stay healthy, and cuts it multiplicatively on overload: a 429/503/timeout, or a
+latency well above the best recently observed. At most one cut is applied per
+round trip, so a burst of 429s from calls already in flight counts once.
+
+CircuitBreaker stops calling a provider that is down: after too many failures
+calls fail fast, the work waits (parked) instead of failing, trial requests probe
+for recovery and full throughput resumes once one succeeds.
+
+RequestHedger cuts tail latency: when a call is still running after a high
+percentile of recent latencies, one duplicate is fired and whichever returns
+first wins. Hedges draw on their own budget (a share of primary requests).
+
+RateLimitPacer spaces calls out before the provider refuses them: every
+response's x-ratelimit-remaining-* / x-ratelimit-reset-* headers say how much of
+the request and token budget is left and when it refills, and calls are
+scheduled so that budget is spread evenly over the time to the reset.
+
+WeightedFairScheduler shares these limits between campaigns running in one
+process: the next generation slot and the next send go to the campaign whose
+weighted share is furthest behind, so a small urgent campaign is not starved
+by a huge low-priority one.
+"""
+import re
+import time
+import heapq
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class AIMDLimiter:
+    """Thread-safe concurrency limit: acquire() before a call, release() after it."""
+
+    def __init__(self, initial=1, minimum=1, maximum=16, decrease_factor=0.5,
+                 latency_tolerance=2.0, max_error_rate=0.2, window=50):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.increases = 0
+        self.decreases = 0
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Block until a call may start. Returns a token to pass to release()."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def has_capacity(self):
+        """True if a call could start right now without waiting."""
+        with self._condition:
+            return self.in_flight < int(self.limit)
+
+    def _baseline_latency(self):
+        # 10th percentile of recent latencies: what the backend does when it isn't congested
+        if len(self._latencies) < 5:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[len(ordered) // 10]
+
+    def _decrease(self, started):
+        # Calls started before the last cut saw the old limit; don't punish them twice
+        if started <= self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        self._last_decrease = time.monotonic()
+        self.decreases += 1
+
+    def cancel(self, token):
+        """Give back a slot whose call was never made, without reporting an outcome."""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def release(self, token, overloaded=False, failed=False, work=1.0, waited=0.0):
+        """
+        Report a finished call. `overloaded` marks rate-limit/server-busy errors,
+        `failed` any other error; `work` scales latency for calls that are
+        expected to take longer (e.g. batched prompts with more output tokens).
+        `waited` is time spent holding the slot before the call was sent (pacing),
+        which doesn't count as latency.
+        """
+        latency = (time.monotonic() - token - waited) / max(work, 1e-9)
+        with self._condition:
+            was_saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            self._outcomes.append(bool(overloaded or failed))
+
+            if overloaded:
+                self._decrease(token)
+            elif not failed:
+                baseline = self._baseline_latency()
+                self._latencies.append(latency)
+                error_rate = sum(self._outcomes) / len(self._outcomes)
+
+                if baseline is not None and latency > baseline * self.latency_tolerance:
+                    self._decrease(token)
+                elif was_saturated and error_rate <= self.max_error_rate and self.limit < self.maximum:
+                    # Only grow while the limit is actually the bottleneck
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                    self.increases += 1
+                    self.peak_limit = max(self.peak_limit, self.limit)
+
+            self._condition.notify_all()
+
+    def snapshot(self):
+        """Current limiter state for status endpoints and reports."""
+        with self._condition:
+            baseline = self._baseline_latency()
+            return {
+                'limit': round(self.limit, 2),
+                'in_flight': self.in_flight,
+                'peak_limit': round(self.peak_limit, 2),
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'baseline_latency_seconds': round(baseline, 3) if baseline is not None else None,
+                'error_rate': round(sum(self._outcomes) / len(self._outcomes), 3) if self._outcomes else 0.0
+            }
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+    def __init__(self, provider, retry_in):
+        super().__init__(f"{provider} circuit open - provider unavailable, next probe in {retry_in:.0f}s")
+        self.provider = provider
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker over the outcomes of the last `window` calls.
+
+    closed: calls go through; once at least `min_calls` outcomes are known and
+    the failure rate reaches `failure_rate`, the circuit opens.
+    open: calls fail fast with CircuitOpenError for `open_seconds`.
+    half_open: up to `probes` trial calls go through; a success closes the
+    circuit, a failure opens it again with the open period doubled (capped at
+    `max_open_seconds`).
+
+    A provider that stays down for longer than `max_outage_seconds` is reported
+    as exhausted(), so callers can stop waiting for it.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=5, window=20, open_seconds=30,
+                 max_open_seconds=300, probes=1, max_outage_seconds=3600):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probes = probes
+        self.max_outage_seconds = max_outage_seconds
+        self.state = 'closed'
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self._current_open_seconds = open_seconds
+        self._retry_at = 0.0
+        self._outage_started = None
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go to the provider now (possibly as a half-open probe)."""
+        return self._admit() is not None
+
+    def _admit(self):
+        # 'call' (circuit closed), 'probe' (half-open trial call) or None (refused)
+        with self._lock:
+            if self.state == 'open' and time.monotonic() >= self._retry_at:
+                self.state = 'half_open'
+                self._probes_in_flight = 0
+            if self.state == 'closed':
+                return 'call'
+            if self.state == 'half_open' and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return 'probe'
+            return None
+
+    def check(self):
+        """
+        allow(), raising CircuitOpenError instead of returning False. Returns
+        True if the call was admitted as a half-open probe (see cancel()).
+        """
+        admitted = self._admit()
+        if admitted is None:
+            raise CircuitOpenError(self.name, max(0.0, self._retry_at - time.monotonic()))
+        return admitted == 'probe'
+
+    def cancel(self):
+        """Give back a half-open probe admitted by check() whose call was never made."""
+        with self._lock:
+            if self.state == 'half_open' and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def _open(self, now):
+        if self._outage_started is None:
+            self._outage_started = now
+        self.state = 'open'
+        self._retry_at = now + self._current_open_seconds
+        self.trips += 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state == 'half_open':
+                self.state = 'closed'
+                self._outcomes.clear()
+                self._current_open_seconds = self.open_seconds
+                self._outage_started = None
+            self._outcomes.append(False)
+
+    def record_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == 'half_open':
+                self._current_open_seconds = min(self._current_open_seconds * 2, self.max_open_seconds)
+                self._open(now)
+                return
+            self._outcomes.append(True)
+            if (self.state == 'closed' and len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+                self._open(now)
+
+    def is_closed(self):
+        with self._lock:
+            return self.state == 'closed'
+
+    def restart_outage_clock(self):
+        """Give a new run the full max_outage_seconds of patience for an ongoing outage."""
+        with self._lock:
+            if self._outage_started is not None:
+                self._outage_started = time.monotonic()
+
+    def exhausted(self):
+        """True once the provider has been unavailable for longer than max_outage_seconds."""
+        with self._lock:
+            return (self.state != 'closed' and self._outage_started is not None
+                    and time.monotonic() - self._outage_started > self.max_outage_seconds)
+
+    def wait_until_available(self, stop_event):
+        """
+        Block while the circuit is open. Returns True when calls may be tried
+        again, False if stop_event was set or the outage outlasted
+        max_outage_seconds.
+        """
+        while True:
+            if stop_event.is_set() or self.exhausted():
+                return False
+            with self._lock:
+                if self.state == 'open':
+                    wait = self._retry_at - time.monotonic()
+                elif self.state == 'half_open' and self._probes_in_flight >= self.probes:
+                    wait = 0.5  # a probe is running; its outcome decides
+                else:
+                    wait = 0
+            if wait <= 0:
+                return True
+            stop_event.wait(min(wait, 1.0))
+
+    def snapshot(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                'state': self.state,
+                'trips': self.trips,
+                'failure_rate': round(sum(outcomes) / len(outcomes), 3) if outcomes else 0.0,
+                'retry_in_seconds': round(max(0.0, self._retry_at - time.monotonic()), 1) if self.state == 'open' else 0
+            }
+
+
+class RequestHedger:
+    """
+    Run calls through a thread pool; if a call hasn't returned after the
+    `percentile` of recent latencies, fire one duplicate (a hedge) and return
+    whichever succeeds first. Each primary call earns `budget_ratio` hedge
+    tokens (at most `max_tokens` banked) and a hedge spends one, so hedges stay
+    below that share of requests. `can_hedge` is asked before every hedge
+    (e.g. is there spare concurrency, is the provider healthy).
+    """
+
+    def __init__(self, percentile=0.95, budget_ratio=0.05, min_samples=20, window=200,
+                 max_workers=16, max_tokens=10.0, can_hedge=None):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.max_tokens = max_tokens
+        self.can_hedge = can_hedge or (lambda: True)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._tokens = 0.0
+        self._latencies = deque(maxlen=window)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedged-call')
+        self._lock = threading.Lock()
+
+    def hedge_delay(self, work=1.0):
+        """Seconds to wait before hedging a call of this size, or None while still learning."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+            return ordered[index] * work
+
+    def _observe(self, started, work):
+        def callback(future):
+            if future.exception() is None:
+                with self._lock:
+                    self._latencies.append((time.monotonic() - started) / max(work, 1e-9))
+        return callback
+
+    def _submit(self, func, work):
+        future = self._executor.submit(func)
+        future.add_done_callback(self._observe(time.monotonic(), work))
+        return future
+
+    def _spend_token(self):
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            self.hedges += 1
+            return True
+
+    def call(self, func, work=1.0, hedge_func=None):
+        """
+        Run func() (hedged with hedge_func(), func by default, when it is slow)
+        and return its result. Latency is timed from here, so callers should
+        call this once the request is ready to go, not while it still queues.
+        """
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.budget_ratio)
+
+        primary = self._submit(func, work)
+        delay = self.hedge_delay(work)
+        if delay is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.can_hedge() or not self._spend_token():
+            return primary.result()
+
+        hedge = self._submit(hedge_func or func, work)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    # The slower call keeps running; its result is discarded
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_budget': round(self._tokens, 2)
+            }
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+
+def parse_reset_duration(value):
+    """Reset header value in seconds: '2m59.56s', '7.66s', '120ms', '1h2m' or plain seconds. None if unreadable."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or ''.join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class RateLimitPacer:
+    """
+    Schedules calls from the provider's rate-limit headers (GCRA per window).
+
+    After every response, update(headers) reads the remaining requests/tokens
+    and their reset times; the next calls are then spaced reset / remaining
+    apart, so the budget lasts until it refills. Up to `burst` of the time to
+    the reset may be used ahead of that even schedule, so a small run with a
+    large daily budget left is not slowed down. Once less than one typical call
+    is left, a call is scheduled for the reset instead. A retry-after header (429)
+    holds every call until it has passed. `requests_per_minute` adds a fixed
+    per-minute cap for limits the provider doesn't report in headers.
+    """
+
+    def __init__(self, burst=0.1, requests_per_minute=0):
+        self.burst = burst
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+        self._windows = {}
+        self._blocked_until = 0.0
+        self._token_ratio = 1.0
+        self._typical_tokens = 0.0
+        self._lock = threading.Lock()
+        if requests_per_minute:
+            self._windows['per_minute'] = {'interval': 60.0 / requests_per_minute, 'tolerance': 0.0, 'tat': 0.0}
+
+    def update(self, headers, rate_limited=False):
+        """Feed the headers of a response (or of a 429 error's response)."""
+        if headers is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if rate_limited:
+                self.rate_limited += 1
+            retry_after = parse_reset_duration(headers.get('retry-after'))
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+            for kind in ('requests', 'tokens'):
+                remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+                reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                if remaining is None or reset is None:
+                    continue
+                try:
+                    remaining = int(float(remaining))
+                except ValueError:
+                    continue
+                window = self._windows.setdefault(kind, {'tat': 0.0})
+                typical_cost = self._typical_tokens if kind == 'tokens' else 1
+                window['interval'] = reset / max(remaining, typical_cost, 1)
+                window['tolerance'] = reset * self.burst
+                window['remaining'] = remaining
+                window['limit'] = headers.get(f'x-ratelimit-limit-{kind}')
+                if remaining == 0:
+                    window['tat'] = max(window['tat'], now + reset + window['tolerance'])
+
+    def record_usage(self, estimated_tokens, used_tokens):
+        """Correct future token estimates with what a call actually used."""
+        if estimated_tokens and used_tokens:
+            with self._lock:
+                self._token_ratio = 0.8 * self._token_ratio + 0.2 * (used_tokens / estimated_tokens)
+
+    def schedule(self, estimated_tokens=0, max_wait=None):
+        """
+        Book the next call. Returns the seconds to wait before sending it, or
+        None (nothing booked) if that would be longer than max_wait.
+        """
+        now = time.monotonic()
+        with self._lock:
+            costs = {'requests': 1, 'per_minute': 1, 'tokens': estimated_tokens * self._token_ratio}
+            self._typical_tokens = costs['tokens'] if not self._typical_tokens else (
+                0.8 * self._typical_tokens + 0.2 * costs['tokens'])
+            start = max(now, self._blocked_until)
+            for kind, window in self._windows.items():
+                start = max(start, window['tat'] - window['tolerance'])
+
+            delay = start - now
+            if max_wait is not None and delay > max_wait:
+                return None
+            for kind, window in self._windows.items():
+                window['tat'] = max(window['tat'], start) + costs[kind] * window['interval']
+            if delay > 0:
+                self.waits += 1
+                self.wait_seconds += delay
+            return delay
+
+    def exhausted_window(self):
+        """Name of a window the provider reported as empty ('requests' / 'tokens'), if any."""
+        with self._lock:
+            for kind in ('requests', 'tokens'):
+                if self._windows.get(kind, {}).get('remaining') == 0:
+                    return kind
+            return None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 1),
+                'rate_limited': self.rate_limited,
+                'remaining_requests': self._windows.get('requests', {}).get('remaining'),
+                'remaining_tokens': self._windows.get('tokens', {}).get('remaining')
+            }
+
+
+class WeightedFairScheduler:
+    """
+    Hands out turns at a shared resource (the next generation slot, the next
+    send) to several flows (campaigns) in proportion to their weights, by
+    start-time fair queueing. Each waiting turn is tagged with a virtual start
+    time. That is the later of the scheduler's clock and the end of the flow's
+    previous turn, which lasts cost / weight. The lowest tag goes first. A
+    flow with weight 3 gets three turns for every one of a weight-1 flow while
+    both are waiting. A flow that was idle earns no credit, so a campaign that
+    starts late is served right away without starving the others.
+
+    acquire() blocks until the flow's turn comes; release() ends it, and
+    `hold` keeps the resource idle for that many seconds (spacing sends).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.grants = {}
+        self._weights = {}
+        self._registrations = {}
+        self._finish = {}
+        self._virtual_time = 0.0
+        self._waiting = []
+        self._held = False
+        self._free_at = 0.0
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def register(self, flow, weight=1.0):
+        """Declare a running flow; registered weights decide share() (pair with unregister())."""
+        with self._condition:
+            self._weights[flow] = max(float(weight), 1e-6)
+            self._registrations[flow] = self._registrations.get(flow, 0) + 1
+
+    def unregister(self, flow):
+        with self._condition:
+            self._registrations[flow] = self._registrations.get(flow, 1) - 1
+            if self._registrations[flow] <= 0:
+                del self._registrations[flow]
+
+    def share(self, flow, amount):
+        """This flow's weighted part of `amount` (e.g. the remaining quota) among the registered flows."""
+        with self._condition:
+            weights = {key: self._weights[key] for key in self._registrations}
+            if flow not in weights:
+                return amount
+            return int(amount * weights[flow] / sum(weights.values()))
+
+    def acquire(self, flow, weight=None, cost=1.0, stop_event=None):
+        """Block until it is this flow's turn. Returns False if stop_event was set first."""
+        with self._condition:
+            if weight is not None and flow not in self._registrations:
+                self._weights[flow] = max(float(weight), 1e-6)
+            start = max(self._virtual_time, self._finish.get(flow, 0.0))
+            self._finish[flow] = start + cost / self._weights.get(flow, 1.0)
+            self._sequence += 1
+            ticket = (start, self._sequence, flow)
+            heapq.heappush(self._waiting, ticket)
+
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._condition.notify_all()
+                    return False
+                now = time.monotonic()
+                first = self._waiting[0] == ticket and not self._held
+                if first and now >= self._free_at:
+                    heapq.heappop(self._waiting)
+                    self._held = True
+                    self._virtual_time = start
+                    self.grants[flow] = self.grants.get(flow, 0) + 1
+                    return True
+                # Wake up for the end of a hold, and now and then to notice stop_event
+                timeout = self._free_at - now if first else None
+                if stop_event is not None:
+                    timeout = 0.5 if timeout is None else min(timeout, 0.5)
+                self._condition.wait(timeout)
+
+    def release(self, flow, hold=0.0):
+        """End the current turn; the next one starts no sooner than `hold` seconds from now."""
+        with self._condition:
+            self._held = False
+            self._free_at = time.monotonic() + hold
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                'waiting': len(self._waiting),
+                'flows': {flow: self._weights[flow] for flow in self._registrations},
+                'grants': dict(self.grants)
+            }
@@ -0,0 +1,130 @@
+"""
+Near-duplicate detection for generated email bodies (MinHash + LSH banding).
+
+Mailbox providers flag mass-identical content, and with similar profiles the model
+often returns near-identical bodies. Comparing every pair of bodies is quadratic;
+instead each body gets a MinHash signature over its word shingles, and signatures
+are bucketed by LSH bands. Only bodies sharing a bucket are compared, so checking
+a new body costs roughly constant time however many bodies the campaign holds.
+"""
+import re
+import random
+import hashlib
+import threading
+
+# Mersenne prime for the universal hash family
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+PLACEHOLDER_PATTERN = re.compile(r"\[[^\]\n]{1,60}\]")
+
+
+def has_placeholder(text):
+    """True if the body contains template artifacts such as [Recipient's Name]."""
+    return bool(PLACEHOLDER_PATTERN.search(text or ''))
+
+
+def shingles(text, size=5):
+    """Set of hashed word n-grams of the normalized text."""
+    words = re.findall(r"[a-z0-9']+", (text or '').lower())
+    if len(words) < size:
+        grams = [' '.join(words)] if words else []
+    else:
+        grams = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return {int.from_bytes(hashlib.blake2b(g.encode('utf-8'), digest_size=8).digest(), 'big') for g in grams}
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Pick (bands, rows) with bands * rows == num_perm so that the LSH S-curve
+    threshold (1/bands) ** (1/rows) is as close as possible to `threshold`.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash signatures with a fixed, seeded family of hash permutations."""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, text):
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return (_MAX_HASH,) * self.num_perm
+        return tuple(
+            min(((a * x + b) % _PRIME) & _MAX_HASH for x in shingle_set)
+            for a, b in self.params
+        )
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity: share of equal signature positions."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """Thread-safe LSH index of body signatures."""
+
+    def __init__(self, threshold=0.7, num_perm=128, seed=1):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        self.buckets = [dict() for _ in range(self.bands)]
+        self.signatures = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, hash(signature[start:start + self.rows])
+
+    def _best_match(self, signature, exclude=()):
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+        candidates.difference_update(exclude)
+
+        best = None
+        for candidate in candidates:
+            similarity = estimate_similarity(signature, self.signatures[candidate])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def _add(self, key, signature):
+        self.signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self.buckets[band].setdefault(band_key, []).append(key)
+
+    def add(self, key, text):
+        """Index a body unconditionally (e.g. bodies already sent)."""
+        signature = self.hasher.signature(text)
+        with self._lock:
+            self._add(key, signature)
+
+    def check_and_add(self, key, text, ignore=()):
+        """
+        Return (matching key, similarity) if the body is a near-duplicate of a
+        body indexed under another key (keys in `ignore` don't count); otherwise
+        index it and return None.
+        """
+        signature = self.hasher.signature(text)
+        with self._lock:
+            match = self._best_match(signature, exclude={key, *ignore})
+            if match is None:
+                self._add(key, signature)
+            return match
+
+    def __len__(self):
+        return len(self.signatures)
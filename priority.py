@@ -0,0 +1,73 @@
+r"""
+Value-based recipient prioritization.
+
+When the Resend/Groq quota can't cover the whole list before the event, the most
+valuable recipients should be generated and sent first. Each profile is scored
+with configurable regex rules on its fields; the pipeline feeds workers from a
+priority queue ordered by that score.
+
+Rules are read from PRIORITY_RULES_PATH (JSON list), e.g.:
+
+    [
+        {"field": "job_title", "pattern": "\\b(ceo|cto|founder)\\b", "score": 100},
+        {"field": "industry", "pattern": "fintech|banking", "score": 20},
+        {"field": "goal", "pattern": "partner|invest", "score": 10}
+    ]
+
+Patterns are case-insensitive; a profile's score is the sum of all matching rules.
+"""
+import os
+import re
+import json
+import logging
+
+PRIORITY_RULES_PATH = os.getenv("PRIORITY_RULES_PATH", "data/priority_rules.json")
+
+# Used when no rules file exists: C-level first, then VPs/directors, then managers
+DEFAULT_PRIORITY_RULES = [
+    {"field": "job_title", "pattern": r"\b(ceo|cto|cfo|coo|cmo|cio|ciso|chief|founder|co-founder|president|owner)\b", "score": 100},
+    {"field": "job_title", "pattern": r"\b(vp|vice president|director|head of|partner)\b", "score": 60},
+    {"field": "job_title", "pattern": r"\b(manager|lead|principal)\b", "score": 30},
+    {"field": "goal", "pattern": r"partner|invest|hir(e|ing)|network", "score": 10},
+]
+
+
+def load_priority_rules(path=None):
+    """Load and compile scoring rules. Falls back to DEFAULT_PRIORITY_RULES."""
+    path = path or PRIORITY_RULES_PATH
+    rules = DEFAULT_PRIORITY_RULES
+
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        logging.info(f"Loaded {len(rules)} priority rules from {path}")
+
+    compiled = []
+    for rule in rules:
+        try:
+            compiled.append((rule['field'], re.compile(rule['pattern'], re.IGNORECASE), float(rule['score'])))
+        except (KeyError, ValueError, re.error) as e:
+            raise ValueError(f"Invalid priority rule {rule}: {e}")
+    return compiled
+
+
+def score_profile(profile, rules):
+    """Sum the scores of every rule matching this profile."""
+    score = 0.0
+    for field, pattern, points in rules:
+        value = profile.get(field)
+        if value is None or value != value:  # missing or NaN
+            continue
+        if pattern.search(str(value)):
+            score += points
+    return score
+
+
+def prioritize(profiles, rules):
+    """
+    Order profiles by descending score (stable for equal scores, so CSV order
+    breaks ties). Returns a list of (score, profile).
+    """
+    scored = [(score_profile(profile, rules), profile) for profile in profiles]
+    scored.sort(key=lambda item: -item[0])
+    return scored
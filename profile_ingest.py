@@ -0,0 +1,228 @@
+"""
+Profile ingestion from many files and formats.
+
+Profile lists arrive as CSV exports, JSON/JSONL dumps (one profile, a list, or
+{"profiles": [...]}) and Parquet files, with differing column names (`name` vs
+`full_name`, `focus_area` vs `interests`, ...). This module expands a list of
+sources (files, directories, glob patterns), parses the files in parallel worker
+processes, maps every schema onto the campaign columns and hands the parsed
+frames back in source order as soon as each one is ready.
+
+Usage:
+    python profile_ingest.py data/ "exports/*.jsonl" extra/vip.parquet
+"""
+import os
+import re
+import sys
+import glob
+import json
+import logging
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+PROFILE_COLUMNS = ['full_name', 'email', 'company', 'job_title', 'industry', 'goal', 'interests', 'timezone']
+# Every column the invitation prompt relies on; only timezone may be absent
+REQUIRED_COLUMNS = ['full_name', 'email', 'company', 'job_title', 'industry', 'goal', 'interests']
+SUPPORTED_EXTENSIONS = ('.csv', '.json', '.jsonl', '.ndjson', '.parquet')
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Alternative column names found in older scripts and CRM exports (after normalization)
+COLUMN_ALIASES = {
+    'full_name': ['name', 'fullname', 'contact_name', 'display_name'],
+    'email': ['e_mail', 'email_address', 'mail', 'work_email'],
+    'company': ['organization', 'organisation', 'company_name', 'employer'],
+    'job_title': ['title', 'role', 'position', 'jobtitle'],
+    'industry': ['sector', 'industries'],
+    'goal': ['goals', 'objective', 'objectives'],
+    'interests': ['focus_area', 'focus', 'interest', 'topics'],
+    'timezone': ['tz', 'time_zone'],
+}
+
+
+def normalize_column(name):
+    """'Focus Area' -> 'focus_area', 'E-mail' -> 'e_mail'."""
+    return re.sub(r"[^a-z0-9]+", '_', str(name).strip().lower()).strip('_')
+
+
+def _canonical_column(name):
+    column = normalize_column(name)
+    for canonical, aliases in COLUMN_ALIASES.items():
+        if column in aliases:
+            return canonical
+    return column
+
+
+def normalize_profiles(df, source=''):
+    """
+    Map a parsed frame onto PROFILE_COLUMNS. Columns that resolve to the same
+    field (e.g. `name` and `full_name`) are merged, first non-empty value wins.
+    A frame missing any of REQUIRED_COLUMNS is rejected; a missing timezone
+    column is filled with empty strings.
+    """
+    columns = {}
+    for original in df.columns:
+        column = _canonical_column(original)
+        if column not in PROFILE_COLUMNS and column not in ('first_name', 'last_name'):
+            continue
+        values = df[original].astype(object).where(df[original].notna(), '').astype(str).str.strip()
+        columns[column] = values if column not in columns else columns[column].where(columns[column] != '', values)
+
+    if 'full_name' not in columns and 'first_name' in columns and 'last_name' in columns:
+        columns['full_name'] = (columns['first_name'] + ' ' + columns['last_name']).str.strip()
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"{source}: missing required columns {missing}")
+
+    return pd.DataFrame({
+        column: columns.get(column, pd.Series('', index=df.index))
+        for column in PROFILE_COLUMNS
+    })
+
+
+def read_json_file(path):
+    """A JSON file may hold one profile, a list of profiles, or {"profiles": [...]}."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('profiles', [data])
+    return pd.DataFrame(data)
+
+
+def read_profile_file(path):
+    """Parse one file into a normalized frame. Runs in a worker process."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    elif extension in ('.jsonl', '.ndjson'):
+        df = pd.read_json(path, lines=True, dtype=False)
+    elif extension == '.json':
+        df = read_json_file(path)
+    elif extension == '.parquet':
+        df = pd.read_parquet(path)
+    else:
+        raise ValueError(f"{path}: unsupported file type")
+    return normalize_profiles(df, path)
+
+
+def expand_sources(sources):
+    """
+    Resolve files, directories (supported files directly inside) and glob
+    patterns into an ordered, duplicate-free list of files. Comma-separated
+    strings are split.
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+
+    files = []
+    for source in sources:
+        for entry in str(source).split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            if os.path.isdir(entry):
+                matches = sorted(os.path.join(entry, name) for name in os.listdir(entry))
+            elif glob.has_magic(entry):
+                matches = sorted(glob.glob(entry))
+            else:
+                matches = [entry]
+
+            for path in matches:
+                if os.path.isdir(path) or not path.lower().endswith(SUPPORTED_EXTENSIONS):
+                    if entry == path:
+                        raise ValueError(f"{path}: unsupported file type")
+                    continue
+                if path not in files:
+                    files.append(path)
+    return files
+
+
+def _read_or_error(path):
+    try:
+        return path, read_profile_file(path), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+
+
+def iter_profile_frames(sources, workers=None):
+    """
+    Yield (path, normalized frame) per file, in source order. Files are parsed
+    in parallel worker processes; unreadable files are logged and skipped.
+    """
+    files = expand_sources(sources)
+    if not files:
+        raise FileNotFoundError(f"No profile files found in {sources}")
+
+    workers = min(workers or INGEST_WORKERS, len(files))
+    if workers <= 1:
+        results = map(_read_or_error, files)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(_read_or_error, files)
+
+    try:
+        for path, df, error in results:
+            if error:
+                logging.error(f"Skipping profile file {path}: {error}")
+                continue
+            logging.info(f"Read {len(df)} profiles from {path}")
+            yield path, df
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def combine_profile_frames(frames_by_source):
+    """
+    Merge (source, normalized frame) pairs into one frame of PROFILE_COLUMNS. A
+    recipient listed in several sources (or twice in one) is kept once, from
+    the first source. Rows without a name are dropped (they count towards the
+    total, like rows with an invalid email). Returns (profiles, total unique rows).
+    """
+    frames = []
+    seen = set()
+    total = 0
+
+    for path, df in frames_by_source:
+        keys = df['email'].str.lower()
+        duplicate = keys.duplicated() | keys.isin(seen)
+        if duplicate.any():
+            logging.warning(f"{path}: {int(duplicate.sum())} duplicate recipients ignored")
+        seen.update(keys[~duplicate])
+        total += int((~duplicate).sum())
+
+        unnamed = ~duplicate & (df['full_name'] == '')
+        if unnamed.any():
+            logging.warning(f"{path}: {int(unnamed.sum())} profiles without a name skipped")
+        frames.append(df[~duplicate & ~unnamed])
+
+    if not frames:
+        return pd.DataFrame(columns=PROFILE_COLUMNS), total
+    return pd.concat(frames, ignore_index=True), total
+
+
+def load_profile_sources(sources, workers=None):
+    """Read all sources (parsed in parallel) into one frame; see combine_profile_frames."""
+    return combine_profile_frames(iter_profile_frames(sources, workers))
+
+
+def load_profile_records(records, source='request'):
+    """Profiles given as a list of dicts (any supported column names); see combine_profile_frames."""
+    return combine_profile_frames([(source, normalize_profiles(pd.DataFrame(list(records)), source))])
+
+
+def main(argv):
+    if not argv:
+        print(__doc__)
+        return 1
+    profiles, total = load_profile_sources(argv)
+    print(f"{total} unique profiles from {len(expand_sources(argv))} files")
+    print(profiles.head(10).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,162 @@
+"""
+Live campaign progress: measured throughput, ETA and per-stage queue depth.
+
+ProgressTracker is fed by the pipeline as recipients move through generation and
+sending. Its snapshot is served as JSON on a small local HTTP endpoint
+(GET /status) and printed as a compact terminal status line.
+"""
+import json
+import time
+import logging
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Throughput is measured over this rolling window
+RATE_WINDOW_SECONDS = 60
+
+
+class ProgressTracker:
+    """Thread-safe progress counters with a rolling emails/min rate."""
+
+    def __init__(self, total, window=RATE_WINDOW_SECONDS):
+        self.total = total
+        self.window = window
+        self.started = time.time()
+        self.counts = {'generated': 0, 'sent': 0, 'scheduled': 0, 'failed': 0, 'skipped': 0}
+        self.stages = {}
+        self.watches = {}
+        self.ceilings = {}
+        self._completions = deque()
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        """Count one 'generated', 'sent', 'scheduled', 'failed' or 'skipped' event."""
+        now = time.time()
+        with self._lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+            if outcome in ('sent', 'scheduled', 'failed'):
+                self._completions.append(now)
+
+    def add_to_stage(self, stage, delta):
+        """Adjust the number of recipients currently waiting in/at a stage."""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0) + delta
+
+    def watch(self, name, func):
+        """Report func() under `name` in every snapshot (queue sizes, limiter state...)."""
+        with self._lock:
+            self.watches[name] = func
+
+    def set_ceiling(self, name, per_minute):
+        """Declare a rate-limit ceiling (emails/min) that caps the ETA estimate."""
+        with self._lock:
+            if per_minute:
+                self.ceilings[name] = per_minute
+            else:
+                self.ceilings.pop(name, None)
+
+    def _rate_per_minute(self, now):
+        while self._completions and self._completions[0] < now - self.window:
+            self._completions.popleft()
+        elapsed = min(self.window, now - self.started)
+        if elapsed <= 0:
+            return 0.0
+        return len(self._completions) * 60.0 / elapsed
+
+    def snapshot(self):
+        """Current progress as a JSON-serializable dict."""
+        now = time.time()
+        with self._lock:
+            rate = self._rate_per_minute(now)
+            counts = dict(self.counts)
+            stages = dict(self.stages)
+            watches = dict(self.watches)
+            ceilings = dict(self.ceilings)
+
+        done = counts['sent'] + counts['scheduled'] + counts['failed'] + counts['skipped']
+        remaining = max(self.total - done, 0)
+
+        # The ETA can't beat the tightest rate limit, however fast the last minute was
+        effective_rate = rate
+        if ceilings:
+            limit = min(ceilings.values())
+            effective_rate = min(rate, limit) if rate else limit
+
+        eta = remaining * 60.0 / effective_rate if effective_rate else None
+
+        gauges = {}
+        for name, func in watches.items():
+            try:
+                gauges[name] = func()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+
+        return {
+            'total': self.total,
+            'done': done,
+            'remaining': remaining,
+            'counts': counts,
+            'elapsed_seconds': round(now - self.started, 1),
+            'emails_per_minute': round(rate, 2),
+            'rate_ceilings_per_minute': ceilings,
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'stages': stages,
+            'gauges': gauges
+        }
+
+    def status_line(self):
+        """Compact one-line summary for the terminal."""
+        snap = self.snapshot()
+        eta = snap['eta_seconds']
+        eta_text = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else '--:--:--'
+        stages = ' '.join(f"{name}={depth}" for name, depth in sorted(snap['stages'].items()))
+        queues = ' '.join(f"{name}={value}" for name, value in sorted(snap['gauges'].items()))
+        scheduled = f"scheduled={snap['counts']['scheduled']} " if snap['counts']['scheduled'] else ''
+        return (
+            f"[{snap['done']}/{snap['total']}] sent={snap['counts']['sent']} {scheduled}failed={snap['counts']['failed']} "
+            f"{snap['emails_per_minute']:.1f}/min ETA {eta_text} | {stages} {queues}"
+        ).rstrip()
+
+
+def start_status_server(tracker, port, host='127.0.0.1'):
+    """
+    Serve tracker snapshots as JSON on http://host:port/status in a daemon thread.
+    Returns the server (call shutdown() when the run ends), or None if the port is taken.
+    """
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/status'):
+                self.send_error(404)
+                return
+            payload = json.dumps(tracker.snapshot()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), StatusHandler)
+    except OSError as e:
+        logging.warning(f"Status endpoint disabled - could not bind {host}:{port}: {e}")
+        return None
+
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Progress status available at http://{host}:{port}/status")
+    return server
+
+
+def start_status_printer(tracker, interval, stop_event):
+    """Print the status line every `interval` seconds until stop_event is set."""
+    def loop():
+        while not stop_event.wait(interval):
+            print(tracker.status_line(), flush=True)
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,208 @@
+"""
+Persistent provider quota ledger shared by every campaign process.
+
+Groq limits requests per day (14,400 on the free tier) and Resend limits sends per
+day and per month. Separate runs, often in parallel processes, know nothing
+about each other's usage, so each one can run into a hard limit mid-campaign.
+Every generation request and every send is recorded here, in a SQLite database,
+with a timestamp. Before a call, the caller reserves a unit inside an IMMEDIATE
+transaction, so concurrent processes can never reserve more than the remaining
+budget together. After the call the unit is confirmed, or released if the call
+never went out. Reservations of a crashed process expire after
+QUOTA_RESERVATION_TTL seconds. Windows are UTC calendar days and months.
+
+Usage:
+    python quota_ledger.py          # show today's and this month's usage per provider
+    python quota_ledger.py prune    # drop entries older than two months
+"""
+import os
+import sys
+import time
+import sqlite3
+import logging
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUOTA_DB_PATH = os.getenv("QUOTA_DB_PATH", "data/quota.db")
+QUOTA_RESERVATION_TTL = float(os.getenv("QUOTA_RESERVATION_TTL", "600"))
+
+# Limits per provider and window (0 = unlimited)
+QUOTA_LIMITS = {
+    'groq': {
+        'day': int(os.getenv("GROQ_DAILY_REQUEST_LIMIT", "14400")),
+        'month': int(os.getenv("GROQ_MONTHLY_REQUEST_LIMIT", "0")),
+    },
+    'resend': {
+        'day': int(os.getenv("RESEND_DAILY_SEND_LIMIT", "0")),
+        'month': int(os.getenv("RESEND_MONTHLY_SEND_LIMIT", "3000")),
+    },
+}
+
+
+class QuotaExhaustedError(Exception):
+    """Raised when a provider's daily or monthly budget has no units left."""
+
+    def __init__(self, provider, window, limit=None):
+        period = {'day': 'daily', 'month': 'monthly'}.get(window, window)
+        size = f" of {limit}" if limit is not None else ""
+        super().__init__(f"{provider} {period} quota{size} exhausted")
+        self.provider = provider
+        self.window = window
+        self.limit = limit
+
+    def __reduce__(self):
+        # Rebuild from the constructor arguments, so the error survives pickling (send queue spill)
+        return (type(self), (self.provider, self.window, self.limit))
+
+
+def connect(path=None):
+    """Open the ledger database, creating it on first use."""
+    path = path or QUOTA_DB_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            provider TEXT NOT NULL,
+            units INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            day TEXT NOT NULL,
+            month TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL,
+            owner TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS usage_provider_day ON usage (provider, day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS usage_provider_month ON usage (provider, month)")
+    return conn
+
+
+def _window_keys(now):
+    moment = datetime.fromtimestamp(now, timezone.utc)
+    return {'day': moment.strftime('%Y-%m-%d'), 'month': moment.strftime('%Y-%m')}
+
+
+def _used(conn, provider, now):
+    """Units confirmed plus live reservations, per window."""
+    keys = _window_keys(now)
+    used = {}
+    for window, key in keys.items():
+        (units,) = conn.execute(
+            f"SELECT COALESCE(SUM(units), 0) FROM usage WHERE provider = ? AND {window} = ? "
+            "AND (status = 'used' OR (status = 'reserved' AND expires_at > ?))",
+            (provider, key, now)
+        ).fetchone()
+        used[window] = units
+    return used
+
+
+def has_quota_limits(provider):
+    """True if any window of this provider has a limit configured."""
+    return any(QUOTA_LIMITS.get(provider, {}).values())
+
+
+def reserve_quota(provider, units=1, path=None):
+    """
+    Reserve units before calling the provider. Returns a reservation id (None
+    for providers without limits). Raises QuotaExhaustedError when any window
+    would be exceeded.
+    """
+    if not has_quota_limits(provider):
+        return None
+
+    now = time.time()
+    keys = _window_keys(now)
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            used = _used(conn, provider, now)
+            for window, limit in QUOTA_LIMITS[provider].items():
+                if limit and used[window] + units > limit:
+                    raise QuotaExhaustedError(provider, window, limit)
+            cursor = conn.execute(
+                "INSERT INTO usage (provider, units, status, day, month, created_at, expires_at, owner) "
+                "VALUES (?, ?, 'reserved', ?, ?, ?, ?, ?)",
+                (provider, units, keys['day'], keys['month'], now, now + QUOTA_RESERVATION_TTL, str(os.getpid()))
+            )
+            conn.execute("COMMIT")
+            return cursor.lastrowid
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def confirm_quota(reservation_id, path=None):
+    """Mark a reservation as used (the call reached the provider)."""
+    if reservation_id is None:
+        return
+    conn = connect(path)
+    try:
+        conn.execute("UPDATE usage SET status = 'used', expires_at = NULL WHERE id = ?", (reservation_id,))
+    finally:
+        conn.close()
+
+
+def release_quota(reservation_id, path=None):
+    """Give a reservation back (the call never went out)."""
+    if reservation_id is None:
+        return
+    conn = connect(path)
+    try:
+        conn.execute("DELETE FROM usage WHERE id = ? AND status = 'reserved'", (reservation_id,))
+    finally:
+        conn.close()
+
+
+def remaining_quota(provider, path=None):
+    """Units left in the tightest window, or None for providers without limits."""
+    if not has_quota_limits(provider):
+        return None
+
+    conn = connect(path)
+    try:
+        used = _used(conn, provider, time.time())
+    finally:
+        conn.close()
+
+    return min(
+        max(0, limit - used[window])
+        for window, limit in QUOTA_LIMITS[provider].items()
+        if limit
+    )
+
+
+def prune_quota_ledger(keep_months=2, path=None):
+    """Drop ledger rows older than the last `keep_months` months."""
+    cutoff = time.time() - keep_months * 31 * 86400
+    conn = connect(path)
+    try:
+        conn.execute("DELETE FROM usage WHERE created_at < ?", (cutoff,))
+    finally:
+        conn.close()
+
+
+def print_usage(path=None):
+    conn = connect(path)
+    try:
+        print("\nProvider quota usage (UTC windows)")
+        for provider, limits in QUOTA_LIMITS.items():
+            used = _used(conn, provider, time.time())
+            for window, limit in limits.items():
+                print(f"  {provider:<8} {window:<6} {used[window]:>7} used / {limit or 'unlimited'}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if sys.argv[1:] == ['prune']:
+        prune_quota_ledger()
+    print_usage()
@@ -0,0 +1,465 @@
+"""
+Durable scheduled sends.
+
+With SEND_AT set, a campaign still generates every message right away, but it
+stores each one here with its delivery time instead of sending it. SEND_AT is
+a time of day ("09:00", the next occurrence) or a date and time
+("2026-03-10 09:00"). It is read in the recipient's own time zone (the
+optional `timezone` profile column, an IANA name such as Europe/Paris) or in
+SEND_TIMEZONE. SEND_STAGGER_MINUTES spreads the messages evenly over a window
+that starts at that time. A slot that would fall on or after EVENT_DATE is
+sent straight away instead.
+
+Messages live in SQLite with a partial index on send_at, covering only the
+pending rows. The dispatcher claims the due rows in small batches, then asks
+the index for the next send time and sleeps until then. A new schedule from
+the same process wakes it early. Memory does not grow with the number of
+pending messages, and nothing is polled while messages are waiting. Messages
+scheduled by another process are picked up within SCHEDULE_RECHECK_SECONDS.
+A claim left behind by a crashed dispatcher expires after
+SCHEDULE_CLAIM_TTL seconds, and the messages it held go out again.
+
+Usage:
+    python send_scheduler.py stats            # pending messages and the next send times
+    python send_scheduler.py run              # dispatch due messages until SIGINT/SIGTERM
+    python send_scheduler.py cancel EMAIL     # drop the pending messages to one address ('all' for every one)
+    python send_scheduler.py prune [days]     # drop finished rows older than `days` (default 30)
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCHEDULE_DB_PATH = os.getenv("SCHEDULE_DB_PATH", "data/scheduled_sends.db")
+# Delivery time: "HH:MM" (next occurrence) or "YYYY-MM-DD HH:MM"; empty sends immediately
+SEND_AT = os.getenv("SEND_AT", "").strip()
+# IANA zone for recipients without a timezone column (empty = this machine's zone)
+SEND_TIMEZONE = os.getenv("SEND_TIMEZONE", "").strip()
+SEND_STAGGER_MINUTES = float(os.getenv("SEND_STAGGER_MINUTES", "0"))
+SCHEDULE_BATCH_SIZE = int(os.getenv("SCHEDULE_BATCH_SIZE", "50"))
+# Upper bound on the dispatcher's sleep, for messages scheduled by other processes
+SCHEDULE_RECHECK_SECONDS = float(os.getenv("SCHEDULE_RECHECK_SECONDS", "300"))
+SCHEDULE_CLAIM_TTL = float(os.getenv("SCHEDULE_CLAIM_TTL", "1800"))
+
+EVENT_DATE_FORMATS = ('%B %d, %Y', '%b %d, %Y', '%d %B %Y', '%d %b %Y', '%Y-%m-%d')
+
+# Set whenever this process schedules messages, so an idle dispatcher re-reads the next send time
+_schedule_changed = threading.Event()
+
+
+class RetryLater(Exception):
+    """Raised by a dispatch callback to hand a message back and pause the dispatcher for `delay` seconds."""
+
+    def __init__(self, delay, reason):
+        super().__init__(reason)
+        self.delay = delay
+
+
+# -- send times --------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def _zone(name):
+    """ZoneInfo for an IANA name. Falls back to SEND_TIMEZONE; None means local time."""
+    name = (name or '').strip() or SEND_TIMEZONE
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logging.warning(f"Unknown time zone '{name}' - using {SEND_TIMEZONE or 'local time'}")
+        return _zone(None) if name != SEND_TIMEZONE else None
+
+
+def _now_in(zone):
+    return datetime.now(zone) if zone is not None else datetime.now()
+
+
+def parse_send_at(spec, zone=None, now=None):
+    """
+    Unix time of SEND_AT in `zone`. "HH:MM" is the next occurrence of that
+    time; a date and time is taken as is (an explicit UTC offset wins over the zone).
+    """
+    current = now or _now_in(zone)
+    try:
+        clock = datetime.strptime(spec, '%H:%M')
+    except ValueError:
+        moment = datetime.fromisoformat(spec)
+        if moment.tzinfo is None and zone is not None:
+            moment = moment.replace(tzinfo=zone)
+        return moment.timestamp()
+
+    moment = current.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+    if moment <= current:
+        moment += timedelta(days=1)
+    return moment.timestamp()
+
+
+def parse_event_date(value, zone=None):
+    """Unix time at which EVENT_DATE starts in `zone`, or None if it cannot be read."""
+    if not value:
+        return None
+    for fmt in EVENT_DATE_FORMATS:
+        try:
+            day = datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+        return (day.replace(tzinfo=zone) if zone is not None else day).timestamp()
+    return None
+
+
+def scheduled_send_time(timezone_name, index, count, event_date=None, spec=None, stagger_minutes=None):
+    """
+    Delivery time of message `index` of `count` for a recipient in `timezone_name`,
+    or None to send now (no SEND_AT, or the slot would be too late for the event).
+    """
+    spec = SEND_AT if spec is None else spec
+    if not spec:
+        return None
+    stagger_minutes = SEND_STAGGER_MINUTES if stagger_minutes is None else stagger_minutes
+
+    zone = _zone(timezone_name)
+    send_at = parse_send_at(spec, zone)
+    if count > 1:
+        send_at += stagger_minutes * 60 * index / count
+
+    event_start = parse_event_date(event_date, zone)
+    if event_start is not None and send_at >= event_start:
+        return None
+    return send_at if send_at > time.time() else None
+
+
+def validate_send_at(spec=None):
+    """Raise ValueError early for a SEND_AT or SEND_TIMEZONE that cannot be used."""
+    spec = SEND_AT if spec is None else spec
+    if SEND_TIMEZONE:
+        try:
+            ZoneInfo(SEND_TIMEZONE)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown SEND_TIMEZONE '{SEND_TIMEZONE}'")
+    if spec:
+        try:
+            parse_send_at(spec)
+        except ValueError:
+            raise ValueError(f"Invalid SEND_AT '{spec}' (expected HH:MM or YYYY-MM-DD HH:MM)")
+
+
+# -- store -------------------------------------------------------------------
+
+def connect(path=None):
+    """Open the schedule database, creating it on first use."""
+    path = path or SCHEDULE_DB_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scheduled_sends (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            event TEXT,
+            send_at REAL NOT NULL,
+            subject TEXT NOT NULL,
+            html_body TEXT NOT NULL,
+            plain_body TEXT NOT NULL,
+            record TEXT,
+            campaign TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            claimed_at REAL,
+            finished_at REAL,
+            error TEXT
+        )
+    """)
+    # Schedules created before campaigns were stored per message
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(scheduled_sends)")}
+    if 'campaign' not in columns:
+        conn.execute("ALTER TABLE scheduled_sends ADD COLUMN campaign TEXT")
+    # Only pending rows are indexed: the index stays the size of the backlog, not of the history
+    conn.execute("CREATE INDEX IF NOT EXISTS scheduled_due ON scheduled_sends (send_at) WHERE status = 'pending'")
+    conn.execute("CREATE INDEX IF NOT EXISTS scheduled_claimed ON scheduled_sends (claimed_at) WHERE status = 'sending'")
+    conn.execute("CREATE INDEX IF NOT EXISTS scheduled_email ON scheduled_sends (email, status)")
+    return conn
+
+
+def schedule_messages(messages, path=None):
+    """
+    Store messages for later delivery in one transaction. messages: dicts with
+    email, event, send_at (Unix time), subject, html_body, plain_body and
+    optionally record (the message store entry written once it is sent) and
+    campaign (CampaignConfig.to_dict(): sender and unsubscribe link).
+    """
+    rows = [
+        (m['email'].strip().lower(), m.get('event'), m['send_at'], m['subject'], m['html_body'], m['plain_body'],
+         json.dumps(m['record'], default=str) if m.get('record') is not None else None,
+         json.dumps(m['campaign']) if m.get('campaign') is not None else None)
+        for m in messages
+    ]
+    if not rows:
+        return 0
+
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT INTO scheduled_sends (email, event, send_at, subject, html_body, plain_body, record, campaign) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    _schedule_changed.set()
+    return len(rows)
+
+
+def claim_due(limit=None, now=None, path=None):
+    """
+    Mark up to `limit` due messages as being sent and return them (oldest first).
+    Expired claims of a crashed dispatcher are returned to the queue first.
+    """
+    now = now or time.time()
+    conn = connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE scheduled_sends SET status = 'pending', claimed_at = NULL "
+                "WHERE status = 'sending' AND claimed_at < ?",
+                (now - SCHEDULE_CLAIM_TTL,)
+            )
+            rows = conn.execute(
+                "SELECT * FROM scheduled_sends WHERE status = 'pending' AND send_at <= ? ORDER BY send_at LIMIT ?",
+                (now, limit or SCHEDULE_BATCH_SIZE)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE scheduled_sends SET status = 'sending', claimed_at = ? WHERE id = ?",
+                [(now, row['id']) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+    messages = []
+    for row in rows:
+        message = dict(row)
+        message['record'] = json.loads(message['record']) if message['record'] else None
+        message['campaign'] = json.loads(message['campaign']) if message['campaign'] else None
+        messages.append(message)
+    return messages
+
+
+def finish_message(message_id, status, error=None, path=None):
+    """Record the outcome of a claimed message ('sent', 'failed' or 'skipped')."""
+    conn = connect(path)
+    try:
+        conn.execute(
+            "UPDATE scheduled_sends SET status = ?, finished_at = ?, error = ?, attempts = attempts + 1, "
+            "claimed_at = NULL WHERE id = ?",
+            (status, time.time(), error, message_id)
+        )
+    finally:
+        conn.close()
+
+
+def release_messages(message_ids, path=None):
+    """Hand claimed messages back to the queue unchanged."""
+    if not message_ids:
+        return
+    conn = connect(path)
+    try:
+        conn.executemany(
+            "UPDATE scheduled_sends SET status = 'pending', claimed_at = NULL WHERE id = ? AND status = 'sending'",
+            [(message_id,) for message_id in message_ids]
+        )
+    finally:
+        conn.close()
+
+
+def next_send_time(path=None):
+    """Send time of the earliest pending message (one index lookup), or None."""
+    conn = connect(path)
+    try:
+        (send_at,) = conn.execute("SELECT MIN(send_at) FROM scheduled_sends WHERE status = 'pending'").fetchone()
+    finally:
+        conn.close()
+    return send_at
+
+
+def scheduled_recipients(event=None, path=None):
+    """Addresses with a message for `event` still waiting to go out."""
+    path = path or SCHEDULE_DB_PATH
+    if not os.path.exists(path):
+        return set()
+    conn = connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT DISTINCT email FROM scheduled_sends WHERE status IN ('pending', 'sending') AND event IS ?",
+            (event,)
+        )
+        return {email for (email,) in rows}
+    finally:
+        conn.close()
+
+
+def cancel_scheduled(email=None, path=None):
+    """Cancel the pending messages to one address (all of them when email is None). Returns the count."""
+    conn = connect(path)
+    try:
+        if email is None:
+            cursor = conn.execute("UPDATE scheduled_sends SET status = 'cancelled' WHERE status = 'pending'")
+        else:
+            cursor = conn.execute(
+                "UPDATE scheduled_sends SET status = 'cancelled' WHERE email = ? AND status = 'pending'",
+                (email.strip().lower(),)
+            )
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def prune_schedule(days=30, path=None):
+    """Drop finished rows older than `days`. Returns rows removed."""
+    conn = connect(path)
+    try:
+        return conn.execute(
+            "DELETE FROM scheduled_sends WHERE status IN ('sent', 'failed', 'skipped', 'cancelled') "
+            "AND COALESCE(finished_at, send_at) < ?",
+            (time.time() - days * 86400,)
+        ).rowcount
+    finally:
+        conn.close()
+
+
+def schedule_counts(path=None):
+    """{status: count}."""
+    conn = connect(path)
+    try:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM scheduled_sends GROUP BY status").fetchall())
+    finally:
+        conn.close()
+
+
+# -- dispatcher --------------------------------------------------------------
+
+class ScheduledDispatcher:
+    """
+    Sends scheduled messages as they fall due. `send(message)` delivers one
+    message and returns its outcome ('sent', 'failed' or 'skipped'), or raises
+    RetryLater to put it back and pause (provider quota spent, circuit open).
+    Messages are sent one at a time, `interval` seconds apart.
+    """
+
+    def __init__(self, send, interval=0.0, batch_size=None, path=None):
+        self.send = send
+        self.interval = interval
+        self.batch_size = batch_size or SCHEDULE_BATCH_SIZE
+        self.path = path
+        self.counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def stop(self, timeout=None):
+        """Stop after the message being sent; wait up to `timeout` seconds for the thread."""
+        self._stop.set()
+        _schedule_changed.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _sleep(self, seconds):
+        _schedule_changed.wait(seconds)
+        _schedule_changed.clear()
+
+    def _deliver(self, batch):
+        for position, message in enumerate(batch):
+            if self._stop.is_set():
+                release_messages([m['id'] for m in batch[position:]], self.path)
+                return
+            try:
+                outcome = self.send(message)
+            except RetryLater as e:
+                release_messages([m['id'] for m in batch[position:]], self.path)
+                logging.warning(f"Scheduled sends paused for {e.delay:.0f}s: {e}")
+                self._stop.wait(e.delay)
+                return
+            except Exception as e:
+                logging.error(f"Scheduled send to {message['email']} failed: {e}")
+                outcome = 'failed'
+                finish_message(message['id'], outcome, str(e)[:500], self.path)
+                self.counts[outcome] += 1
+            else:
+                finish_message(message['id'], outcome, None, self.path)
+                self.counts[outcome] = self.counts.get(outcome, 0) + 1
+            if self.interval and outcome == 'sent':
+                self._stop.wait(self.interval)
+
+    def run(self):
+        """Dispatch until stop() is called."""
+        logging.info("Scheduled send dispatcher started")
+        while not self._stop.is_set():
+            batch = claim_due(self.batch_size, path=self.path)
+            if batch:
+                self._deliver(batch)
+                continue
+
+            next_at = next_send_time(self.path)
+            wait = SCHEDULE_RECHECK_SECONDS if next_at is None else min(max(0.0, next_at - time.time()), SCHEDULE_RECHECK_SECONDS)
+            if next_at is not None and wait > 60:
+                logging.info(f"Next scheduled send at {datetime.fromtimestamp(next_at).isoformat(timespec='seconds')}")
+            self._sleep(wait)
+        logging.info(f"Scheduled send dispatcher stopped ({self.counts})")
+
+    def start(self):
+        """Run the dispatcher in a background thread. Returns self."""
+        self._thread = threading.Thread(target=self.run, name='scheduled-sends', daemon=True)
+        self._thread.start()
+        return self
+
+
+def print_stats(path=None):
+    counts = schedule_counts(path)
+    print(f"\nScheduled sends: {', '.join(f'{status} {count}' for status, count in sorted(counts.items())) or 'none'}")
+    next_at = next_send_time(path)
+    if next_at is not None:
+        print(f"Next send: {datetime.fromtimestamp(next_at).isoformat(timespec='seconds')}")
+
+
+def main(argv):
+    if argv == ['stats']:
+        print_stats()
+    elif argv == ['run']:
+        # The campaign module holds the send path (transport, quotas, suppression checks)
+        import v4_improved as campaign
+        stop_event = threading.Event()
+        campaign.install_signal_handlers(stop_event)
+        dispatcher = campaign.start_scheduled_dispatcher()
+        if dispatcher is None:
+            return 1
+        while not stop_event.wait(1):
+            pass
+        dispatcher.stop()
+    elif len(argv) == 2 and argv[0] == 'cancel':
+        print(f"Cancelled {cancel_scheduled(None if argv[1] == 'all' else argv[1])} scheduled messages")
+    elif argv and argv[0] == 'prune' and len(argv) <= 2:
+        print(f"Removed {prune_schedule(float(argv[1]) if len(argv) == 2 else 30)} finished rows")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
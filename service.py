@@ -0,0 +1,319 @@
+"""
+Long-running campaign service with a local job API.
+
+Each `python v4_improved.py` run pays for imports, client construction and cold
+connections, and handles a single profile source. The service imports the
+campaign module once and keeps everything it builds warm for every job: the
+Groq client and local backend session, the SMTP pool, the adaptive concurrency
+limiter, circuit breakers, request hedger and rate-limit pacer, and the
+suppression and unsubscribe caches. Campaign jobs are accepted over HTTP, and up
+to SERVICE_MAX_JOBS of them run side by side. They share those provider limits,
+so together they never push past what a single run would. Each job has its own
+stop event, so cancelling one stops it gracefully without touching the others.
+Messages that jobs schedule for later (SEND_AT, see send_scheduler.py) are
+delivered by the service's dispatcher as they fall due.
+
+A job may carry its own "campaign" (event, sender, unsubscribe link and weight,
+see campaign_config.py); anything it leaves out comes from .env. Jobs for
+different campaigns split the Groq and send capacity by weight, turn by turn.
+
+API (JSON):
+    POST /jobs                {"sources": ["data/a.csv", "exports/*.jsonl"]}
+                              or {"profiles": [{"full_name": ..., "email": ..., ...}]}
+                              optional "campaign": {"event_name": ..., "weight": 3, ...}
+    GET  /jobs                all jobs, newest first
+    GET  /jobs/<id>           state, live progress and, once finished, the run statistics
+    POST /jobs/<id>/cancel    (or DELETE /jobs/<id>) stop a queued or running job
+    GET  /health              service state, provider circuits and concurrency limit
+
+Usage:
+    python service.py
+    curl -X POST localhost:8790/jobs -d '{"sources": ["data/4_profiles.csv"]}'
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Importing the campaign module builds the provider clients, pools and limiters once
+import v4_improved as campaign
+from send_scheduler import schedule_counts
+from campaign_config import CampaignConfig
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8790"))
+SERVICE_MAX_JOBS = int(os.getenv("SERVICE_MAX_JOBS", "2"))
+# Finished jobs kept for GET /jobs
+SERVICE_JOB_HISTORY = int(os.getenv("SERVICE_JOB_HISTORY", "100"))
+SERVICE_MAX_REQUEST_BYTES = int(os.getenv("SERVICE_MAX_REQUEST_BYTES", str(16 * 1024 * 1024)))
+
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+
+
+class Job:
+    """One submitted campaign: its input, state, stop event and progress."""
+
+    def __init__(self, sources=None, profiles=None, campaign_config=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.sources = sources
+        self.profiles = profiles
+        self.campaign = campaign_config or campaign.DEFAULT_CAMPAIGN
+        self.state = 'queued'
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stop_event = threading.Event()
+        self.tracker = None
+        self.stats = None
+        self.error = None
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'state': self.state,
+            'campaign': self.campaign.to_dict(),
+            'sources': self.sources,
+            'profiles': len(self.profiles) if self.profiles is not None else None,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': self.tracker.snapshot() if self.tracker is not None else None,
+            'stats': self.stats,
+            'error': self.error
+        }
+
+
+def parse_job_request(payload):
+    """Validate a POST /jobs body. Returns a Job, or raises ValueError."""
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+
+    campaign_config = None
+    if payload.get('campaign') is not None:
+        campaign_config = CampaignConfig.from_dict(payload['campaign'], campaign.DEFAULT_CAMPAIGN)
+
+    sources, profiles = payload.get('sources'), payload.get('profiles')
+    if (sources is None) == (profiles is None):
+        raise ValueError("Give either 'sources' or 'profiles'")
+    if profiles is not None:
+        if not isinstance(profiles, list) or not profiles or not all(isinstance(p, dict) for p in profiles):
+            raise ValueError("'profiles' must be a non-empty list of objects")
+        return Job(profiles=profiles, campaign_config=campaign_config)
+
+    if isinstance(sources, str):
+        sources = [sources]
+    if not isinstance(sources, list) or not sources or not all(isinstance(s, str) for s in sources):
+        raise ValueError("'sources' must be a path or a non-empty list of paths")
+    return Job(sources=sources, campaign_config=campaign_config)
+
+
+class JobManager:
+    """Runs submitted jobs on a shared pool of SERVICE_MAX_JOBS campaign threads."""
+
+    def __init__(self, max_jobs=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs or SERVICE_MAX_JOBS, thread_name_prefix='campaign-job')
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, job):
+        with self.lock:
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        logging.info(f"Job {job.id} queued for {job.campaign!r} ({job.sources or f'{len(job.profiles)} profiles'})")
+        self.executor.submit(self._run, job)
+        return job
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - SERVICE_JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    def _attach_tracker(self, job):
+        def attach(tracker):
+            job.tracker = tracker
+        return attach
+
+    def _run(self, job):
+        with self.lock:
+            if job.stop_event.is_set():
+                return
+            job.state = 'running'
+            job.started_at = time.time()
+        logging.info(f"Job {job.id} started")
+
+        try:
+            profiles, total = campaign.load_profiles(job.sources, records=job.profiles)
+            stats, _ = campaign.run_campaign(
+                profiles,
+                total,
+                stop_event=job.stop_event,
+                on_tracker=self._attach_tracker(job),
+                campaign=job.campaign
+            )
+            # Per-recipient outcomes are for callers in this process, not for the job listing
+            job.stats = {key: value for key, value in stats.items() if key != 'outcomes'}
+            state = 'cancelled' if job.stop_event.is_set() else 'completed'
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed")
+            job.error = f"{type(e).__name__}: {e}"
+            state = 'failed'
+
+        with self.lock:
+            job.state = state
+            job.finished_at = time.time()
+        logging.info(f"Job {job.id} {state}")
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(reversed(self.jobs.values()))
+
+    def cancel(self, job_id):
+        """Stop a job. Returns the job (None if unknown)."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return job
+            job.stop_event.set()
+            if job.state == 'queued':
+                job.state = 'cancelled'
+                job.finished_at = time.time()
+        logging.info(f"Job {job_id} cancel requested")
+        return job
+
+    def counts(self):
+        with self.lock:
+            states = [job.state for job in self.jobs.values()]
+        return {state: states.count(state) for state in ('queued', 'running') + FINISHED_STATES}
+
+    def shutdown(self):
+        """Cancel every job (running ones stop gracefully) and wait for them."""
+        for job in self.list():
+            self.cancel(job.id)
+        self.executor.shutdown(wait=True)
+
+
+def health_snapshot(manager):
+    limiter = campaign.generation_limiter
+    return {
+        'status': 'ok',
+        'jobs': manager.counts(),
+        'generation_backend': campaign.GENERATION_BACKEND,
+        'email_transport': campaign.EMAIL_TRANSPORT,
+        'dry_run': campaign.DRY_RUN,
+        'circuits': {breaker.name: breaker.snapshot() for breaker in (campaign.generation_breaker, campaign.send_breaker)},
+        'generation_limit': limiter.snapshot() if limiter is not None else None,
+        'rate_limits': campaign.rate_limit_pacer.snapshot() if campaign.rate_limit_pacer is not None else None,
+        'smtp_pool': campaign.smtp_pool.snapshot() if campaign.smtp_pool is not None else None,
+        'fair_share': {turns.name: turns.snapshot() for turns in (campaign.generation_turns, campaign.send_turns)},
+        'scheduled_sends': schedule_counts()
+    }
+
+
+def make_handler(manager):
+    """Build the request handler class bound to the job manager."""
+
+    class JobHandler(BaseHTTPRequestHandler):
+        def _respond(self, status, payload):
+            body = json.dumps(payload, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self):
+            return [part for part in self.path.split('?')[0].split('/') if part]
+
+        def _cancel(self, job_id):
+            job = manager.cancel(job_id)
+            if job is None:
+                self._respond(404, {'error': 'unknown job'})
+            else:
+                self._respond(200, job.snapshot())
+
+        def do_GET(self):
+            route = self._route()
+            if route == ['health']:
+                self._respond(200, health_snapshot(manager))
+            elif route == ['jobs']:
+                self._respond(200, {'jobs': [job.snapshot() for job in manager.list()]})
+            elif len(route) == 2 and route[0] == 'jobs':
+                job = manager.get(route[1])
+                if job is None:
+                    self._respond(404, {'error': 'unknown job'})
+                else:
+                    self._respond(200, job.snapshot())
+            else:
+                self._respond(404, {'error': 'not found'})
+
+        def do_POST(self):
+            route = self._route()
+            if len(route) == 3 and route[0] == 'jobs' and route[2] == 'cancel':
+                self._cancel(route[1])
+                return
+            if route != ['jobs']:
+                self._respond(404, {'error': 'not found'})
+                return
+
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > SERVICE_MAX_REQUEST_BYTES:
+                self._respond(413, {'error': 'request too large'})
+                return
+            try:
+                job = parse_job_request(json.loads(self.rfile.read(length) or b'null'))
+            except ValueError as e:
+                self._respond(400, {'error': str(e)})
+                return
+            self._respond(202, manager.submit(job).snapshot())
+
+        def do_DELETE(self):
+            route = self._route()
+            if len(route) == 2 and route[0] == 'jobs':
+                self._cancel(route[1])
+            else:
+                self._respond(404, {'error': 'not found'})
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return JobHandler
+
+
+def run_service(host=SERVICE_HOST, port=SERVICE_PORT):
+    """Serve the job API until SIGINT/SIGTERM, then stop all jobs gracefully."""
+    # Load the suppression and unsubscribe caches before the first job needs them
+    campaign.is_unsubscribed('')
+
+    manager = JobManager()
+    # Messages scheduled by jobs (SEND_AT) go out from here as they fall due
+    dispatcher = campaign.start_scheduled_dispatcher()
+    server = ThreadingHTTPServer((host, port), make_handler(manager))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Campaign service listening on http://{host}:{port} ({SERVICE_MAX_JOBS} concurrent jobs)")
+
+    stop_event = threading.Event()
+    campaign.install_signal_handlers(stop_event)
+    try:
+        while not stop_event.wait(1):
+            pass
+        logging.info("Shutting down: no new jobs, stopping running jobs gracefully")
+    finally:
+        server.shutdown()
+        server.server_close()
+        manager.shutdown()
+        if dispatcher is not None:
+            dispatcher.stop(timeout=campaign.SHUTDOWN_TIMEOUT)
+
+
+if __name__ == "__main__":
+    run_service()
@@ -0,0 +1,206 @@
+"""
+Semantic reuse cache for generated bodies, keyed on profile similarity.
+
+An exact-prompt cache misses whenever two recipients differ only in name or
+company. This cache vectorizes the descriptive profile fields (industry,
+job_title, goal, interests) with a hashing vectorizer, indexes the vectors with
+random-hyperplane LSH (approximate nearest neighbours on cosine similarity), and
+when a new profile is close enough to one already generated, adapts that body to
+the new recipient instead of calling the model. Everything runs offline on CPU
+with the standard library.
+"""
+import re
+import math
+import hashlib
+import threading
+
+VECTOR_FIELDS = ('industry', 'job_title', 'goal', 'interests')
+VECTOR_DIMENSIONS = 1 << 20
+# Company-name words that say nothing about who the source recipient was
+GENERIC_NAME_WORDS = {'the', 'and', 'inc', 'ltd', 'llc', 'corp', 'co', 'company', 'group', 'gmbh', 'sa', 'sas', 'plc'}
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _field_value(profile, field):
+    value = profile.get(field)
+    if value is None or value != value:  # missing or NaN
+        return ''
+    return str(value)
+
+
+def vectorize(profile):
+    """
+    Sparse, L2-normalized hashed feature vector {index: weight} of the profile
+    fields. Features are field-scoped unigrams and bigrams with signed hashing.
+    """
+    vector = {}
+    for field in VECTOR_FIELDS:
+        words = re.findall(r"[a-z0-9+#]+", _field_value(profile, field).lower())
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for term in terms:
+            h = _hash(f"{field}:{term}")
+            index = h % VECTOR_DIMENSIONS
+            sign = 1.0 if (h >> 63) & 1 else -1.0
+            vector[index] = vector.get(index, 0.0) + sign
+
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if norm:
+        vector = {i: w / norm for i, w in vector.items()}
+    return vector
+
+
+def cosine(a, b):
+    """Cosine similarity of two normalized sparse vectors."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(i, 0.0) for i, w in a.items())
+
+
+def _identifying_words(source, target):
+    # Words of the source's name and company that the target doesn't share ("Acme" of "Acme Corp")
+    target_words = {
+        word.lower()
+        for field in ('full_name', 'company', 'job_title')
+        for word in re.findall(r"\w+", _field_value(target, field))
+    }
+    return {
+        word
+        for field in ('full_name', 'company')
+        for word in re.findall(r"\w+", _field_value(source, field))
+        if len(word) > 1 and word.lower() not in target_words and word.lower() not in GENERIC_NAME_WORDS
+    }
+
+
+def adapt_body(body, source, target):
+    """
+    Rewrite a body written for `source` so it addresses `target`: full name,
+    first name, last name, company and job title are swapped. Returns None if
+    traces of the source recipient would remain, including any single word of
+    its name or company (a shortened "Acme" for "Acme Corp").
+    """
+    source_name = _field_value(source, 'full_name').split()
+    target_name = _field_value(target, 'full_name').split()
+    if not source_name or not target_name:
+        return None
+
+    replacements = [
+        (' '.join(source_name), ' '.join(target_name)),
+        (source_name[0], target_name[0]),
+        (_field_value(source, 'company'), _field_value(target, 'company')),
+        (_field_value(source, 'job_title'), _field_value(target, 'job_title')),
+    ]
+    if len(source_name) > 1 and len(target_name) > 1:
+        replacements.append((source_name[-1], target_name[-1]))
+
+    adapted = body
+    for old, new in replacements:
+        if old and new and old != new:
+            adapted = re.sub(rf"\b{re.escape(old)}\b", new, adapted)
+
+    for old, new in replacements:
+        if old and old != new and re.search(rf"\b{re.escape(old)}\b", adapted):
+            return None
+    for word in _identifying_words(source, target):
+        if re.search(rf"\b{re.escape(word)}\b", adapted):
+            return None
+    return adapted
+
+
+class SimilarityCache:
+    """Thread-safe LSH index of (profile vector, body) pairs with bounded reuse."""
+
+    def __init__(self, threshold=0.9, tables=8, bits=12, max_reuse=3, seed=1):
+        self.threshold = threshold
+        self.tables = tables
+        self.bits = bits
+        self.max_reuse = max_reuse
+        self.seed = seed
+        self.buckets = [dict() for _ in range(tables)]
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def _plane_sign(self, table, bit, index):
+        # Random hyperplane component in {-1, +1}, derived on the fly instead of stored
+        return 1.0 if _hash(f"{self.seed}:{table}:{bit}:{index}") & 1 else -1.0
+
+    def _signatures(self, vector):
+        signatures = []
+        for table in range(self.tables):
+            key = 0
+            for bit in range(self.bits):
+                projection = sum(w * self._plane_sign(table, bit, i) for i, w in vector.items())
+                key = (key << 1) | (projection >= 0)
+            signatures.append(key)
+        return signatures
+
+    def add(self, profile, body):
+        """Index a generated body under its profile."""
+        vector = vectorize(profile)
+        if not vector:
+            return
+        signatures = self._signatures(vector)
+        with self._lock:
+            entry_id = len(self.entries)
+            self.entries.append({'profile': profile, 'vector': vector, 'body': body, 'uses': 0, 'reused_for': []})
+            for table, key in enumerate(signatures):
+                self.buckets[table].setdefault(key, []).append(entry_id)
+
+    def lookup(self, profile):
+        """
+        Return (adapted body, similarity, entry id) for the nearest cached
+        profile above the threshold, or None. Each cached body is reused at most
+        max_reuse times; a reuse only counts once accept() is called for it, so
+        an adapted body rejected by later screening costs nothing.
+        """
+        vector = vectorize(profile)
+        if not vector:
+            return None
+        signatures = self._signatures(vector)
+
+        with self._lock:
+            candidates = set()
+            for table, key in enumerate(signatures):
+                candidates.update(self.buckets[table].get(key, ()))
+
+            ranked = sorted(
+                ((cosine(vector, self.entries[c]['vector']), c) for c in candidates),
+                reverse=True
+            )
+            for similarity, entry_id in ranked:
+                if similarity < self.threshold:
+                    break
+                entry = self.entries[entry_id]
+                if entry['uses'] >= self.max_reuse:
+                    continue
+                if _field_value(entry['profile'], 'email').lower() == _field_value(profile, 'email').lower():
+                    continue
+                adapted = adapt_body(entry['body'], entry['profile'], profile)
+                if adapted is None:
+                    continue
+                return adapted, similarity, entry_id
+        return None
+
+    def source_email(self, entry_id):
+        return self.entries[entry_id]['profile']['email']
+
+    def family(self, entry_id):
+        """Emails holding this entry's body: its source and every recipient it was adapted for."""
+        with self._lock:
+            entry = self.entries[entry_id]
+            return [entry['profile']['email'], *entry['reused_for']]
+
+    def accept(self, entry_id, email):
+        """Count a reuse of this entry's body for `email`; False if max_reuse was reached meanwhile."""
+        with self._lock:
+            entry = self.entries[entry_id]
+            if entry['uses'] >= self.max_reuse:
+                return False
+            entry['uses'] += 1
+            entry['reused_for'].append(email)
+            return True
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,321 @@
+"""
+Pooled SMTP delivery, an alternative to the Resend API for our own relays.
+
+Resend costs one HTTPS request per message. Through SMTP, a pool of
+authenticated, long-lived connections sends many messages per session: a
+connection is opened (and STARTTLS/AUTH done) once and reused until it has sent
+SMTP_MAX_MESSAGES_PER_CONNECTION messages. Idle connections are checked with
+NOOP before reuse, and a connection the server dropped is replaced
+transparently. Messages are built as multipart/alternative (plain text + HTML)
+with the same List-Unsubscribe headers as the Resend path.
+
+Refusals are raised as SMTPSendError. A 5xx reply to RCPT TO means the
+recipient address is dead (permanent). Every other refusal is left for
+classify_send_error to judge by its text, so account and policy problems never
+suppress a recipient.
+
+Usage:
+    python smtp_transport.py sink [port] [delay]   # local SMTP sink that accepts and counts messages
+                                                   # (delay: seconds per message, to emulate a remote relay)
+    python smtp_transport.py bench [count]         # send test messages through the pool (SMTP_* settings)
+"""
+import os
+import ssl
+import sys
+import time
+import queue
+import asyncio
+import smtplib
+import logging
+import threading
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+# starttls | ssl | none
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "starttls").lower()
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Connections idle for longer than this are checked with NOOP before reuse
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", "30"))
+
+
+class SMTPSendError(Exception):
+    """
+    A refused message. `smtp_code` is the server's reply code; `permanent` is
+    True for a dead recipient address, False for a temporary (4xx) refusal and
+    None when only the reply text can tell.
+    """
+
+    def __init__(self, smtp_code, message, permanent=None):
+        super().__init__(f"SMTP {smtp_code}: {message}")
+        self.smtp_code = smtp_code
+        self.permanent = permanent
+
+
+def _reply_text(reply):
+    return reply.decode('utf-8', 'replace') if isinstance(reply, bytes) else str(reply)
+
+
+def build_message(sender, to_email, subject, html_body, plain_body, reply_to=None, headers=None):
+    """multipart/alternative message with plain text first and HTML as the preferred part."""
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = to_email
+    message['Subject'] = subject
+    message['Date'] = formatdate(localtime=True)
+    message['Message-ID'] = make_msgid(domain=sender.rsplit('@', 1)[-1].strip('>'))
+    if reply_to:
+        message['Reply-To'] = reply_to
+    for name, value in (headers or {}).items():
+        message[name] = value
+    message.set_content(plain_body)
+    message.add_alternative(html_body, subtype='html')
+    return message
+
+
+class _Connection:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class SMTPPool:
+    """
+    Thread-safe pool of up to `size` authenticated SMTP connections.
+    send() borrows a connection (opening one if none is idle), sends and puts
+    it back for the next message.
+    """
+
+    def __init__(self, host=None, port=None, username=None, password=None, security=None, size=None,
+                 max_messages=None, timeout=None, idle_check_seconds=None):
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self.username = username if username is not None else SMTP_USERNAME
+        self.password = password if password is not None else SMTP_PASSWORD
+        self.security = security or SMTP_SECURITY
+        self.max_messages = max_messages or SMTP_MAX_MESSAGES_PER_CONNECTION
+        self.timeout = timeout or SMTP_TIMEOUT
+        self.idle_check_seconds = SMTP_IDLE_CHECK_SECONDS if idle_check_seconds is None else idle_check_seconds
+        self.size = size or SMTP_POOL_SIZE
+        self.connections_opened = 0
+        self.messages_sent = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        if self.security not in ('starttls', 'ssl', 'none'):
+            raise ValueError(f"Unknown SMTP_SECURITY: {self.security}")
+
+    def _open(self):
+        if self.security == 'ssl':
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.security == 'starttls':
+                smtp.starttls(context=ssl.create_default_context())
+                smtp.ehlo()
+            if self.username:
+                smtp.login(self.username, self.password or '')
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return _Connection(smtp)
+
+    def _checkout(self):
+        # Most recently used first: the least likely to have been dropped by the server
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            if time.monotonic() - connection.last_used < self.idle_check_seconds:
+                return connection
+            try:
+                if connection.smtp.noop()[0] == 250:
+                    return connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            connection.smtp.close()
+
+    def _checkin(self, connection):
+        connection.last_used = time.monotonic()
+        if connection.sent >= self.max_messages:
+            connection.close()
+        else:
+            self._idle.put(connection)
+
+    def send(self, message):
+        """Send one EmailMessage. Raises SMTPSendError if the server refuses it."""
+        with self._slots:
+            connection = self._checkout()
+            try:
+                try:
+                    connection.smtp.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    if not connection.sent:
+                        raise
+                    # A reused connection the server had already closed: once more on a fresh one
+                    connection.smtp.close()
+                    connection = self._open()
+                    connection.smtp.send_message(message)
+            except smtplib.SMTPRecipientsRefused as e:
+                self._checkin(connection)
+                code, reply = next(iter(e.recipients.values()))
+                raise SMTPSendError(code, _reply_text(reply), permanent=code >= 500) from e
+            except smtplib.SMTPResponseException as e:
+                self._checkin(connection)
+                raise SMTPSendError(e.smtp_code, _reply_text(e.smtp_error), permanent=False if e.smtp_code < 500 else None) from e
+            except Exception:
+                connection.smtp.close()
+                raise
+            connection.sent += 1
+            self._checkin(connection)
+            with self._lock:
+                self.messages_sent += 1
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'connections_opened': self.connections_opened,
+                'messages_sent': self.messages_sent,
+                'idle_connections': self._idle.qsize()
+            }
+
+
+# -- local sink and benchmark ------------------------------------------------
+
+class _SinkStats:
+    messages = 0
+    sessions = 0
+
+
+async def _sink_session(reader, writer, stats, delay):
+    stats.sessions += 1
+
+    async def reply(line):
+        writer.write(line.encode() + b"\r\n")
+        await writer.drain()
+
+    await reply("220 smtp-sink ready")
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                writer.write(b"250-smtp-sink\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 52428800\r\n")
+                await writer.drain()
+            elif verb == 'AUTH':
+                if command.upper().startswith('AUTH LOGIN'):
+                    for _ in range(2 - (len(command.split()) > 2)):
+                        await reply("334 VXNlcm5hbWU6")
+                        await reader.readline()
+                await reply("235 2.7.0 Authentication successful")
+            elif verb == 'RCPT':
+                # Addresses starting with "bounce" are refused, to exercise permanent failures
+                if 'TO:<BOUNCE' in command.upper().replace(' ', ''):
+                    await reply("550 5.1.1 Recipient address rejected: user unknown")
+                else:
+                    await reply("250 2.1.5 OK")
+            elif verb == 'DATA':
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                    pass
+                if delay:
+                    await asyncio.sleep(delay)
+                stats.messages += 1
+                await reply("250 2.0.0 Queued")
+            elif verb == 'QUIT':
+                await reply("221 2.0.0 Bye")
+                break
+            elif verb in ('HELO', 'MAIL', 'RSET', 'NOOP'):
+                await reply("250 OK")
+            else:
+                await reply("502 5.5.2 Command not implemented")
+    finally:
+        writer.close()
+
+
+def run_sink(port=1025, delay=0.0):
+    """Accept and discard messages on localhost:port, printing a count every few seconds."""
+    stats = _SinkStats()
+
+    async def main():
+        server = await asyncio.start_server(lambda r, w: _sink_session(r, w, stats, delay), '127.0.0.1', port)
+        print(f"SMTP sink listening on 127.0.0.1:{port} (use SMTP_SECURITY=none)")
+        async with server:
+            while True:
+                await asyncio.sleep(5)
+                print(f"{stats.messages} messages received over {stats.sessions} sessions")
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+def run_bench(count=1000):
+    """Send `count` test messages through a pool built from the SMTP_* settings."""
+    pool = SMTPPool()
+    sender = os.getenv("SENDER_EMAIL", "events@example.com")
+    html = "<p>" + "Benchmark message. " * 40 + "</p>"
+    text = "Benchmark message. " * 40
+    headers = {"List-Unsubscribe": "<https://example.com/unsubscribe>", "List-Unsubscribe-Post": "List-Unsubscribe=One-Click"}
+
+    def send(i):
+        pool.send(build_message(sender, f"bench{i}@example.com", f"Benchmark {i}", html, text, headers=headers))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=SMTP_POOL_SIZE) as executor:
+        list(executor.map(send, range(count)))
+    elapsed = time.monotonic() - started
+    pool.close()
+
+    stats = pool.snapshot()
+    print(f"{count} messages in {elapsed:.2f}s ({count / elapsed:.0f} msg/s) over "
+          f"{stats['connections_opened']} connections (pool {SMTP_POOL_SIZE}, "
+          f"{SMTP_MAX_MESSAGES_PER_CONNECTION} messages per connection)")
+
+
+def main(argv):
+    if argv and argv[0] == 'sink' and len(argv) <= 3:
+        run_sink(int(argv[1]) if len(argv) >= 2 else 1025, float(argv[2]) if len(argv) == 3 else 0.0)
+    elif argv and argv[0] == 'bench' and len(argv) <= 2:
+        run_bench(int(argv[1]) if len(argv) == 2 else 1000)
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
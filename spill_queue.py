@@ -0,0 +1,181 @@
+"""
+Bounded priority queue that spills overflow to disk.
+
+When generation runs ahead of sending (e.g. Resend throttling us), finished
+messages would otherwise pile up in memory for hours. SpillQueue keeps at most
+`high_watermark` items in memory. Beyond that, the lowest-priority items are
+appended to segment files on disk; once the in-memory part drains below
+`low_watermark` it is refilled from disk. put() never blocks, so generation is
+never stalled by a slow send stage.
+
+Ordering: items are (priority, ...) tuples and come out by priority, like
+queue.PriorityQueue. Spilled items are kept in one band of segments per
+priority value: a full queue spills its worst item (the new one, or the worst
+one in memory), refills read the best band first, and a spilled band that beats
+everything in memory is read back before the next get(). Within a priority,
+items spilled earlier come back first.
+"""
+import os
+import heapq
+import pickle
+import struct
+import tempfile
+import threading
+from queue import Empty
+
+_LENGTH = struct.Struct('>I')
+
+
+class _Band:
+    """Spill segments of one priority, oldest first; the last one is being written."""
+
+    def __init__(self):
+        self.segments = []
+        self.writer = None
+        self.reader = None
+        self.count = 0
+
+    def close(self):
+        for handle in (self.reader, self.writer):
+            if handle is not None:
+                handle.close()
+        self.reader = self.writer = None
+        for path in self.segments:
+            if os.path.exists(path):
+                os.remove(path)
+        self.segments = []
+
+
+class SpillQueue:
+    """PriorityQueue-compatible (put / get / get_nowait / qsize) queue with disk overflow."""
+
+    def __init__(self, high_watermark=1000, low_watermark=250, spill_dir='output/spill',
+                 segment_bytes=64 * 1024 * 1024, encode=None, decode=None):
+        if low_watermark >= high_watermark:
+            raise ValueError("low_watermark must be below high_watermark")
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.spill_dir = spill_dir
+        self.segment_bytes = segment_bytes
+        self.encode = encode or (lambda item: item)
+        self.decode = decode or (lambda item: item)
+        self.spilled_total = 0
+        self._heap = []
+        self._bands = {}             # {priority: _Band} for priorities with items on disk
+        self._on_disk = 0
+        self._not_empty = threading.Condition()
+
+    # -- disk segments -------------------------------------------------
+
+    def _write_to_disk(self, item):
+        band = self._bands.get(item[0])
+        if band is None:
+            band = self._bands[item[0]] = _Band()
+        if band.writer is None or band.writer.tell() >= self.segment_bytes:
+            if band.writer is not None:
+                band.writer.close()
+            os.makedirs(self.spill_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix='send_queue_', suffix='.spill', dir=self.spill_dir)
+            band.writer = os.fdopen(fd, 'wb')
+            band.segments.append(path)
+
+        data = pickle.dumps(self.encode(item), protocol=pickle.HIGHEST_PROTOCOL)
+        band.writer.write(_LENGTH.pack(len(data)) + data)
+        band.count += 1
+        self._on_disk += 1
+        self.spilled_total += 1
+
+    def _read_from_disk(self, priority):
+        band = self._bands[priority]
+        while True:
+            if band.writer is not None and len(band.segments) == 1:
+                # Reading the segment that is still being written
+                band.writer.flush()
+            if band.reader is None:
+                band.reader = open(band.segments[0], 'rb')
+
+            header = band.reader.read(_LENGTH.size)
+            if header:
+                (length,) = _LENGTH.unpack(header)
+                item = self.decode(pickle.loads(band.reader.read(length)))
+                band.count -= 1
+                self._on_disk -= 1
+                if not band.count:
+                    band.close()
+                    del self._bands[priority]
+                return item
+
+            # Segment exhausted: drop it, unless it is still being written
+            if len(band.segments) == 1:
+                return None
+            band.reader.close()
+            band.reader = None
+            os.remove(band.segments.pop(0))
+
+    def _refill(self, at_least_one=False):
+        # Move spilled items back into memory, best priority first, up to the high watermark
+        while self._bands and (len(self._heap) < self.high_watermark or at_least_one):
+            item = self._read_from_disk(min(self._bands))
+            if item is None:
+                break
+            heapq.heappush(self._heap, item)
+            at_least_one = False
+
+    def _spilled_band_first(self):
+        # A spilled priority better than everything in memory goes next; equal priorities
+        # in memory arrived before that band was spilled
+        return self._bands and (not self._heap or min(self._bands) < self._heap[0][0])
+
+    # -- queue interface -----------------------------------------------
+
+    def put(self, item):
+        with self._not_empty:
+            if item[0] in self._bands:
+                # Earlier items of this priority are on disk: queue up behind them
+                self._write_to_disk(item)
+            elif len(self._heap) < self.high_watermark:
+                heapq.heappush(self._heap, item)
+            else:
+                # Full: the worst of the new item and the items in memory goes to disk
+                worst = max(range(len(self._heap)), key=self._heap.__getitem__)
+                if item < self._heap[worst]:
+                    item, self._heap[worst] = self._heap[worst], item
+                    heapq.heapify(self._heap)
+                self._write_to_disk(item)
+            self._not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        with self._not_empty:
+            if block and not self._heap and not self._on_disk:
+                self._not_empty.wait_for(lambda: self._heap or self._on_disk, timeout)
+            if self._spilled_band_first():
+                self._refill(at_least_one=True)
+            if not self._heap:
+                raise Empty
+            item = heapq.heappop(self._heap)
+            if self._on_disk and len(self._heap) < self.low_watermark:
+                self._refill()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        with self._not_empty:
+            return len(self._heap) + self._on_disk
+
+    def in_memory(self):
+        with self._not_empty:
+            return len(self._heap)
+
+    def on_disk(self):
+        with self._not_empty:
+            return self._on_disk
+
+    def close(self):
+        """Delete any remaining segment files."""
+        with self._not_empty:
+            for band in self._bands.values():
+                band.close()
+            self._bands = {}
+            self._on_disk = 0
@@ -0,0 +1,144 @@
+"""
+Persistent suppression store (bounces, complaints, unsubscribes).
+
+Entries live in a small SQLite database so that the webhook receiver and any
+number of running campaigns can share it safely. Campaign processes keep an
+in-memory set that is refreshed incrementally (only rows added since the last
+refresh are read), so lookups stay O(1) and new entries show up within
+SUPPRESSION_REFRESH_SECONDS.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPPRESSION_DB_PATH = os.getenv("SUPPRESSION_DB_PATH", "data/suppression.db")
+SUPPRESSION_REFRESH_SECONDS = float(os.getenv("SUPPRESSION_REFRESH_SECONDS", "2"))
+
+_cache = set()
+_cache_last_rowid = 0
+_cache_refreshed_at = 0.0
+_cache_lock = threading.Lock()
+
+
+def connect(path=None):
+    """Open the suppression database, creating it on first use."""
+    path = path or SUPPRESSION_DB_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS suppressions (
+            email TEXT PRIMARY KEY,
+            reason TEXT NOT NULL,
+            source TEXT,
+            detail TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    return conn
+
+
+def add_suppressions(entries, path=None):
+    """
+    Commit a batch of suppressions in one transaction.
+    entries: iterable of (email, reason, source, detail). Existing entries are kept.
+    Returns the number of new addresses.
+    """
+    now = datetime.now().isoformat()
+    rows = [(email.strip().lower(), reason, source, detail, now) for email, reason, source, detail in entries]
+    if not rows:
+        return 0
+
+    conn = connect(path)
+    try:
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO suppressions (email, reason, source, detail, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            added = conn.total_changes - before
+    finally:
+        conn.close()
+
+    logging.info(f"Suppression store: committed {len(rows)} events ({added} new addresses)")
+    return added
+
+
+def _refresh_cache(now):
+    """Pull rows added since the last refresh into the in-memory set."""
+    global _cache_last_rowid, _cache_refreshed_at
+
+    if not os.path.exists(SUPPRESSION_DB_PATH):
+        _cache_refreshed_at = now
+        return
+
+    conn = connect()
+    try:
+        rows = conn.execute(
+            "SELECT rowid, email FROM suppressions WHERE rowid > ? ORDER BY rowid",
+            (_cache_last_rowid,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    for rowid, email in rows:
+        _cache.add(email)
+        _cache_last_rowid = rowid
+    _cache_refreshed_at = now
+
+
+def is_suppressed(email, now=None):
+    """Check an address against the suppression store (refreshed every few seconds)."""
+    now = now or time.time()
+
+    with _cache_lock:
+        if now - _cache_refreshed_at >= SUPPRESSION_REFRESH_SECONDS:
+            try:
+                _refresh_cache(now)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not refresh suppression store: {e}")
+        return email.strip().lower() in _cache
+
+
+def count_suppressions(emails, reasons=None, path=None):
+    """Count the suppressed addresses among `emails` by reason, optionally only for `reasons`."""
+    emails = sorted({email.strip().lower() for email in emails})
+    counts = {}
+    if not emails or not os.path.exists(path or SUPPRESSION_DB_PATH):
+        return counts
+
+    conn = connect(path)
+    try:
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(emails), 500):
+            chunk = emails[start:start + 500]
+            rows = conn.execute(
+                f"SELECT reason, COUNT(*) FROM suppressions WHERE email IN ({','.join('?' * len(chunk))}) GROUP BY reason",
+                chunk
+            ).fetchall()
+            for reason, count in rows:
+                if reasons is None or reason in reasons:
+                    counts[reason] = counts.get(reason, 0) + count
+    finally:
+        conn.close()
+    return counts
+
+
+def get_suppression(email, path=None):
+    """Return (reason, source, created_at) for an address, or None."""
+    conn = connect(path)
+    try:
+        return conn.execute(
+            "SELECT reason, source, created_at FROM suppressions WHERE email = ?",
+            (email.strip().lower(),)
+        ).fetchone()
+    finally:
+        conn.close()
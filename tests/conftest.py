@@ -0,0 +1,150 @@
+"""
+Shared test setup. v4_improved.py reads its settings and opens its SMTP pool
+at import time, so the environment is prepared here, before any test module
+imports it: every path points into a temporary directory, sends go through the
+SMTP pool to an in-process sink (smtp_transport.py), and generation uses a fake
+Groq client installed by the `campaign` fixture.
+"""
+import os
+import sys
+import types
+import socket
+import asyncio
+import tempfile
+import threading
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix="targetmail-tests-")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+SINK_PORT = _free_port()
+
+os.environ.update(
+    GROQ_API_KEY="test",
+    EVENT_NAME="Summit",
+    DRY_RUN="false",
+    EMAIL_TRANSPORT="smtp",
+    SMTP_HOST="127.0.0.1",
+    SMTP_PORT=str(SINK_PORT),
+    SMTP_SECURITY="none",
+    SMTP_POOL_SIZE="4",
+    SMTP_SEND_DELAY="0",
+    RATE_LIMIT_DELAY="0",
+    STATUS_PORT="0",
+    STATUS_LINE_INTERVAL="0",
+    GROQ_REQUESTS_PER_MINUTE="60000",
+    NEAR_DUPLICATE_THRESHOLD="0",
+    FREQUENCY_CAP="",
+    MESSAGE_STORE_PATH=os.path.join(WORK_DIR, "output", "message_store.jsonl"),
+    ARCHIVE_PATH=os.path.join(WORK_DIR, "output", "email_archive.zarc"),
+    SPILL_DIR=os.path.join(WORK_DIR, "output", "spill"),
+    WARMUP_STATE_DIR=os.path.join(WORK_DIR, "output", "warmup"),
+    CONTACT_HISTORY_DB_PATH=os.path.join(WORK_DIR, "data", "contact_history.db"),
+    QUOTA_DB_PATH=os.path.join(WORK_DIR, "data", "quota.db"),
+    SCHEDULE_DB_PATH=os.path.join(WORK_DIR, "data", "scheduled_sends.db"),
+    SUPPRESSION_DB_PATH=os.path.join(WORK_DIR, "data", "suppression.db"),
+)
+
+import smtp_transport  # noqa: E402  (reads SMTP_* at import)
+
+
+def _start_sink(port):
+    stats = smtp_transport._SinkStats()
+    ready = threading.Event()
+
+    def serve():
+        async def main():
+            await asyncio.start_server(
+                lambda r, w: smtp_transport._sink_session(r, w, stats, 0.0), '127.0.0.1', port
+            )
+            ready.set()
+            await asyncio.Event().wait()
+
+        asyncio.run(main())
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait(5)
+    return stats
+
+
+SINK_STATS = _start_sink(SINK_PORT)
+
+
+def pytest_sessionstart(session):
+    # Logs, reports and CSV exports are written relative to the working directory;
+    # changed here rather than at import so pytest has already resolved testpaths
+    os.chdir(WORK_DIR)
+
+
+@pytest.fixture
+def smtp_sink():
+    """Counters of the in-process SMTP sink (messages accepted, sessions)."""
+    return SINK_STATS
+
+
+def fake_body(prompt):
+    name = next(
+        (line.split(': ', 1)[1].split()[0] for line in prompt.splitlines() if line.startswith('- Name: ')),
+        'there'
+    )
+    return (
+        f"Hi {name},\n\n"
+        "We are putting together a small, practical day of talks and I immediately thought of you. "
+        "The sessions are run by people who build things rather than sell them, and there is plenty of "
+        "time between talks to compare notes with peers who face the same problems you do every week. "
+        "If it sounds useful, the registration page has the full agenda and the remaining seats.\n\n"
+        "Hope to see you there!"
+    )
+
+
+@pytest.fixture
+def campaign(monkeypatch):
+    """v4_improved with a fake Groq client that writes one body per prompt."""
+    import v4_improved
+
+    def create(**kwargs):
+        content = fake_body(kwargs['messages'][-1]['content'])
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+    def raw_create(**kwargs):
+        response = create(**kwargs)
+        return types.SimpleNamespace(headers={}, parse=lambda: response)
+
+    completions = types.SimpleNamespace(create=create, with_raw_response=types.SimpleNamespace(create=raw_create))
+    monkeypatch.setattr(v4_improved, 'groq_client', types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+    return v4_improved
+
+
+class FakeClock:
+    """Stands in for time.monotonic in flow_control; tests move it with advance()."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze flow_control's clock (time.sleep is left real)."""
+    import time
+    import flow_control
+
+    fake = FakeClock()
+    monkeypatch.setattr(flow_control, 'time', types.SimpleNamespace(monotonic=fake, sleep=time.sleep))
+    return fake
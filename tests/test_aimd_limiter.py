@@ -0,0 +1,96 @@
+import threading
+
+from flow_control import AIMDLimiter
+
+
+def saturated_round(limiter, clock, latency=1.0):
+    """Fill every slot, let the calls take `latency` seconds and finish them."""
+    tokens = [limiter.acquire() for _ in range(int(limiter.limit))]
+    clock.advance(latency)
+    for token in tokens:
+        limiter.release(token)
+
+
+def test_limit_grows_by_one_per_saturated_round_trip(clock):
+    limiter = AIMDLimiter(initial=2, maximum=4)
+
+    saturated_round(limiter, clock)
+    # Only the release that found the limit saturated grows it, by 1 / limit
+    assert limiter.limit == 2.5
+    assert limiter.increases == 1
+
+    for _ in range(20):
+        saturated_round(limiter, clock)
+    assert limiter.limit == 4
+    assert limiter.peak_limit == 4
+
+
+def test_limit_does_not_grow_while_below_it(clock):
+    limiter = AIMDLimiter(initial=4, maximum=8)
+    for _ in range(10):
+        token = limiter.acquire()
+        clock.advance(1.0)
+        limiter.release(token)
+    assert (limiter.limit, limiter.increases) == (4, 0)
+
+
+def test_overload_halves_the_limit_once_per_round_trip(clock):
+    limiter = AIMDLimiter(initial=8, minimum=1)
+    first, second = limiter.acquire(), limiter.acquire()
+    clock.advance(1.0)
+    limiter.release(first, overloaded=True)
+    # Started before the cut: already throttled, not cut again
+    limiter.release(second, overloaded=True)
+    assert (limiter.limit, limiter.decreases) == (4, 1)
+
+    for _ in range(5):
+        # Calls started after the cut see the new limit, and are cut again
+        clock.advance(0.1)
+        token = limiter.acquire()
+        clock.advance(1.0)
+        limiter.release(token, overloaded=True)
+    assert (limiter.limit, limiter.decreases) == (1, 6)
+
+
+def test_latency_well_above_baseline_cuts_the_limit(clock):
+    limiter = AIMDLimiter(initial=8, latency_tolerance=2.0)
+    for _ in range(10):
+        token = limiter.acquire()
+        clock.advance(1.0)
+        limiter.release(token)
+
+    token = limiter.acquire()
+    clock.advance(1.5)
+    limiter.release(token)
+    assert limiter.limit == 8
+
+    token = limiter.acquire()
+    clock.advance(3.0)
+    limiter.release(token)
+    assert limiter.limit == 4
+
+    # Time spent pacing before the call, or a bigger call, is not latency
+    token = limiter.acquire()
+    clock.advance(6.0)
+    limiter.release(token, waited=5.0)
+    token = limiter.acquire()
+    clock.advance(6.0)
+    limiter.release(token, work=4.0)
+    assert limiter.limit == 4
+
+
+def test_acquire_waits_for_a_free_slot_and_cancel_gives_it_back(clock):
+    limiter = AIMDLimiter(initial=1)
+    token = limiter.acquire()
+    assert not limiter.has_capacity()
+
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    waiter.start()
+    assert not acquired.wait(0.1)
+
+    limiter.cancel(token)
+    assert acquired.wait(2)
+    waiter.join()
+    assert limiter.in_flight == 1
+    assert limiter.snapshot()['decreases'] == 0
@@ -0,0 +1,63 @@
+import json
+
+import pandas as pd
+
+from batch_jobs import export_batch, fake_process_batch, import_batch_results
+from v4_improved import VECTOR_FIELDS, get_stored_body, load_message_store, profile_content_hash
+
+PROFILES = [
+    {'full_name': 'Grace Hopper', 'email': 'grace@batch.example.com', 'company': 'Navy Labs', 'job_title': 'Rear Admiral',
+     'industry': 'Defense', 'goal': 'Meet compiler people', 'interests': 'COBOL, compilers'},
+    {'full_name': 'Alan Turing', 'email': 'alan@batch.example.com', 'company': 'Bletchley', 'job_title': 'Researcher',
+     'industry': 'Research', 'goal': 'Find collaborators', 'interests': 'Cryptography'},
+]
+
+
+def write_profiles(tmp_path, profiles=PROFILES):
+    path = tmp_path / 'profiles.csv'
+    pd.DataFrame(profiles).to_csv(path, index=False)
+    return str(path)
+
+
+def test_export_process_import_round_trip(tmp_path):
+    csv_path = write_profiles(tmp_path)
+    requests_path, results_path = str(tmp_path / 'in.jsonl'), str(tmp_path / 'out.jsonl')
+
+    assert export_batch(csv_path, requests_path) == 2
+    assert fake_process_batch(requests_path, results_path) == 2
+    assert import_batch_results(results_path, csv_path) == (2, 0)
+
+    store = load_message_store()
+    for profile in PROFILES:
+        record = store[('Summit', profile['email'])]
+        assert record['sent_status'] == 'generated'
+        assert record['event'] == 'Summit'
+        assert record['company'] == profile['company']
+        assert record['content_hash'] == profile_content_hash(pd.Series(profile))
+        assert all(record[field] == profile[field] for field in VECTOR_FIELDS)
+        assert get_stored_body(store, profile['email'], record['content_hash']) == record['body']
+
+    # Already imported: nothing left to export
+    assert export_batch(csv_path, requests_path) == 0
+
+
+def test_import_skips_results_without_a_profile(tmp_path):
+    profile = dict(PROFILES[0], email='orphan@batch.example.com')
+    requests_path, results_path = str(tmp_path / 'in.jsonl'), str(tmp_path / 'out.jsonl')
+    export_batch(write_profiles(tmp_path, [profile]), requests_path)
+    fake_process_batch(requests_path, results_path)
+
+    other_csv = write_profiles(tmp_path, [dict(PROFILES[1], email='someone-else@batch.example.com')])
+    assert import_batch_results(results_path, other_csv) == (0, 1)
+    assert ('Summit', 'orphan@batch.example.com') not in load_message_store()
+
+
+def test_failed_results_are_skipped(tmp_path):
+    csv_path = write_profiles(tmp_path, [dict(PROFILES[0], email='failed@batch.example.com')])
+    results_path = tmp_path / 'out.jsonl'
+    results_path.write_text(json.dumps({
+        'id': 'batch_req_1', 'custom_id': 'failed@batch.example.com',
+        'response': None, 'error': {'code': 'processing_error', 'message': 'boom'}
+    }) + '\n')
+
+    assert import_batch_results(str(results_path), csv_path) == (0, 1)
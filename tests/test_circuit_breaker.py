@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from flow_control import CircuitBreaker, CircuitOpenError
+
+
+def tripped(clock, **kwargs):
+    breaker = CircuitBreaker('groq', failure_rate=0.5, min_calls=4, open_seconds=10, max_open_seconds=30, **kwargs)
+    for _ in range(4):
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_once_the_failure_rate_is_reached(clock):
+    breaker = CircuitBreaker('groq', failure_rate=0.5, min_calls=4, open_seconds=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_failure()
+    # Below min_calls nothing is decided
+    assert breaker.is_closed()
+
+    breaker.record_success()
+    assert breaker.is_closed()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.trips == 1
+    with pytest.raises(CircuitOpenError, match='groq circuit open'):
+        breaker.check()
+    assert not breaker.allow()
+
+
+def test_successes_keep_the_circuit_closed(clock):
+    breaker = CircuitBreaker('groq', failure_rate=0.5, min_calls=4)
+    for _ in range(10):
+        breaker.record_success()
+        breaker.record_success()
+        breaker.record_failure()
+    assert breaker.is_closed()
+
+
+def test_half_open_probe_closes_the_circuit_on_success(clock):
+    breaker = tripped(clock)
+    clock.advance(10)
+
+    assert breaker.check() is True
+    assert breaker.state == 'half_open'
+    # One probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record_success()
+    assert breaker.is_closed()
+    assert breaker.check() is False
+
+
+def test_failed_probe_reopens_with_the_open_period_doubled(clock):
+    breaker = tripped(clock)
+    clock.advance(10)
+    breaker.check()
+    breaker.record_failure()
+    assert (breaker.state, breaker.trips) == ('open', 2)
+
+    clock.advance(19)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+    breaker.record_failure()
+
+    # Capped at max_open_seconds
+    clock.advance(30)
+    assert breaker.allow()
+
+
+def test_cancelled_probe_frees_the_slot(clock):
+    breaker = tripped(clock)
+    clock.advance(10)
+    assert breaker.check() is True
+    breaker.cancel()
+    assert breaker.check() is True
+
+
+def test_outage_longer_than_max_outage_is_exhausted(clock):
+    breaker = tripped(clock, max_outage_seconds=60)
+    assert not breaker.exhausted()
+    clock.advance(61)
+    assert breaker.exhausted()
+    assert not breaker.wait_until_available(threading.Event())
+
+    breaker.restart_outage_clock()
+    assert not breaker.exhausted()
+    assert breaker.wait_until_available(threading.Event())
+    assert breaker.check() is True
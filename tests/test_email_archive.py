@@ -0,0 +1,104 @@
+import os
+import json
+import zlib
+import subprocess
+import sys
+
+from email_archive import ArchiveReader, ArchiveWriter, append_records, _index_path, _legacy_index_path
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def records(tag, count):
+    return [{'email': f'{tag}{n}@example.com', 'body': f'{tag} body {n}'} for n in range(count)]
+
+
+def test_round_trip_across_appends(tmp_path):
+    path = str(tmp_path / 'history.zarc')
+    append_records(path, records('a', 5) + [{'email': 'Shared@Example.com', 'body': 'first'}])
+    append_records(path, records('b', 3) + [{'email': 'shared@example.com', 'body': 'second'}])
+
+    reader = ArchiveReader(path)
+    assert len(reader) == 10
+    assert reader.block_count() == 2
+    assert reader.recipient_count() == 9
+    assert reader.get('a3@example.com')['body'] == 'a body 3'
+    assert [r['body'] for r in reader.get_all('shared@example.com')] == ['first', 'second']
+    assert reader.get('SHARED@example.com')['body'] == 'second'
+    assert 'b2@example.com' in reader and 'nobody@example.com' not in reader
+    assert [r['email'] for r in reader][:2] == ['a0@example.com', 'a1@example.com']
+
+
+def test_blocks_split_at_block_records(tmp_path):
+    path = str(tmp_path / 'history.zarc')
+    with ArchiveWriter(path, block_records=4) as writer:
+        writer.write_many(records('a', 10))
+
+    reader = ArchiveReader(path)
+    assert (len(reader), reader.block_count()) == (10, 3)
+    assert reader.get('a9@example.com')['body'] == 'a body 9'
+
+
+def test_bytes_left_by_a_crashed_writer_are_dropped(tmp_path):
+    path = str(tmp_path / 'history.zarc')
+    append_records(path, records('a', 3))
+    size = os.path.getsize(path)
+    # A writer that died before committing its index leaves an unindexed tail
+    with open(path, 'ab') as f:
+        f.write(b'partial block')
+
+    append_records(path, records('b', 2))
+    reader = ArchiveReader(path)
+    assert len(reader) == 5
+    assert [r['email'] for r in reader] == [f'a{n}@example.com' for n in range(3)] + ['b0@example.com', 'b1@example.com']
+    indexed = reader.conn.execute("SELECT SUM(length) FROM blocks").fetchone()[0]
+    assert os.path.getsize(path) == indexed > size
+
+
+def test_legacy_json_index_is_migrated(tmp_path):
+    path = str(tmp_path / 'history.zarc')
+    blocks = []
+    with open(path, 'wb') as f:
+        for batch in (records('a', 2), records('b', 2)):
+            data = zlib.compress(''.join(json.dumps(r) + '\n' for r in batch).encode('utf-8'))
+            blocks.append([f.tell(), len(data)])
+            f.write(data)
+    index = {
+        'codec': 'zlib',
+        'blocks': blocks,
+        'emails': {'a0@example.com': [0], 'a1@example.com': [0], 'b0@example.com': [1], 'b1@example.com': [1]},
+        'records': 4,
+    }
+    with open(_legacy_index_path(path), 'wb') as f:
+        f.write(zlib.compress(json.dumps(index).encode('utf-8')))
+
+    append_records(path, records('c', 1))
+
+    assert not os.path.exists(_legacy_index_path(path))
+    assert os.path.exists(_index_path(path))
+    reader = ArchiveReader(path)
+    assert reader.codec == 'zlib'
+    assert len(reader) == 5
+    assert reader.get('b1@example.com')['body'] == 'b body 1'
+    assert reader.get('c0@example.com')['body'] == 'c body 0'
+
+
+def test_concurrent_writers_keep_every_record(tmp_path):
+    path = str(tmp_path / 'history.zarc')
+    script = (
+        "import sys\n"
+        "from email_archive import append_records\n"
+        "tag = sys.argv[2]\n"
+        "for n in range(20):\n"
+        "    append_records(sys.argv[1], [{'email': f'{tag}{n}-{i}@example.com', 'body': 'x'} for i in range(5)])\n"
+    )
+    writers = [
+        subprocess.Popen([sys.executable, '-c', script, path, tag], cwd=REPO_ROOT)
+        for tag in ('p', 'q', 'r')
+    ]
+    assert [writer.wait(60) for writer in writers] == [0, 0, 0]
+
+    reader = ArchiveReader(path)
+    assert len(reader) == 300
+    assert reader.block_count() == 60
+    assert len({r['email'] for r in reader}) == 300
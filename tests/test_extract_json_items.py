@@ -0,0 +1,33 @@
+from v4_improved import _extract_json_items
+
+
+def test_bare_array():
+    assert _extract_json_items('[{"email": "a@x.com", "body": "Hi"}]') == [{"email": "a@x.com", "body": "Hi"}]
+
+
+def test_fenced_array_with_prose():
+    text = 'Here you go:\n```json\n[{"email": "a@x.com", "body": "Hi"}]\n```\nEnjoy!'
+    assert _extract_json_items(text) == [{"email": "a@x.com", "body": "Hi"}]
+
+
+def test_bracketed_prose_before_the_array():
+    text = 'Here are the [2] emails:\n[{"email": "a@x.com", "body": "Hi"}, {"email": "b@x.com", "body": "Hey"}]'
+    assert [item['email'] for item in _extract_json_items(text)] == ["a@x.com", "b@x.com"]
+
+
+def test_array_of_non_objects_is_skipped():
+    text = 'Items [1, 2, 3] follow: [{"email": "a@x.com", "body": "Hi"}]'
+    assert _extract_json_items(text) == [{"email": "a@x.com", "body": "Hi"}]
+
+
+def test_object_holding_the_array():
+    assert _extract_json_items('{"emails": [{"email": "a@x.com", "body": "Hi"}]}') == [{"email": "a@x.com", "body": "Hi"}]
+
+
+def test_truncated_array_keeps_complete_objects():
+    text = '[{"email": "a@x.com", "body": "Hi"}, {"email": "b@x.com", "bo'
+    assert _extract_json_items(text) == [{"email": "a@x.com", "body": "Hi"}]
+
+
+def test_no_json():
+    assert _extract_json_items("Sorry, I can't help with that.") == []
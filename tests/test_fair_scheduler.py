@@ -0,0 +1,84 @@
+import time
+import threading
+
+from flow_control import WeightedFairScheduler
+
+
+def test_share_splits_by_registered_weight():
+    scheduler = WeightedFairScheduler('groq')
+    scheduler.register('launch', weight=3)
+    scheduler.register('newsletter', weight=1)
+    assert scheduler.share('launch', 100) == 75
+    assert scheduler.share('newsletter', 100) == 25
+    # Flows that aren't running don't take a share
+    assert scheduler.share('other', 100) == 100
+
+    scheduler.unregister('newsletter')
+    assert scheduler.share('launch', 100) == 100
+
+
+def queue_turns(scheduler, flows):
+    """Queue one acquire() per flow while the resource is held; returns the grant order."""
+    order = []
+    threads = []
+    for flow in flows:
+        def turn(flow=flow):
+            scheduler.acquire(flow)
+            order.append(flow)
+            scheduler.release(flow)
+
+        thread = threading.Thread(target=turn)
+        thread.start()
+        threads.append(thread)
+        # Wait until this turn is queued, so every ticket is tagged in a known order
+        while scheduler.snapshot()['waiting'] < len(threads):
+            time.sleep(0.001)
+    return order, threads
+
+
+def test_turns_follow_the_weights_while_flows_compete():
+    scheduler = WeightedFairScheduler('send')
+    scheduler.register('launch', weight=3)
+    scheduler.register('newsletter', weight=1)
+
+    scheduler.acquire('gate')
+    order, threads = queue_turns(scheduler, ['launch'] * 6 + ['newsletter'] * 6)
+    scheduler.release('gate')
+    for thread in threads:
+        thread.join(5)
+
+    assert order[:8] == ['launch', 'newsletter', 'launch', 'launch', 'launch', 'newsletter', 'launch', 'launch']
+    assert scheduler.grants == {'gate': 1, 'launch': 6, 'newsletter': 6}
+
+
+def test_an_idle_flow_earns_no_credit():
+    scheduler = WeightedFairScheduler('send')
+    for _ in range(5):
+        scheduler.acquire('busy')
+        scheduler.release('busy')
+
+    scheduler.acquire('gate')
+    order, threads = queue_turns(scheduler, ['busy', 'busy', 'late', 'late', 'late'])
+    scheduler.release('gate')
+    for thread in threads:
+        thread.join(5)
+    # The late flow is served right away and then alternates, instead of waiting out five turns
+    assert order == ['late', 'busy', 'late', 'busy', 'late']
+
+
+def test_stop_event_abandons_the_wait():
+    scheduler = WeightedFairScheduler('send')
+    scheduler.acquire('launch')
+    stop = threading.Event()
+    stop.set()
+    assert scheduler.acquire('newsletter', stop_event=stop) is False
+    assert scheduler.snapshot()['waiting'] == 0
+
+
+def test_hold_spaces_the_next_turn():
+    scheduler = WeightedFairScheduler('send')
+    scheduler.acquire('launch')
+    scheduler.release('launch', hold=0.2)
+    started = time.monotonic()
+    scheduler.acquire('launch')
+    assert time.monotonic() - started >= 0.19
@@ -0,0 +1,55 @@
+from v4_improved import append_to_message_store, get_stored_body, load_message_store, was_already_sent
+
+BODY_A = "Body written for event A"
+BODY_B = "Body written for event B"
+
+
+def test_send_for_one_event_survives_a_later_record_for_another(tmp_path):
+    path = str(tmp_path / 'store.jsonl')
+    append_to_message_store([
+        {'email': 'A@x.com', 'event': 'A', 'body': BODY_A, 'sent_status': 'sent', 'dry_run': False},
+        {'email': 'a@x.com', 'event': 'B', 'body': BODY_B, 'sent_status': 'generated'},
+    ], path)
+    store = load_message_store(path)
+
+    assert was_already_sent(store, 'a@x.com', 'A')
+    assert not was_already_sent(store, 'a@x.com', 'B')
+    assert get_stored_body(store, 'a@x.com', event='B') == BODY_B
+
+
+def test_stored_body_survives_a_send_for_another_event(tmp_path):
+    path = str(tmp_path / 'store.jsonl')
+    append_to_message_store([
+        {'email': 'a@x.com', 'event': 'A', 'body': BODY_A, 'sent_status': 'generated', 'content_hash': 'h1'},
+        {'email': 'a@x.com', 'event': 'B', 'body': BODY_B, 'sent_status': 'sent', 'dry_run': False},
+    ], path)
+    store = load_message_store(path)
+
+    assert get_stored_body(store, 'a@x.com', 'h1', 'A') == BODY_A
+    assert get_stored_body(store, 'a@x.com', 'h2', 'A') is None
+
+
+def test_latest_record_per_event_wins(tmp_path):
+    path = str(tmp_path / 'store.jsonl')
+    append_to_message_store([
+        {'email': 'a@x.com', 'event': 'A', 'body': BODY_A, 'sent_status': 'generated'},
+        {'email': 'a@x.com', 'event': 'A', 'body': BODY_A, 'sent_status': 'sent', 'dry_run': True},
+    ], path)
+    store = load_message_store(path)
+
+    assert not was_already_sent(store, 'a@x.com', 'A')
+
+
+def test_rerun_skips_a_contact_also_on_another_event_list(campaign):
+    profile = {'full_name': 'Lin Rerun', 'email': 'lin@rerun.example.com', 'company': 'Rerun Co', 'job_title': 'Engineer',
+               'industry': 'Technology', 'goal': 'Learn', 'interests': 'Testing'}
+    profiles, total = campaign.load_profiles(records=[profile])
+    stats, _ = campaign.run_campaign(profiles, total)
+    assert stats['sent'] == 1
+
+    # The same contact gets a body for another event in between
+    append_to_message_store([{'email': profile['email'], 'event': 'Other Event', 'body': BODY_B, 'sent_status': 'generated'}])
+
+    stats, _ = campaign.run_campaign(profiles, total)
+    assert (stats['already_sent'], stats['sent']) == (1, 0)
+    assert stats['outcomes'][profile['email']] == 'already_sent'
@@ -0,0 +1,71 @@
+import pickle
+import threading
+
+import pytest
+
+import quota_ledger
+from quota_ledger import (QuotaExhaustedError, confirm_quota, release_quota, remaining_quota,
+                          reserve_quota)
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setitem(quota_ledger.QUOTA_LIMITS, 'groq', {'day': 25, 'month': 0})
+    return str(tmp_path / 'quota.db')
+
+
+def test_concurrent_reservations_never_exceed_the_limit(ledger):
+    reserve_quota('groq', path=ledger)  # create the database before the threads race
+    granted, refused = [], []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(10):
+            try:
+                reservation = reserve_quota('groq', path=ledger)
+            except QuotaExhaustedError:
+                outcome = refused
+            else:
+                confirm_quota(reservation, path=ledger)
+                outcome = granted
+            with lock:
+                outcome.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert (len(granted), len(refused)) == (24, 56)
+    assert remaining_quota('groq', path=ledger) == 0
+
+
+def test_released_and_expired_reservations_free_their_units(ledger, monkeypatch):
+    reservations = [reserve_quota('groq', path=ledger) for _ in range(25)]
+    with pytest.raises(QuotaExhaustedError, match='groq daily quota of 25 exhausted'):
+        reserve_quota('groq', path=ledger)
+
+    release_quota(reservations[0], path=ledger)
+    assert remaining_quota('groq', path=ledger) == 1
+    # Releasing a confirmed unit does nothing: the call went out
+    confirm_quota(reservations[1], path=ledger)
+    release_quota(reservations[1], path=ledger)
+    assert remaining_quota('groq', path=ledger) == 1
+
+    # A crashed process's reservations expire after the TTL
+    monkeypatch.setattr(quota_ledger, 'QUOTA_RESERVATION_TTL', 0)
+    reserve_quota('groq', path=ledger)
+    assert remaining_quota('groq', path=ledger) == 1
+
+
+def test_providers_without_limits_are_not_recorded(ledger, monkeypatch):
+    monkeypatch.setitem(quota_ledger.QUOTA_LIMITS, 'resend', {'day': 0, 'month': 0})
+    assert reserve_quota('resend', path=ledger) is None
+    assert remaining_quota('resend', path=ledger) is None
+
+
+def test_quota_error_survives_pickling():
+    error = pickle.loads(pickle.dumps(QuotaExhaustedError('resend', 'month', 3000)))
+    assert (error.provider, error.window, error.limit) == ('resend', 'month', 3000)
+    assert str(error) == 'resend monthly quota of 3000 exhausted'
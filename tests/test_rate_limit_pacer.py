@@ -0,0 +1,71 @@
+import pytest
+
+from flow_control import RateLimitPacer, parse_reset_duration
+
+
+@pytest.mark.parametrize('value, seconds', [
+    ('2m59.56s', 179.56),
+    ('7.66s', 7.66),
+    ('120ms', 0.12),
+    ('1h2m', 3720.0),
+    ('30', 30.0),
+    ('soon', None),
+    (None, None),
+])
+def test_parse_reset_duration(value, seconds):
+    if seconds is None:
+        assert parse_reset_duration(value) is None
+    else:
+        assert parse_reset_duration(value) == pytest.approx(seconds)
+
+
+def test_calls_are_spread_evenly_until_the_reset(clock):
+    pacer = RateLimitPacer(burst=0.1)
+    # 10 requests left, refilled in 10s: one call per second, with 1s of burst allowed
+    pacer.update({'x-ratelimit-remaining-requests': '10', 'x-ratelimit-reset-requests': '10s'})
+
+    assert [pacer.schedule() for _ in range(5)] == [0, 0, 1.0, 2.0, 3.0]
+    assert pacer.waits == 3
+
+    # Time catches up with the schedule: the next call goes one interval after the last booking
+    clock.advance(4.0)
+    assert pacer.schedule() == 0
+
+
+def test_max_wait_declines_without_booking(clock):
+    pacer = RateLimitPacer(burst=0.0)
+    pacer.update({'x-ratelimit-remaining-requests': '2', 'x-ratelimit-reset-requests': '10s'})
+    assert pacer.schedule(max_wait=0) == 0
+    assert pacer.schedule(max_wait=0) is None
+    assert pacer.schedule(max_wait=0) is None
+    assert pacer.schedule() == 5.0
+
+
+def test_tokens_are_paced_by_estimated_usage(clock):
+    pacer = RateLimitPacer(burst=0.0)
+    pacer.update({'x-ratelimit-remaining-tokens': '1000', 'x-ratelimit-reset-tokens': '10s'})
+    assert pacer.schedule(estimated_tokens=100) == 0
+    # 100 of 1000 tokens per 10s: the next call waits a tenth of the window
+    assert pacer.schedule(estimated_tokens=100) == pytest.approx(1.0)
+
+
+def test_empty_window_waits_for_the_reset(clock):
+    pacer = RateLimitPacer(burst=0.1)
+    pacer.update({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '20s'})
+    assert pacer.exhausted_window() == 'requests'
+    assert pacer.schedule() == pytest.approx(20.0)
+
+
+def test_retry_after_holds_every_call(clock):
+    pacer = RateLimitPacer()
+    pacer.update({'retry-after': '5'}, rate_limited=True)
+    assert pacer.schedule() == 5.0
+    assert pacer.schedule() == 5.0
+    assert pacer.snapshot()['rate_limited'] == 1
+    clock.advance(5.0)
+    assert pacer.schedule() == 0
+
+
+def test_fixed_per_minute_cap(clock):
+    pacer = RateLimitPacer(requests_per_minute=60)
+    assert [pacer.schedule() for _ in range(3)] == [0, 1.0, 2.0]
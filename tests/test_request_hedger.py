@@ -0,0 +1,80 @@
+import threading
+
+from flow_control import RequestHedger
+
+
+def warmed_up(**kwargs):
+    """A hedger that has seen enough fast calls to hedge anything slower."""
+    hedger = RequestHedger(min_samples=3, **kwargs)
+    for _ in range(3):
+        hedger.call(lambda: 'fast')
+    return hedger
+
+
+def test_budget_grows_per_request_up_to_max_tokens():
+    hedger = RequestHedger(budget_ratio=0.25, max_tokens=2.0)
+    for n in range(4):
+        hedger.call(lambda: n)
+    assert hedger.snapshot()['hedge_budget'] == 1.0
+
+    for n in range(20):
+        hedger.call(lambda: n)
+    assert hedger.snapshot() == {'requests': 24, 'hedges': 0, 'hedge_wins': 0, 'hedge_budget': 2.0}
+
+
+def test_no_hedge_while_still_learning_latencies():
+    hedger = RequestHedger(min_samples=20, budget_ratio=1.0)
+    assert hedger.hedge_delay() is None
+    assert hedger.call(lambda: 'only') == 'only'
+    assert hedger.hedges == 0
+
+
+def test_slow_call_is_hedged_with_hedge_func():
+    hedger = warmed_up(budget_ratio=1.0)
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return 'primary'
+
+    assert hedger.call(slow, hedge_func=lambda: 'hedge') == 'hedge'
+    release.set()
+    snapshot = hedger.snapshot()
+    assert (snapshot['hedges'], snapshot['hedge_wins']) == (1, 1)
+    # Four requests earned four tokens; the hedge spent one
+    assert snapshot['hedge_budget'] == 3.0
+
+
+def test_hedge_needs_a_token():
+    hedger = warmed_up(budget_ratio=0.1)
+    release = threading.Event()
+    hedged = []
+
+    def slow():
+        release.wait(0.2)
+        return 'primary'
+
+    assert hedger.call(slow, hedge_func=lambda: hedged.append(1)) == 'primary'
+    assert hedged == [] and hedger.hedges == 0
+
+
+def test_can_hedge_vetoes_the_hedge():
+    hedger = warmed_up(budget_ratio=1.0, can_hedge=lambda: False)
+
+    def slow():
+        threading.Event().wait(0.2)
+        return 'primary'
+
+    assert hedger.call(slow, hedge_func=lambda: 'hedge') == 'primary'
+    assert hedger.hedges == 0
+
+
+def test_failed_primary_falls_back_to_the_hedge():
+    hedger = warmed_up(budget_ratio=1.0)
+
+    def failing():
+        threading.Event().wait(0.2)
+        raise RuntimeError('timeout')
+
+    assert hedger.call(failing, hedge_func=lambda: 'hedge') == 'hedge'
+    assert hedger.hedge_wins == 1
@@ -0,0 +1,56 @@
+import pytest
+
+from quota_ledger import QuotaExhaustedError
+from smtp_transport import SMTPSendError
+from v4_improved import classify_send_error
+
+
+class ResendError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+@pytest.mark.parametrize('message', [
+    "Invalid `to` field. Please use our testing email address instead.",
+    "550 5.1.1 Recipient address rejected: user unknown",
+    "The mailbox john@example.com does not exist",
+    "Recipient john@example.com does not exist",
+    "User does not exist",
+    "No such user here",
+    "Recipient domain not found",
+    "Recipient address john@gmial.com: NXDOMAIN",
+    "The address is on the suppression list",
+    "Hard bounce on previous send",
+])
+def test_dead_recipient_is_permanent(message):
+    assert classify_send_error(ResendError(message, code='422')) == 'permanent'
+
+
+@pytest.mark.parametrize('message', [
+    "Audience does not exist",
+    "The sender domain does not exist",
+    "Domain example.com does not exist",
+    "API key does not exist",
+    "Template does not exist",
+    "The example.com domain is not verified. Please verify your domain",
+    "Sending domain has no MX record",
+    "Too many requests",
+])
+def test_account_and_sender_errors_are_transient(message):
+    assert classify_send_error(ResendError(message, code='422')) == 'transient'
+
+
+@pytest.mark.parametrize('code', ['401', '403', '429', '500', '503'])
+def test_auth_rate_limit_and_server_errors_are_transient(code):
+    assert classify_send_error(ResendError("Recipient address rejected", code=code)) == 'transient'
+
+
+def test_smtp_refusals_follow_their_reply_code():
+    assert classify_send_error(SMTPSendError(550, "user unknown", permanent=True)) == 'permanent'
+    assert classify_send_error(SMTPSendError(451, "try again later", permanent=False)) == 'transient'
+
+
+def test_quota_exhaustion_is_transient():
+    assert classify_send_error(QuotaExhaustedError('resend', 'daily', 100)) == 'transient'
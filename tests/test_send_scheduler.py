@@ -0,0 +1,94 @@
+import time
+import threading
+
+import send_scheduler
+from send_scheduler import (RetryLater, ScheduledDispatcher, claim_due, finish_message, next_send_time,
+                            release_messages, schedule_counts, schedule_messages)
+
+
+def message(email, send_at):
+    return {'email': email, 'event': 'Summit', 'send_at': send_at, 'subject': 'Hi',
+            'html_body': '<p>Hi</p>', 'plain_body': 'Hi', 'record': {'email': email}}
+
+
+def test_claims_due_messages_oldest_first_and_only_once(tmp_path):
+    path = str(tmp_path / 'schedule.db')
+    now = time.time()
+    schedule_messages([message('b@example.com', now - 10), message('a@example.com', now - 20),
+                       message('later@example.com', now + 3600)], path=path)
+
+    claimed = claim_due(now=now, path=path)
+    assert [m['email'] for m in claimed] == ['a@example.com', 'b@example.com']
+    assert claimed[0]['record'] == {'email': 'a@example.com'}
+    assert claim_due(now=now, path=path) == []
+    assert next_send_time(path) == now + 3600
+
+    finish_message(claimed[0]['id'], 'sent', path=path)
+    release_messages([claimed[1]['id']], path=path)
+    assert [m['email'] for m in claim_due(now=now, path=path)] == ['b@example.com']
+    assert schedule_counts(path) == {'sent': 1, 'sending': 1, 'pending': 1}
+
+
+def test_expired_claims_go_back_to_the_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(send_scheduler, 'SCHEDULE_CLAIM_TTL', 60)
+    path = str(tmp_path / 'schedule.db')
+    now = time.time()
+    schedule_messages([message('a@example.com', now - 5), message('b@example.com', now - 1)], path=path)
+
+    (first,) = claim_due(limit=1, now=now, path=path)
+    finish_message(first['id'], 'sent', path=path)
+    claim_due(now=now, path=path)  # claimed by a dispatcher that then crashes
+
+    assert claim_due(now=now + 59, path=path) == []
+    assert [m['email'] for m in claim_due(now=now + 61, path=path)] == ['b@example.com']
+
+
+def test_concurrent_claims_never_share_a_message(tmp_path):
+    path = str(tmp_path / 'schedule.db')
+    now = time.time()
+    schedule_messages([message(f'{n}@example.com', now - n) for n in range(60)], path=path)
+    claimed = []
+    lock = threading.Lock()
+
+    def dispatcher():
+        while True:
+            batch = claim_due(limit=4, now=now, path=path)
+            if not batch:
+                return
+            with lock:
+                claimed.extend(m['id'] for m in batch)
+
+    threads = [threading.Thread(target=dispatcher) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(set(claimed)) and len(claimed) == 60
+
+
+def test_dispatcher_sends_due_messages_and_honours_retry_later(tmp_path):
+    path = str(tmp_path / 'schedule.db')
+    sent = []
+    refuse_once = ['b@example.com']
+
+    def send(message):
+        if message['email'] in refuse_once:
+            refuse_once.remove(message['email'])
+            raise RetryLater(0.1, 'quota spent')
+        sent.append(message['email'])
+        return 'sent'
+
+    dispatcher = ScheduledDispatcher(send, path=path).start()
+    try:
+        now = time.time()
+        schedule_messages([message('a@example.com', now - 2), message('b@example.com', now - 1),
+                           message('c@example.com', now + 0.3)], path=path)
+        deadline = time.time() + 5
+        while len(sent) < 3 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        dispatcher.stop(timeout=5)
+
+    assert sent == ['a@example.com', 'b@example.com', 'c@example.com']
+    assert dispatcher.counts['sent'] == 3
+    assert schedule_counts(path) == {'sent': 3}
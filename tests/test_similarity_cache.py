@@ -0,0 +1,83 @@
+from similarity_cache import SimilarityCache, adapt_body
+
+SOURCE = {'full_name': 'Ada Lovelace', 'company': 'Acme Corp', 'job_title': 'CTO'}
+TARGET = {'full_name': 'Grace Hopper', 'company': 'Navy Labs', 'job_title': 'Engineer'}
+
+
+def test_full_swap():
+    body = "Hi Ada,\n\nAs CTO of Acme Corp, Ada Lovelace would enjoy this. See you, Ms Lovelace."
+    assert adapt_body(body, SOURCE, TARGET) == (
+        "Hi Grace,\n\nAs Engineer of Navy Labs, Grace Hopper would enjoy this. See you, Ms Hopper."
+    )
+
+
+def test_shortened_company_is_rejected():
+    assert adapt_body("Hi Ada, the Acme team would love this.", SOURCE, TARGET) is None
+
+
+def test_lone_last_name_is_swapped_and_middle_names_rejected():
+    source = dict(SOURCE, full_name='Ada King Lovelace')
+    assert adapt_body("Dear Ms Lovelace, see you soon.", source, TARGET) == "Dear Ms Hopper, see you soon."
+    assert adapt_body("Dear Ada King, see you soon.", source, TARGET) is None
+
+
+def test_generic_company_words_may_remain():
+    assert adapt_body("Hi Ada, corp events are dull; this one is not.", SOURCE, TARGET) == (
+        "Hi Grace, corp events are dull; this one is not."
+    )
+
+
+def test_missing_names_are_not_adapted():
+    assert adapt_body("Hi there", dict(SOURCE, full_name=''), TARGET) is None
+    assert adapt_body("Hi Ada", SOURCE, dict(TARGET, full_name=float('nan'))) is None
+
+
+ADA = {'full_name': 'Ada Lovelace', 'email': 'ada@x.com', 'company': 'Analytical', 'job_title': 'CTO',
+       'industry': 'Technology', 'goal': 'Network with AI experts', 'interests': 'ML, Python'}
+BODY = (
+    "Hi Ada,\n\nAs CTO at Analytical you have seen how quickly machine learning moves. This year's sessions "
+    "cover production ML, Python tooling and the people problems nobody puts on slides, and the hallway "
+    "track is full of engineers comparing notes on exactly that. Analytical would fit right in, and I think "
+    "you would leave with a few new contacts worth keeping.\n\nHope to see you there, Ada!"
+)
+
+
+def similar(n):
+    return dict(ADA, full_name=f'Grace Hopper{n}', email=f'grace{n}@x.com', company=f'Navy{n}')
+
+
+def test_adapted_body_passes_near_duplicate_screening():
+    from near_duplicates import NearDuplicateIndex
+    from v4_improved import screen_generated_body
+
+    cache = SimilarityCache(threshold=0.9, max_reuse=2)
+    cache.add(ADA, BODY)
+    dedup = NearDuplicateIndex(0.7)
+    dedup.add(ADA['email'], BODY)
+
+    # Without the exemption an adaptation is a near-duplicate of its source
+    source_only = NearDuplicateIndex(0.7)
+    source_only.add(ADA['email'], BODY)
+    assert source_only.check_and_add('grace1@x.com', cache.lookup(similar(1))[0]) is not None
+
+    for n in (1, 2):
+        target = similar(n)
+        body, _, entry_id = cache.lookup(target)
+        assert screen_generated_body(target, body, dedup, cache.family(entry_id)) is None
+        assert cache.accept(entry_id, target['email'])
+
+    assert cache.lookup(similar(3)) is None
+
+
+def test_reuse_only_counts_once_accepted():
+    cache = SimilarityCache(threshold=0.9, max_reuse=1)
+    cache.add(ADA, BODY)
+
+    # Looked up but rejected (say by screening): the body is still available
+    assert cache.lookup(similar(1)) is not None
+    _, _, entry_id = cache.lookup(similar(2))
+    assert cache.accept(entry_id, 'grace2@x.com')
+
+    assert cache.lookup(similar(3)) is None
+    assert not cache.accept(entry_id, 'grace3@x.com')
+    assert cache.family(entry_id) == ['ada@x.com', 'grace2@x.com']
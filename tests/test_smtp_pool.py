@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from smtp_transport import SMTPPool, SMTPSendError, build_message
+
+PROFILES = [
+    {'full_name': f'Guest {n}', 'email': f'guest{n}@pool.example.com', 'company': f'Company {n}', 'job_title': 'Engineer',
+     'industry': 'Technology', 'goal': 'Learn', 'interests': f'Topic {n}'}
+    for n in range(12)
+]
+
+
+def message(to_email):
+    return build_message('events@example.com', to_email, 'Hello', '<p>Hello</p>', 'Hello')
+
+
+def test_pool_delivers_to_the_sink(smtp_sink):
+    pool = SMTPPool(size=4)
+    received = smtp_sink.messages
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda n: pool.send(message(f'reader{n}@example.com')), range(20)))
+    pool.close()
+
+    assert smtp_sink.messages - received == 20
+    assert pool.snapshot()['messages_sent'] == 20
+    assert pool.snapshot()['connections_opened'] <= 4
+
+
+def test_refused_recipient_is_a_permanent_error(smtp_sink):
+    pool = SMTPPool(size=1)
+    with pytest.raises(SMTPSendError) as refused:
+        pool.send(message('bounce@example.com'))
+    pool.send(message('reader@example.com'))
+    pool.close()
+
+    assert refused.value.permanent
+    assert pool.snapshot()['messages_sent'] == 1
+
+
+def test_campaign_sends_through_the_pool(campaign, smtp_sink):
+    profiles, total = campaign.load_profiles(records=PROFILES + [dict(PROFILES[0], email='bounce@pool.example.com')])
+    received = smtp_sink.messages
+
+    stats, _ = campaign.run_campaign(profiles, total)
+
+    assert (stats['sent'], stats['failed']) == (12, 1)
+    assert smtp_sink.messages - received == 12
+    assert stats['outcomes']['bounce@pool.example.com'] == 'failed'
+    assert all(stats['outcomes'][profile['email']] == 'sent' for profile in PROFILES)
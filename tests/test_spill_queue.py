@@ -0,0 +1,86 @@
+import os
+import itertools
+from queue import Empty
+
+import pytest
+
+from spill_queue import SpillQueue
+
+sequence = itertools.count()
+
+
+def item(priority, payload=None):
+    return (priority, next(sequence), payload)
+
+
+def drain(queue):
+    items = []
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except Empty:
+            return items
+
+
+def test_spills_beyond_the_high_watermark_and_cleans_up(tmp_path):
+    queue = SpillQueue(high_watermark=4, low_watermark=2, spill_dir=str(tmp_path))
+    for n in range(10):
+        queue.put(item(0, n))
+
+    assert (queue.in_memory(), queue.on_disk(), queue.qsize()) == (4, 6, 10)
+    assert [payload for _, _, payload in drain(queue)] == list(range(10))
+    assert queue.spilled_total == 6
+    assert os.listdir(tmp_path) == []
+
+
+def test_priority_order_survives_a_spill(tmp_path):
+    queue = SpillQueue(high_watermark=4, low_watermark=2, spill_dir=str(tmp_path))
+    for n in range(8):
+        queue.put(item(0, f'low{n}'))
+    # Arrives while low-priority items are on disk: kept in memory, ahead of all of them
+    queue.put(item(-100, 'urgent'))
+
+    assert queue.get_nowait()[2] == 'urgent'
+    assert sorted(payload for _, _, payload in drain(queue)) == [f'low{n}' for n in range(8)]
+
+
+def test_full_memory_evicts_its_worst_item(tmp_path):
+    queue = SpillQueue(high_watermark=3, low_watermark=1, spill_dir=str(tmp_path))
+    for priority in (5, 1, 3):
+        queue.put(item(priority))
+    queue.put(item(2))
+
+    assert queue.on_disk() == 1
+    assert [priority for priority, _, _ in drain(queue)] == [1, 2, 3, 5]
+
+
+def test_spilled_band_better_than_memory_is_read_back_first(tmp_path):
+    queue = SpillQueue(high_watermark=2, low_watermark=1, spill_dir=str(tmp_path))
+    queue.put(item(1, 'a'))
+    queue.put(item(1, 'b'))
+    queue.put(item(1, 'c'))        # spilled: band 1 on disk
+    assert queue.get_nowait()[2] == 'a'
+    queue.put(item(9, 'late'))     # worse, but memory has room
+    queue.put(item(1, 'd'))        # queues behind 'c' on disk
+
+    assert [payload for _, _, payload in drain(queue)] == ['b', 'c', 'd', 'late']
+
+
+def test_blocking_get_waits_for_spilled_items(tmp_path):
+    queue = SpillQueue(high_watermark=2, low_watermark=1, spill_dir=str(tmp_path))
+    with pytest.raises(Empty):
+        queue.get(timeout=0.01)
+    for n in range(3):
+        queue.put(item(0, n))
+    assert [queue.get(timeout=1)[2] for _ in range(3)] == [0, 1, 2]
+
+
+def test_encode_and_decode_are_applied_to_spilled_items(tmp_path):
+    queue = SpillQueue(high_watermark=2, low_watermark=1, spill_dir=str(tmp_path),
+                       encode=lambda entry: entry[:2] + (entry[2].upper(),),
+                       decode=lambda entry: entry[:2] + (entry[2] + '!',))
+    for payload in ('x', 'y', 'z'):
+        queue.put(item(0, payload))
+
+    assert [payload for _, _, payload in drain(queue)] == ['x', 'y', 'Z!']
+    queue.close()
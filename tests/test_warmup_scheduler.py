@@ -0,0 +1,66 @@
+import pytest
+
+from warmup_scheduler import carry_over_recipients
+
+
+def test_only_unreached_recipients_carry_over():
+    emails = ['sent@x.com', 'Deferred@X.com', 'failed@x.com', 'interrupted@x.com', 'capped@x.com', 'unsub@x.com']
+    outcomes = {
+        'sent@x.com': 'sent',
+        'deferred@x.com': 'deferred',
+        'failed@x.com': 'failed',
+        'interrupted@x.com': 'interrupted',
+        'capped@x.com': 'frequency_capped',
+        'unsub@x.com': 'unsubscribed',
+    }
+    assert carry_over_recipients(emails, outcomes) == ['Deferred@X.com', 'interrupted@x.com']
+
+
+def test_recipients_without_an_outcome_carry_over():
+    assert carry_over_recipients(['new@x.com', 'done@x.com'], {'done@x.com': 'scheduled'}) == ['new@x.com']
+
+
+def test_a_completed_release_carries_nothing_over():
+    outcomes = {'a@x.com': 'sent', 'b@x.com': 'already_sent', 'c@x.com': 'already_scheduled'}
+    assert carry_over_recipients(list(outcomes), outcomes) == []
+
+
+def prepare_schedule(tmp_path, sent):
+    import warmup_scheduler
+
+    csv_path = str(tmp_path / 'warmup.csv')
+    state = warmup_scheduler.load_state(csv_path)
+    state.update(day_index=1, offset=len(sent), last_release_date='2026-01-01', last_release_sent=sent,
+                 history=[{'date': '2026-01-01', 'allowance': len(sent), 'released': len(sent),
+                           'sent': len(sent), 'failed': 0, 'bounced': 0, 'failure_rate': 0.0}])
+    warmup_scheduler.save_state(csv_path, state)
+    return csv_path
+
+
+def test_late_bounces_and_complaints_halt_the_schedule(tmp_path, monkeypatch):
+    import warmup_scheduler
+    from suppression import add_suppressions
+
+    sent = [f'late{n}@warmup.example.com' for n in range(10)]
+    csv_path = prepare_schedule(tmp_path, sent)
+    add_suppressions([(sent[0], 'bounced', 'resend_webhook', None), (sent[1], 'complained', 'resend_webhook', None)])
+    monkeypatch.setattr(warmup_scheduler, 'run_campaign', lambda release: pytest.fail("released despite bounces"))
+
+    assert warmup_scheduler.release_today(csv_path) is None
+
+    state = warmup_scheduler.load_state(csv_path)
+    assert 'bounce/complaint rate 20.0%' in state['halted']
+    assert (state['history'][-1]['late_bounced'], state['history'][-1]['complained']) == (1, 1)
+
+
+def test_resume_does_not_halt_again_on_the_same_release(tmp_path):
+    import warmup_scheduler
+    from suppression import add_suppressions
+
+    sent = [f'resumed{n}@warmup.example.com' for n in range(10)]
+    csv_path = prepare_schedule(tmp_path, sent)
+    add_suppressions([(sent[0], 'bounced', 'resend_webhook', None)])
+    assert warmup_scheduler.late_failure_rate(warmup_scheduler.load_state(csv_path)) == ({'bounced': 1}, 0.1)
+
+    warmup_scheduler.main([csv_path, '--resume'])
+    assert warmup_scheduler.late_failure_rate(warmup_scheduler.load_state(csv_path)) == ({}, 0.0)
@@ -1,4 +1,5 @@
 import os
+import sys
 import pandas as pd
 from dotenv import load_dotenv
 from groq import Groq
@@ -7,8 +8,33 @@ import time
 import logging
 import re
 from datetime import datetime
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
 import random
+import json
+import hashlib
+import queue
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import signal
+import requests
+from urllib.parse import urlencode
+from progress import ProgressTracker, start_status_server, start_status_printer
+from suppression import is_suppressed, add_suppressions
+from priority import load_priority_rules, prioritize
+from near_duplicates import NearDuplicateIndex, has_placeholder
+from similarity_cache import SimilarityCache, VECTOR_FIELDS
+from email_archive import append_records
+from profile_ingest import load_profile_sources, load_profile_records
+from flow_control import AIMDLimiter, CircuitBreaker, CircuitOpenError, RequestHedger, RateLimitPacer, WeightedFairScheduler
+from spill_queue import SpillQueue
+from contact_history import capped_recipients, frequency_cap_reached, record_contacts
+from smtp_transport import SMTPPool, build_message
+from campaign_config import CampaignConfig
+from quota_ledger import QuotaExhaustedError, reserve_quota, confirm_quota, release_quota, remaining_quota
+from send_scheduler import (
+    ScheduledDispatcher, RetryLater, schedule_messages, scheduled_recipients, scheduled_send_time, validate_send_at, SEND_AT
+)
 
 # Load environment variables
 load_dotenv()
@@ -16,19 +42,179 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
 
-EVENT_NAME = os.getenv("EVENT_NAME")
-EVENT_DATE = os.getenv("EVENT_DATE")
-EVENT_LOCATION = os.getenv("EVENT_LOCATION")
+# Event, sender and capacity weight (EVENT_*, SENDER_EMAIL, UNSUBSCRIBE_BASE_URL, CAMPAIGN_WEIGHT)
+# of runs that don't pass their own CampaignConfig (see campaign_config.py)
+DEFAULT_CAMPAIGN = CampaignConfig.from_env()
 EVENT_REGISTER_URL = os.getenv("EVENT_REGISTER_URL", "https://yourdomain.com/register")
-UNSUBSCRIBE_BASE_URL = os.getenv("UNSUBSCRIBE_BASE_URL", "https://yourdomain.com/unsubscribe")
 
-SENDER_EMAIL = os.getenv("SENDER_EMAIL", "events@mariageni.se")
+# Delivery: "resend" (API) or "smtp" (pooled connections to our own relay, SMTP_* settings in smtp_transport.py)
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "resend").lower()
 RATE_LIMIT_DELAY = int(os.getenv("RATE_LIMIT_DELAY", "2"))
+# Through the SMTP pool our relay paces delivery: sends run in parallel, one per pool connection,
+# SMTP_SEND_DELAY seconds apart (RATE_LIMIT_DELAY applies to Resend only)
+SMTP_SEND_DELAY = float(os.getenv("SMTP_SEND_DELAY", "0"))
 DRY_RUN = os.getenv("DRY_RUN", "false").lower() == "true"
 
-# Initialize Groq & Resend
-groq_client = Groq(api_key=GROQ_API_KEY)
+GROQ_MODEL = "llama-3.1-8b-instant"
+
+# Message store: append-only JSONL of generated/sent messages, shared with batch_jobs.py
+MESSAGE_STORE_PATH = os.getenv("MESSAGE_STORE_PATH", "output/message_store.jsonl")
+
+# Profile sources: files, directories or glob patterns of CSV/JSON/JSONL/Parquet (comma-separated).
+# Command-line arguments take precedence.
+PROFILE_SOURCES = os.getenv("PROFILE_SOURCES", "data/4_profiles.csv")
+
+# Backup of generated emails: "csv" (one file per run) or "archive" (compressed, indexed, see email_archive.py)
+BACKUP_FORMAT = os.getenv("BACKUP_FORMAT", "csv").lower()
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", "output/email_archive.zarc")
+
+# Incremental re-runs: skip recipients already sent for this event and reuse bodies of unchanged rows
+INCREMENTAL_RUNS = os.getenv("INCREMENTAL_RUNS", "true").lower() == "true"
+
+# Batched generation: number of profiles packed into one chat completion (1 = disabled)
+GENERATION_BATCH_SIZE = max(1, int(os.getenv("GENERATION_BATCH_SIZE", "1")))
+BATCH_MAX_TOKENS = 8000
+BATCH_MIN_WORDS = 60
+BATCH_MAX_WORDS = 400
+
+# Generation backend: "groq" (hosted API) or "local" (OpenAI-compatible server, e.g. llama.cpp / ollama)
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "groq").lower()
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:8080/v1").rstrip('/')
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "llama3.1:8b")
+LOCAL_LLM_TIMEOUT = int(os.getenv("LOCAL_LLM_TIMEOUT", "300"))
+
+# Concurrent generation requests (local servers batch them continuously)
+GENERATION_WORKERS = max(1, int(os.getenv("GENERATION_WORKERS", "8" if GENERATION_BACKEND == "local" else "1")))
+
+# Adaptive concurrency (AIMD): start at GENERATION_WORKERS calls in flight, grow while latency and
+# error rate are healthy, halve on 429s / timeouts / latency spikes, never above the maximum
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+GENERATION_MAX_CONCURRENCY = max(GENERATION_WORKERS, int(os.getenv(
+    "GENERATION_MAX_CONCURRENCY", "32" if GENERATION_BACKEND == "local" else "8"
+)))
+AIMD_LATENCY_TOLERANCE = float(os.getenv("AIMD_LATENCY_TOLERANCE", "2.0"))
+AIMD_MAX_ERROR_RATE = float(os.getenv("AIMD_MAX_ERROR_RATE", "0.2"))
+GENERATION_THREADS = GENERATION_MAX_CONCURRENCY if ADAPTIVE_CONCURRENCY else GENERATION_WORKERS
+
+# Circuit breakers (one per provider): open when the failure rate over recent calls reaches
+# CIRCUIT_FAILURE_RATE, park recipients while open, probe again after CIRCUIT_OPEN_SECONDS
+# (doubling up to CIRCUIT_MAX_OPEN_SECONDS). After CIRCUIT_MAX_OUTAGE_SECONDS the run stops
+# and the remaining recipients are left for the next run.
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "300"))
+CIRCUIT_MAX_OUTAGE_SECONDS = float(os.getenv("CIRCUIT_MAX_OUTAGE_SECONDS", "3600"))
+
+# Hedged generation requests: when a completion is slower than the HEDGE_PERCENTILE of recent
+# latencies, fire one duplicate and use whichever returns first. Hedges are limited to
+# HEDGE_BUDGET (share of requests) and only fire while there is spare concurrency.
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Pace generation requests from the backend's x-ratelimit-* response headers, spreading the
+# remaining budget over the time to its reset; PACING_BURST is the share of that time requests
+# may run ahead of the even schedule. A request that would have to wait longer than
+# PACING_MAX_WAIT seconds is treated like an exhausted quota (the recipient is deferred).
+HEADER_PACING = os.getenv("HEADER_PACING", "true").lower() == "true"
+PACING_BURST = float(os.getenv("PACING_BURST", "0.1"))
+PACING_MAX_WAIT = float(os.getenv("PACING_MAX_WAIT", "120"))
+
+if GENERATION_BACKEND not in ("groq", "local"):
+    raise ValueError(f"Unknown GENERATION_BACKEND: {GENERATION_BACKEND}")
+if EMAIL_TRANSPORT not in ("resend", "smtp"):
+    raise ValueError(f"Unknown EMAIL_TRANSPORT: {EMAIL_TRANSPORT}")
+# Scheduled delivery (SEND_AT, SEND_TIMEZONE, SEND_STAGGER_MINUTES): see send_scheduler.py
+validate_send_at()
+# How long the scheduled-send dispatcher pauses when the send quota is spent
+SCHEDULE_RETRY_SECONDS = float(os.getenv("SCHEDULE_RETRY_SECONDS", "900"))
+
+# Highest-value recipients beyond this many are deferred to a later run (0 = no cap)
+MAX_RECIPIENTS = int(os.getenv("MAX_RECIPIENTS", "0"))
+
+# Near-duplicate screening of generated bodies (MinHash/LSH): Jaccard threshold (0 = off)
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.7"))
+NEAR_DUPLICATE_MAX_REGENERATIONS = int(os.getenv("NEAR_DUPLICATE_MAX_REGENERATIONS", "2"))
+
+# Reuse (adapt) an earlier body when a profile is this similar to one already generated (0 = off)
+SIMILARITY_CACHE_THRESHOLD = float(os.getenv("SIMILARITY_CACHE_THRESHOLD", "0"))
+SIMILARITY_CACHE_MAX_REUSE = int(os.getenv("SIMILARITY_CACHE_MAX_REUSE", "3"))
+
+# On SIGINT/SIGTERM, how long in-flight generation may take to finish before the run is wrapped up
+SHUTDOWN_TIMEOUT = int(os.getenv("SHUTDOWN_TIMEOUT", "30"))
+
+# Generated messages waiting to be sent: at most SEND_QUEUE_HIGH_WATERMARK are kept in memory, the
+# overflow spills to segment files in SPILL_DIR and is read back once fewer than
+# SEND_QUEUE_LOW_WATERMARK remain in memory
+SEND_QUEUE_HIGH_WATERMARK = int(os.getenv("SEND_QUEUE_HIGH_WATERMARK", "2000"))
+SEND_QUEUE_LOW_WATERMARK = int(os.getenv("SEND_QUEUE_LOW_WATERMARK", "500"))
+SPILL_DIR = os.getenv("SPILL_DIR", "output/spill")
+
+# Runs are sized to the Groq/Resend budget left in the shared quota ledger (limits: see quota_ledger.py);
+# this share of the remaining generation requests is held back for retries and regenerations
+QUOTA_PLANNING_MARGIN = float(os.getenv("QUOTA_PLANNING_MARGIN", "0.1"))
+
+# Live progress: local JSON status endpoint (0 = off) and periodic terminal status line (0 = off)
+STATUS_PORT = int(os.getenv("STATUS_PORT", "8765"))
+STATUS_LINE_INTERVAL = int(os.getenv("STATUS_LINE_INTERVAL", "10"))
+# Groq requests-per-minute allowance (free tier: 30), enforced by rate_limit_pacer and used to cap the ETA
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+
+# Initialize Groq & Resend (or the SMTP pool)
+groq_client = Groq(api_key=GROQ_API_KEY) if GENERATION_BACKEND == "groq" else None
 resend.api_key = RESEND_API_KEY
+smtp_pool = SMTPPool() if EMAIL_TRANSPORT == "smtp" else None
+SEND_CONCURRENCY = smtp_pool.size if smtp_pool is not None else 1
+
+# Shared HTTP session for the local backend, sized so every worker keeps a warm connection
+local_session = requests.Session()
+local_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=GENERATION_THREADS))
+local_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=GENERATION_THREADS))
+
+# Shared by every run in the process, so capacity learned in one run carries over to the next
+generation_limiter = AIMDLimiter(
+    initial=GENERATION_WORKERS,
+    maximum=GENERATION_MAX_CONCURRENCY,
+    latency_tolerance=AIMD_LATENCY_TOLERANCE,
+    max_error_rate=AIMD_MAX_ERROR_RATE
+) if ADAPTIVE_CONCURRENCY else None
+
+def build_circuit_breaker(provider):
+    return CircuitBreaker(
+        provider,
+        failure_rate=CIRCUIT_FAILURE_RATE,
+        min_calls=CIRCUIT_MIN_CALLS,
+        open_seconds=CIRCUIT_OPEN_SECONDS,
+        max_open_seconds=CIRCUIT_MAX_OPEN_SECONDS,
+        max_outage_seconds=CIRCUIT_MAX_OUTAGE_SECONDS
+    )
+
+
+generation_breaker = build_circuit_breaker(GENERATION_BACKEND)
+send_breaker = build_circuit_breaker(EMAIL_TRANSPORT)
+
+request_hedger = RequestHedger(
+    percentile=HEDGE_PERCENTILE,
+    budget_ratio=HEDGE_BUDGET,
+    min_samples=HEDGE_MIN_SAMPLES,
+    max_workers=GENERATION_THREADS * 2,
+    can_hedge=lambda: generation_breaker.is_closed() and (generation_limiter is None or generation_limiter.has_capacity())
+) if HEDGE_REQUESTS else None
+
+# Groq doesn't report its per-minute request limit in headers, so it is paced from GROQ_REQUESTS_PER_MINUTE
+rate_limit_pacer = RateLimitPacer(
+    burst=PACING_BURST,
+    requests_per_minute=GROQ_REQUESTS_PER_MINUTE if GENERATION_BACKEND == "groq" else 0
+) if HEADER_PACING else None
+
+# Campaigns running in one process (service.py) take turns at the next generation slot and the
+# next send, weighted by CampaignConfig.weight; their run budgets are split the same way
+generation_turns = WeightedFairScheduler('generation')
+send_turns = WeightedFairScheduler('send')
+
+# Set by SIGINT/SIGTERM: stop taking new recipients, finish in-flight work, then report
+shutdown_event = threading.Event()
 
 # Setup logging
 log_filename = f'logs/email_campaign_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
@@ -49,16 +235,27 @@ def is_valid_email(email):
     return re.match(pattern, email) is not None
 
 
+# data/unsubscribed.csv is re-read only when the file changes
+_unsubscribed_cache = {'mtime': None, 'emails': set()}
+
+
 def is_unsubscribed(email):
-    """Check if email is in unsubscribe list."""
+    """Check if email is in unsubscribe list or the suppression store (bounces, complaints)."""
+    if is_suppressed(email):
+        return True
+    
     unsubscribe_file = "data/unsubscribed.csv"
     
     if not os.path.exists(unsubscribe_file):
         return False
     
     try:
-        unsubscribed = pd.read_csv(unsubscribe_file)
-        return email in unsubscribed['email'].values
+        mtime = os.path.getmtime(unsubscribe_file)
+        if mtime != _unsubscribed_cache['mtime']:
+            unsubscribed = pd.read_csv(unsubscribe_file)
+            _unsubscribed_cache['emails'] = set(unsubscribed['email'].values)
+            _unsubscribed_cache['mtime'] = mtime
+        return email in _unsubscribed_cache['emails']
     except:
         return False
 
@@ -85,15 +282,16 @@ def validate_csv(df):
     return df[df['email'].apply(is_valid_email)]
 
 
-def get_subject_line(profile, variant=None):
+def get_subject_line(profile, variant=None, campaign=None):
     """Generate personalized subject line with A/B testing variants."""
+    event_name = (campaign or DEFAULT_CAMPAIGN).event_name
     # Get first name for personalization
     name_first = profile['full_name'].split()[0]
     
     subjects = [
-        f"{name_first}, you're invited to {EVENT_NAME}",
-        f"Personal invitation for {name_first}: {EVENT_NAME}",
-        f"{name_first} - Join us at {EVENT_NAME}"
+        f"{name_first}, you're invited to {event_name}",
+        f"Personal invitation for {name_first}: {event_name}",
+        f"{name_first} - Join us at {event_name}"
     ]
     
     if variant is None:
@@ -102,12 +300,19 @@ def get_subject_line(profile, variant=None):
     return subjects[variant], variant
 
 
-def minimal_html_wrap(text, recipient_email):
+def unsubscribe_url(recipient_email, campaign=None):
+    """Unsubscribe link for a recipient; the address is query-encoded ('+' and '&' survive)."""
+    base_url = (campaign or DEFAULT_CAMPAIGN).unsubscribe_base_url
+    separator = '&' if '?' in base_url else '?'
+    return f"{base_url}{separator}{urlencode({'email': recipient_email})}"
+
+
+def minimal_html_wrap(text, recipient_email, campaign=None):
     """
     Convert plain text to minimal HTML with unsubscribe link.
     More natural formatting to avoid promotion folder.
     """
-    unsubscribe_link = f"{UNSUBSCRIBE_BASE_URL}?email={recipient_email}"
+    unsubscribe_link = unsubscribe_url(recipient_email, campaign)
     
     # Split into paragraphs for more natural formatting
     paragraphs = text.split('\n\n')
@@ -125,9 +330,9 @@ def minimal_html_wrap(text, recipient_email):
     return html
 
 
-def generate_plain_text(text, recipient_email):
+def generate_plain_text(text, recipient_email, campaign=None):
     """Generate plain text version of email."""
-    unsubscribe_link = f"{UNSUBSCRIBE_BASE_URL}?email={recipient_email}"
+    unsubscribe_link = unsubscribe_url(recipient_email, campaign)
     
     plain = f"""{text}
 
@@ -137,25 +342,9 @@ To unsubscribe, visit: {unsubscribe_link}
     return plain
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-def generate_invitation(profile):
-    """
-    Generate a natural, human-like personalized email with retry logic.
-    Enhanced prompt for better personalization and to avoid promotion folder.
-    """
-    prompt = f"""
-You are writing a personal invitation email to a professional contact.
-
-Event: {EVENT_NAME} on {EVENT_DATE} in {EVENT_LOCATION}
-
-Recipient:
-- Name: {profile['full_name']}
-- Role: {profile['job_title']} at {profile['company']}
-- Industry: {profile['industry']}
-- Professional goal: {profile['goal']}
-- Interests: {profile['interests']}
+INVITATION_SYSTEM_PROMPT = "You write natural, personal emails that sound human and authentic, not corporate or promotional."
 
-Write a warm, personal email (140-180 words) that:
+INVITATION_GUIDELINES = """Write a warm, personal email (140-180 words) that:
 1. Opens with a personalized greeting that references their specific role, company, or interests
 2. Explains why THIS specific event would be valuable for THEM based on their goals and interests
 3. Mentions 1-2 specific aspects of the event that align with their professional interests
@@ -171,21 +360,218 @@ Do NOT include:
 - Heavy sales pitch or promotional tone
 - Your name at the end
 
-Write as if you're a real person genuinely inviting someone you know professionally.
+Write as if you're a real person genuinely inviting someone you know professionally."""
+
+
+def describe_recipient(profile):
+    """Format the recipient block shared by the single and batched prompts."""
+    return f"""- Name: {profile['full_name']}
+- Role: {profile['job_title']} at {profile['company']}
+- Industry: {profile['industry']}
+- Professional goal: {profile['goal']}
+- Interests: {profile['interests']}"""
+
+
+def describe_event(campaign=None):
+    """Format the event line shared by the single and batched prompts."""
+    campaign = campaign or DEFAULT_CAMPAIGN
+    return f"Event: {campaign.event_name} on {campaign.event_date} in {campaign.event_location}"
+
+
+def build_invitation_prompt(profile, campaign=None):
+    """Build the user prompt for a single personalized invitation."""
+    return f"""
+You are writing a personal invitation email to a professional contact.
+
+{describe_event(campaign)}
+
+Recipient:
+{describe_recipient(profile)}
+
+{INVITATION_GUIDELINES}
 """
 
+
+def is_overload_error(error):
+    """True for errors that mean the backend is over capacity: 429, 503, timeouts."""
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status in (429, 503):
+        return True
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)) or 'timeout' in type(error).__name__.lower():
+        return True
+    return 'rate limit' in str(error).lower()
+
+
+def complete_chat(messages, max_tokens, temperature, campaign=None):
+    """
+    Run one chat completion on the configured backend and return the message text.
+    With HEDGE_REQUESTS a slow provider request is duplicated once (see _dispatch_completion).
+    """
+    return _guarded_completion(messages, max_tokens, temperature, campaign)
+
+
+def _guarded_completion(messages, max_tokens, temperature, campaign=None):
+    """
+    One completion request behind the provider's circuit breaker (raises
+    CircuitOpenError without calling the backend while it is open) and, with
+    ADAPTIVE_CONCURRENCY, a slot from generation_limiter that gets the call's
+    latency and outcome back. Every request is reserved in the shared quota
+    ledger first (raises QuotaExhaustedError once the daily/monthly budget is spent)
+    and, with HEADER_PACING, waits for its slot in the rate_limit_pacer schedule.
+    Concurrent campaigns get limiter slots and pacing slots in weighted fair order.
+    """
+    campaign = campaign or DEFAULT_CAMPAIGN
+    reservation = reserve_quota(GENERATION_BACKEND)
+    try:
+        probe = generation_breaker.check()
+    except CircuitOpenError:
+        release_quota(reservation)
+        raise
+    token = None
+    try:
+        generation_turns.acquire(campaign.event_name, campaign.weight)
+        try:
+            token = generation_limiter.acquire() if generation_limiter is not None else None
+            waited = pace_request(messages, max_tokens)
+        finally:
+            generation_turns.release(campaign.event_name)
+        if waited > 0:
+            time.sleep(waited)
+    except Exception:
+        # No request was made: give back the quota unit, the limiter slot and a half-open probe
+        release_quota(reservation)
+        if token is not None:
+            generation_limiter.cancel(token)
+        if probe:
+            generation_breaker.cancel()
+        raise
+    try:
+        text = _dispatch_completion(messages, max_tokens, temperature)
+    except Exception as e:
+        confirm_quota(reservation)
+        if rate_limit_pacer is not None:
+            # A 429 carries retry-after and the current budget; hold every worker until then
+            response = getattr(e, 'response', None)
+            rate_limit_pacer.update(getattr(response, 'headers', None), rate_limited=getattr(response, 'status_code', None) == 429)
+        generation_breaker.record_failure()
+        if token is not None:
+            generation_limiter.release(token, overloaded=is_overload_error(e), failed=True, waited=waited)
+        raise
+    confirm_quota(reservation)
+    generation_breaker.record_success()
+    if token is not None:
+        # Batched prompts ask for more tokens and are expected to take proportionally longer
+        generation_limiter.release(token, work=max_tokens / 500, waited=waited)
+    return text
+
+
+def _dispatch_completion(messages, max_tokens, temperature):
+    """
+    Send the provider request. With HEDGE_REQUESTS it goes through request_hedger,
+    which times it from here - after the quota, turn, limiter and pacing waits -
+    so a request still queued for its slot is never hedged.
+    """
+    if request_hedger is None:
+        return _request_completion(messages, max_tokens, temperature)
+    return request_hedger.call(
+        lambda: _request_completion(messages, max_tokens, temperature),
+        work=max_tokens / 500,
+        hedge_func=lambda: _hedge_completion(messages, max_tokens, temperature)
+    )
+
+
+def _hedge_completion(messages, max_tokens, temperature):
+    """
+    The duplicate of a slow request: sent right away or not at all. It reserves
+    its own quota unit and only takes a pacing slot that is free now, so it never
+    queues behind the request it is meant to overtake.
+    """
+    reservation = reserve_quota(GENERATION_BACKEND)
+    if rate_limit_pacer is not None and rate_limit_pacer.schedule(estimate_tokens(messages, max_tokens), max_wait=0) is None:
+        release_quota(reservation)
+        raise RuntimeError("no free pacing slot for a hedge")
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.1-8b-instant",
+        return _request_completion(messages, max_tokens, temperature)
+    finally:
+        confirm_quota(reservation)
+
+
+def _request_completion(messages, max_tokens, temperature):
+    if GENERATION_BACKEND == "local":
+        response = local_session.post(
+            f"{LOCAL_LLM_BASE_URL}/chat/completions",
+            json={
+                "model": LOCAL_LLM_MODEL,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "temperature": temperature
+            },
+            timeout=LOCAL_LLM_TIMEOUT
+        )
+        response.raise_for_status()
+        data = response.json()
+        _observe_rate_limits(response.headers, messages, max_tokens, (data.get("usage") or {}).get("total_tokens"))
+        return data["choices"][0]["message"]["content"]
+    
+    raw = groq_client.chat.completions.with_raw_response.create(
+        model=GROQ_MODEL,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
+    response = raw.parse()
+    _observe_rate_limits(raw.headers, messages, max_tokens, getattr(getattr(response, 'usage', None), 'total_tokens', None))
+    return response.choices[0].message.content
+
+
+def pace_request(messages, max_tokens):
+    """
+    Book this request's slot in the rate_limit_pacer schedule and return the
+    seconds to wait before sending it. Raises QuotaExhaustedError if the slot is more than
+    PACING_MAX_WAIT away (the provider reports its budget spent until a later reset).
+    """
+    if rate_limit_pacer is None:
+        return 0.0
+    delay = rate_limit_pacer.schedule(estimate_tokens(messages, max_tokens), max_wait=PACING_MAX_WAIT)
+    if delay is None:
+        raise QuotaExhaustedError(GENERATION_BACKEND, rate_limit_pacer.exhausted_window() or 'rate limit')
+    return max(delay, 0.0)
+
+
+def estimate_tokens(messages, max_tokens):
+    """Rough token cost of a request (about 4 characters per prompt token, plus the completion budget)."""
+    return sum(len(message['content']) for message in messages) // 4 + max_tokens
+
+
+def _observe_rate_limits(headers, messages, max_tokens, used_tokens):
+    if rate_limit_pacer is None:
+        return
+    rate_limit_pacer.update(headers)
+    rate_limit_pacer.record_usage(estimate_tokens(messages, max_tokens), used_tokens)
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    retry=retry_if_exception(lambda e: not isinstance(e, (CircuitOpenError, QuotaExhaustedError)))
+)
+def generate_invitation(profile, campaign=None):
+    """
+    Generate a natural, human-like personalized email with retry logic.
+    Enhanced prompt for better personalization and to avoid promotion folder.
+    """
+    prompt = build_invitation_prompt(profile, campaign)
+
+    try:
+        body = complete_chat(
             messages=[
-                {"role": "system", "content": "You write natural, personal emails that sound human and authentic, not corporate or promotional."},
+                {"role": "system", "content": INVITATION_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=500,
-            temperature=0.8
-        )
-        
-        body = response.choices[0].message.content.strip()
+            temperature=0.8,
+            campaign=campaign
+        ).strip()
         logging.info(f"Email generated for {profile['full_name']}")
         return body
     
@@ -194,45 +580,642 @@ Write as if you're a real person genuinely inviting someone you know professiona
         raise
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-def send_email(to_email, subject, html_body, plain_body):
+def build_batch_prompt(profiles, campaign=None):
+    """Build one prompt asking for a JSON array of invitations, one per profile."""
+    recipients = "\n\n".join(
+        f"Recipient {n} (email: {profile['email']}):\n{describe_recipient(profile)}"
+        for n, profile in enumerate(profiles, 1)
+    )
+
+    return f"""
+You are writing personal invitation emails to {len(profiles)} different professional contacts.
+
+{describe_event(campaign)}
+
+{recipients}
+
+For EACH recipient, separately:
+{INVITATION_GUIDELINES}
+
+Every email must be written specifically for its recipient - do not reuse sentences between emails.
+
+Respond with ONLY a JSON array and no other text. The array must contain exactly one object per
+recipient, in the same order, each with two string fields:
+- "email": the recipient's email address exactly as given above
+- "body": the complete email text, using \\n for line breaks
+"""
+
+
+def _extract_json_items(text):
+    """
+    Pull a list of JSON objects out of a model response.
+    Accepts a bare array, an array wrapped in prose or ```json fences,
+    an object holding the array, or a truncated array (complete objects are kept).
+    """
+    decoder = json.JSONDecoder()
+
+    # Prose before the array may hold brackets of its own ("Here are the [2] emails:")
+    start = text.find('[')
+    while start != -1:
+        try:
+            data, _ = decoder.raw_decode(text, start)
+            if isinstance(data, list) and any(isinstance(item, dict) for item in data):
+                return data
+        except ValueError:
+            pass
+        start = text.find('[', start + 1)
+
+    stripped = text.strip()
+    if stripped.startswith('{'):
+        try:
+            data, _ = decoder.raw_decode(stripped)
+            if isinstance(data, dict):
+                for value in data.values():
+                    if isinstance(value, list):
+                        return value
+        except ValueError:
+            pass
+
+    # Fall back to scanning for individual objects (e.g. truncated output)
+    items = []
+    pos = text.find('{')
+    while pos != -1:
+        try:
+            item, end = decoder.raw_decode(text, pos)
+            items.append(item)
+            pos = text.find('{', end)
+        except ValueError:
+            pos = text.find('{', pos + 1)
+    return items
+
+
+def is_valid_generated_body(body):
+    """Reject empty, truncated or template-like bodies."""
+    if not isinstance(body, str):
+        return False
+    words = len(body.split())
+    if words < BATCH_MIN_WORDS or words > BATCH_MAX_WORDS:
+        return False
+    if re.search(r'\[[^\]]*\]', body):
+        return False
+    return True
+
+
+def parse_batch_response(text, expected_emails):
     """
-    Send email through Resend API with retry logic.
+    Parse a batched generation response into {email: body}.
+    Items with unknown emails, duplicates or invalid bodies are dropped.
+    """
+    wanted = {email.lower(): email for email in expected_emails}
+    bodies = {}
+
+    for item in _extract_json_items(text):
+        if not isinstance(item, dict):
+            continue
+        email = item.get('email')
+        body = item.get('body')
+        if not isinstance(email, str):
+            continue
+        key = email.strip().lower()
+        if key not in wanted or wanted[key] in bodies:
+            continue
+        if not is_valid_generated_body(body):
+            logging.warning(f"Discarding malformed batched body for {wanted[key]}")
+            continue
+        bodies[wanted[key]] = body.strip()
+
+    return bodies
+
+
+def generate_invitations_batch(profiles, campaign=None):
+    """
+    Generate invitations for several profiles with a single chat completion.
+    Profiles missing from (or malformed in) the batched answer are re-requested
+    individually with generate_invitation.
+
+    Returns (bodies, errors, requests): dicts keyed by email plus the number
+    of completion requests spent.
+    """
+    profiles = list(profiles)
+    emails = [profile['email'] for profile in profiles]
+    bodies = {}
+    errors = {}
+    requests_made = 0
+
+    if len(profiles) > 1:
+        try:
+            requests_made += 1
+            text = complete_chat(
+                messages=[
+                    {"role": "system", "content": INVITATION_SYSTEM_PROMPT},
+                    {"role": "user", "content": build_batch_prompt(profiles, campaign)}
+                ],
+                max_tokens=min(500 * len(profiles), BATCH_MAX_TOKENS),
+                temperature=0.8,
+                campaign=campaign
+            )
+            bodies = parse_batch_response(text, emails)
+            logging.info(f"Batched generation returned {len(bodies)}/{len(profiles)} valid emails")
+        except QuotaExhaustedError as e:
+            # Individual requests would be refused as well
+            return {}, {email: e for email in emails}, requests_made - 1
+        except Exception as e:
+            logging.error(f"Batched generation failed for {len(profiles)} profiles: {e}")
+
+    for profile in profiles:
+        if profile['email'] in bodies:
+            continue
+        if len(profiles) > 1:
+            logging.info(f"Re-requesting email for {profile['email']} individually")
+        try:
+            requests_made += 1
+            bodies[profile['email']] = generate_invitation(profile, campaign)
+        except QuotaExhaustedError as e:
+            requests_made -= 1
+            errors[profile['email']] = e
+        except Exception as e:
+            errors[profile['email']] = e
+
+    return bodies, errors, requests_made
+
+
+# Send errors that mean the address itself is dead - retrying or re-sending can never succeed.
+# Each pattern names the recipient or its mailbox, so "does not exist" about a sender
+# domain, an audience or an API key never suppresses anyone.
+PERMANENT_FAILURE_PATTERNS = [
+    r"invalid [`'\"]?to[`'\"]? (field|address)",
+    r"invalid recipient",
+    r"recipient address rejected",
+    r"(user|mailbox|recipient|address) (unknown|not found|unavailable|does not exist)",
+    r"(user|mailbox|recipient|email address) <?[\w.+-]+@[\w.-]+>? does not exist",
+    r"no such (user|mailbox|recipient)",
+    r"recipient('s)? domain (not found|does not exist|has no mx)",
+    r"(recipient|mailbox|address)\b[^;\n]{0,80}\b(nxdomain|no mx record)",
+    r"suppression list",
+    r"hard bounce",
+]
+
+
+def classify_send_error(error):
+    """
+    Classify a send failure as 'permanent' (the recipient address is dead) or
+    'transient' (network, rate limit, server or account problems worth retrying).
+    Account-level errors (bad API key, unverified sender) are transient on purpose:
+    they must never suppress the recipient.
+    """
+    if isinstance(error, (CircuitOpenError, QuotaExhaustedError)):
+        return 'transient'
+    # SMTP: a 5xx reply to RCPT TO is a dead address, a 4xx reply is temporary
+    permanent = getattr(error, 'permanent', None)
+    if permanent is not None:
+        return 'permanent' if permanent else 'transient'
+    
+    message = str(getattr(error, 'message', None) or error).lower()
+    code = str(getattr(error, 'code', '') or '')
+    
+    # Auth, rate limit and server errors say nothing about the recipient
+    if code in ('401', '403', '429') or code.startswith('5'):
+        return 'transient'
+    if 'from' in message and ('domain' in message or 'verify' in message):
+        return 'transient'
+    
+    for pattern in PERMANENT_FAILURE_PATTERNS:
+        if re.search(pattern, message):
+            return 'permanent'
+    return 'transient'
+
+
+def is_transient_send_error(error):
+    """
+    Retry predicate for send_email: only transient failures are retried (not
+    while the circuit is open or the send quota is spent).
+    """
+    return not isinstance(error, (CircuitOpenError, QuotaExhaustedError)) and classify_send_error(error) == 'transient'
+
+
+def suppress_permanent_failure(email, error):
+    """Record a permanently failed address so future runs skip it before generation."""
+    add_suppressions([(email, 'hard_bounce', 'send_error', str(error)[:500])])
+    logging.warning(f"Permanent failure for {email} - added to suppression store")
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    retry=retry_if_exception(is_transient_send_error),
+    reraise=True
+)
+def send_email(to_email, subject, html_body, plain_body, campaign=None):
+    """
+    Send email through the Resend API (or the SMTP pool, EMAIL_TRANSPORT=smtp) with retry logic.
     Includes both HTML and plain text versions, plus List-Unsubscribe header.
+    The sender and unsubscribe link come from the campaign (default: DEFAULT_CAMPAIGN).
     """
+    campaign = campaign or DEFAULT_CAMPAIGN
     if DRY_RUN:
         logging.info(f"[DRY RUN] Would send email to: {to_email}")
         logging.info(f"[DRY RUN] Subject: {subject}")
         return True
     
+    reservation = reserve_quota(EMAIL_TRANSPORT)
     try:
-        # Extract unsubscribe URL from plain body
-        unsubscribe_url = f"{UNSUBSCRIBE_BASE_URL}?email={to_email}"
+        send_breaker.check()
+    except CircuitOpenError:
+        release_quota(reservation)
+        raise
+    try:
+        headers = {
+            "List-Unsubscribe": f"<{unsubscribe_url(to_email, campaign)}>",
+            "List-Unsubscribe-Post": "List-Unsubscribe=One-Click"
+        }
         
-        resend.Emails.send({
-            "from": SENDER_EMAIL,
-            "to": to_email,
-            "subject": subject,
-            "html": html_body,
-            "text": plain_body,
-            "reply_to": SENDER_EMAIL,
-            "headers": {
-                "List-Unsubscribe": f"<{unsubscribe_url}>",
-                "List-Unsubscribe-Post": "List-Unsubscribe=One-Click"
-            }
-        })
+        if smtp_pool is not None:
+            smtp_pool.send(build_message(
+                campaign.sender_email, to_email, subject, html_body, plain_body,
+                reply_to=campaign.sender_email, headers=headers
+            ))
+        else:
+            resend.Emails.send({
+                "from": campaign.sender_email,
+                "to": to_email,
+                "subject": subject,
+                "html": html_body,
+                "text": plain_body,
+                "reply_to": campaign.sender_email,
+                "headers": headers
+            })
+        confirm_quota(reservation)
+        send_breaker.record_success()
         logging.info(f"Email sent successfully to: {to_email}")
         return True
     
     except Exception as e:
+        confirm_quota(reservation)
+        # A dead recipient address says nothing about Resend's health
+        if classify_send_error(e) == 'permanent':
+            send_breaker.record_success()
+        else:
+            send_breaker.record_failure()
         logging.error(f"Failed to send email to {to_email}: {e}")
         raise
 
 
+def dispatch_scheduled_message(message):
+    """
+    Deliver one message from the send schedule (see send_scheduler.py).
+    Suppressions and frequency caps are checked again, since they may have
+    changed since the message was scheduled. Returns 'sent' or 'skipped'. A
+    failed send raises. RetryLater hands the message back while the send
+    quota is spent or the circuit is open.
+    """
+    email = message['email']
+    if is_unsubscribed(email):
+        logging.info(f"Dropping scheduled send to {email} - unsubscribed or suppressed")
+        return 'skipped'
+    rule = frequency_cap_reached(email)
+    if rule:
+        logging.info(f"Dropping scheduled send to {email} - frequency cap reached ({rule})")
+        return 'skipped'
+    
+    record = message['record'] or {'email': email, 'event': message['event']}
+    campaign = CampaignConfig.from_dict(message['campaign'], DEFAULT_CAMPAIGN) if message.get('campaign') else DEFAULT_CAMPAIGN
+    send_turns.acquire(campaign.event_name, campaign.weight)
+    try:
+        send_email(email, message['subject'], message['html_body'], message['plain_body'], campaign)
+    except QuotaExhaustedError as e:
+        raise RetryLater(SCHEDULE_RETRY_SECONDS, str(e))
+    except Exception as e:
+        if isinstance(e, CircuitOpenError) or (classify_send_error(e) == 'transient' and not send_breaker.is_closed()):
+            raise RetryLater(max(send_breaker.snapshot()['retry_in_seconds'], 5.0), str(e))
+        failure_type = classify_send_error(e)
+        if failure_type == 'permanent':
+            suppress_permanent_failure(email, e)
+        append_to_message_store([dict(
+            record, timestamp=datetime.now().isoformat(), sent_status='failed',
+            error_message=str(e), failure_type=failure_type
+        )])
+        raise
+    finally:
+        send_turns.release(campaign.event_name, hold=send_spacing())
+    
+    record_contacts([(email, message['event'], None)])
+    append_to_message_store([dict(record, timestamp=datetime.now().isoformat(), sent_status='sent')])
+    return 'sent'
+
+
+def start_scheduled_dispatcher():
+    """
+    Deliver scheduled messages as they fall due, in a background thread.
+    Returns the ScheduledDispatcher (stop() it on shutdown), or None in dry-run
+    mode, which leaves the schedule untouched.
+    """
+    if DRY_RUN:
+        logging.warning("Dry run mode: scheduled messages are not dispatched")
+        return None
+    # Spacing between sends comes from send_turns, shared with running campaigns
+    return ScheduledDispatcher(dispatch_scheduled_message).start()
+
+
+def send_spacing():
+    """
+    Pause before the process's next send: RATE_LIMIT_DELAY plus up to 3s of
+    jitter (more human-like) through Resend, SMTP_SEND_DELAY through the SMTP pool.
+    """
+    if smtp_pool is not None:
+        return SMTP_SEND_DELAY
+    return random.uniform(RATE_LIMIT_DELAY, RATE_LIMIT_DELAY + 3)
+
+
+# Tie-breaker for priority queue items, so equal priorities keep insertion order
+_queue_sequence = itertools.count()
+
+
+def queue_item(priority, payload):
+    """Wrap a payload for a PriorityQueue (lower priority value comes out first)."""
+    return (priority, next(_queue_sequence), payload)
+
+
+def install_signal_handlers(stop_event=None):
+    """
+    Turn SIGINT/SIGTERM into a graceful shutdown request. A second signal
+    aborts immediately. Must be called from the main thread.
+    """
+    stop_event = stop_event or shutdown_event
+    
+    def handle(signum, frame):
+        if stop_event.is_set():
+            logging.warning("Second shutdown signal - aborting immediately")
+            raise KeyboardInterrupt
+        logging.warning(
+            f"Received {signal.Signals(signum).name} - accepting no new recipients, "
+            f"finishing in-flight work (up to {SHUTDOWN_TIMEOUT}s)"
+        )
+        stop_event.set()
+    
+    signal.signal(signal.SIGINT, handle)
+    signal.signal(signal.SIGTERM, handle)
+
+
+def spillable_send_item(item):
+    """
+    Prepare a send queue item for pickling to a spill segment. Generation errors
+    can hold unpicklable client objects; only their message is needed downstream.
+    Quota refusals are kept as they are, since the send loop defers those recipients.
+    """
+    priority, sequence, (profile, body, error) = item
+    if error is not None and not isinstance(error, QuotaExhaustedError):
+        error = RuntimeError(str(error))
+    return priority, sequence, (profile, body, error)
+
+
+def screen_generated_body(profile, body, dedup_index, related=()):
+    """
+    Check a freshly generated body before it is queued for sending.
+    Returns None if it is fine, otherwise the reason it should be regenerated.
+    Bodies of `related` recipients (the source of an adapted body and its other
+    adaptations) are not counted as near-duplicates.
+    """
+    if has_placeholder(body):
+        return "contains placeholders"
+    if dedup_index is not None:
+        match = dedup_index.check_and_add(profile['email'], body, ignore=related)
+        if match:
+            return f"near-duplicate of the body for {match[0]} (similarity {match[1]:.2f})"
+    return None
+
+
+def generation_worker(generation_queue, send_queue, stats, stats_lock, tracker, stop_event,
+                      dedup_index=None, reuse_cache=None, campaign=None):
+    """
+    Worker thread: take the highest-priority batch of profiles, generate their
+    bodies and hand (profile, body, error) tuples to the send stage, keeping each
+    profile's priority. Profiles close enough to an earlier one reuse its body
+    (adapted) from the similarity cache. Bodies with placeholders or too similar
+    to earlier ones are queued again for regeneration. Profiles that failed
+    because the generation provider is down are parked until its circuit allows
+    calls again, then queued again; profiles refused by the quota ledger go to
+    the send stage with their QuotaExhaustedError and are deferred. A None payload or a shutdown request stops
+    the worker (the batch in flight is always finished).
+    """
+    while not stop_event.is_set():
+        _, _, batch = generation_queue.get()
+        if batch is None:
+            break
+        
+        tracker.add_to_stage('awaiting_generation', -len(batch))
+        
+        if reuse_cache is not None:
+            to_generate = []
+            for profile in batch:
+                hit = reuse_cache.lookup(profile)
+                if hit is None:
+                    to_generate.append(profile)
+                    continue
+                body, similarity, entry_id = hit
+                source_email = reuse_cache.source_email(entry_id)
+                # Reused bodies are screened like generated ones, except against their own source
+                # and its other adaptations (bounded by max_reuse); a rejected one is generated afresh
+                reason = screen_generated_body(profile, body, dedup_index, reuse_cache.family(entry_id))
+                if not reason and not reuse_cache.accept(entry_id, profile['email']):
+                    reason = "reuse limit reached"
+                if reason:
+                    logging.info(f"Not reusing body of {source_email} for {profile['email']}: {reason}")
+                    to_generate.append(profile)
+                    continue
+                logging.info(f"Reusing body of {source_email} for {profile['email']} (similarity {similarity:.2f})")
+                with stats_lock:
+                    stats['cache_hits'] += 1
+                tracker.record('generated')
+                send_queue.put(queue_item(-profile['priority_score'], (profile, body, None)))
+            batch = to_generate
+            if not batch:
+                continue
+        
+        tracker.add_to_stage('generating', len(batch))
+        try:
+            bodies, errors, requests_made = generate_invitations_batch(batch, campaign)
+        except Exception as e:
+            logging.error(f"Generation worker failed on a batch of {len(batch)}: {e}")
+            bodies, errors, requests_made = {}, {profile['email']: e for profile in batch}, 0
+        
+        with stats_lock:
+            stats['generation_requests'] += requests_made
+        tracker.add_to_stage('generating', -len(batch))
+        
+        parked = []
+        for profile in batch:
+            body = bodies.get(profile['email'])
+            error = errors.get(profile['email'])
+            
+            # Provider outage: wait for recovery instead of failing the recipient
+            if body is None and not isinstance(error, QuotaExhaustedError) and (
+                    isinstance(error, CircuitOpenError) or not generation_breaker.is_closed()):
+                parked.append(profile)
+                continue
+            
+            if body is not None:
+                reason = screen_generated_body(profile, body, dedup_index)
+                attempts = profile.get('regeneration_attempts', 0)
+                
+                if reason and attempts < NEAR_DUPLICATE_MAX_REGENERATIONS:
+                    logging.warning(f"Regenerating email for {profile['email']}: {reason}")
+                    profile['regeneration_attempts'] = attempts + 1
+                    with stats_lock:
+                        stats['regenerated'] += 1
+                    tracker.add_to_stage('awaiting_generation', 1)
+                    generation_queue.put(queue_item(-profile['priority_score'], [profile]))
+                    continue
+                
+                if reason and has_placeholder(body):
+                    body, error = None, ValueError(f"Generated body {reason} after {attempts} regenerations")
+                elif reason:
+                    logging.warning(f"Keeping near-duplicate body for {profile['email']} after {attempts} regenerations")
+                    dedup_index.add(profile['email'], body)
+                
+                if body is not None:
+                    tracker.record('generated')
+                    if reuse_cache is not None:
+                        reuse_cache.add(profile, body)
+            
+            send_queue.put(queue_item(-profile['priority_score'], (profile, body, error)))
+        
+        if parked:
+            logging.warning(f"Parking {len(parked)} recipients while the {generation_breaker.name} circuit is open")
+            with stats_lock:
+                stats['parked'] += len(parked)
+            tracker.add_to_stage('parked', len(parked))
+            available = generation_breaker.wait_until_available(stop_event)
+            tracker.add_to_stage('parked', -len(parked))
+            tracker.add_to_stage('awaiting_generation', len(parked))
+            generation_queue.put(queue_item(-parked[0]['priority_score'], parked))
+            if not available:
+                break
+
+
+def load_message_store(path=None):
+    """
+    Load the message store as {(event, email): latest record}.
+    Later lines override earlier ones, so the last status written for a recipient
+    wins - per event, so a record for another event never hides a send for this one.
+    """
+    path = path or MESSAGE_STORE_PATH
+    records = {}
+    
+    if not os.path.exists(path):
+        return records
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping corrupt line in message store: {line[:80]}")
+                continue
+            if record.get('email'):
+                records[(record.get('event'), record['email'].lower())] = record
+    
+    return records
+
+
+# Campaigns running side by side in one process (service.py) append to the same store
+_message_store_lock = threading.Lock()
+
+
+def append_to_message_store(records, path=None):
+    """Append records (dicts with at least 'email') to the message store."""
+    path = path or MESSAGE_STORE_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    
+    with _message_store_lock, open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, default=str) + '\n')
+
+
+def profile_content_hash(profile):
+    """Hash of the profile fields that shape the generated body; changes when a row is edited."""
+    fields = ['full_name', 'email', 'company', 'job_title', 'industry', 'goal', 'interests']
+    content = '\x1f'.join(str(profile[field]).strip() for field in fields)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def message_store_record(record, profile, campaign=None):
+    """
+    Message store entry: the backup record plus the event, the profile fields
+    used for reuse and the row content hash used by incremental re-runs.
+    """
+    entry = dict(
+        record,
+        event=(campaign or DEFAULT_CAMPAIGN).event_name,
+        company=profile['company'],
+        content_hash=profile_content_hash(profile),
+        dry_run=DRY_RUN
+    )
+    for field in VECTOR_FIELDS:
+        entry[field] = profile[field]
+    return entry
+
+
+def get_stored_body(message_store, email, content_hash=None, event=None):
+    """
+    Return a reusable body for this event from the message store, if any:
+    a generated-but-unsent body (batch import, interrupted run), or - for
+    incremental re-runs - the last body of an unchanged row whose send failed
+    or was only a dry run. Bodies of rows edited since are never reused.
+    """
+    event = event or DEFAULT_CAMPAIGN.event_name
+    record = message_store.get((event, email.lower()))
+    if not record or not record.get('body'):
+        return None
+    if content_hash and record.get('content_hash') and record['content_hash'] != content_hash:
+        return None
+    if record.get('sent_status') == 'generated':
+        return record['body']
+    if INCREMENTAL_RUNS and content_hash and record.get('content_hash') == content_hash:
+        return record['body']
+    return None
+
+
+def was_already_sent(message_store, email, event=None):
+    """True if a real (not dry-run) send to this address succeeded for this event."""
+    event = event or DEFAULT_CAMPAIGN.event_name
+    record = message_store.get((event, email.lower()))
+    return bool(record and record.get('sent_status') == 'sent' and not record.get('dry_run'))
+
+
+# Guards the shared archive when several campaigns run in one process (service.py)
+_archive_lock = threading.Lock()
+
+
+def timestamped_path(prefix, extension):
+    """
+    New file '<prefix>_YYYYmmdd_HHMMSS<extension>'. The file is created here, so
+    a campaign finishing in the same second gets a numbered name instead of
+    overwriting this one.
+    """
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = f"{prefix}_{stamp}{extension}"
+    counter = 1
+    while True:
+        try:
+            with open(path, 'x'):
+                return path
+        except FileExistsError:
+            counter += 1
+            path = f"{prefix}_{stamp}_{counter}{extension}"
+
+
 def save_generated_emails(emails_data):
-    """Save generated emails to CSV as backup."""
+    """Save generated emails to CSV (or append them to the compressed archive) as backup."""
+    if BACKUP_FORMAT == 'archive':
+        with _archive_lock:
+            append_records(ARCHIVE_PATH, emails_data)
+        logging.info(f"Generated emails archived to: {ARCHIVE_PATH}")
+        return ARCHIVE_PATH
+
     os.makedirs('output', exist_ok=True)
-    filename = f'output/generated_emails_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    filename = timestamped_path('output/generated_emails', '.csv')
     
     df = pd.DataFrame(emails_data)
     df.to_csv(filename, index=False)
@@ -240,31 +1223,75 @@ def save_generated_emails(emails_data):
     return filename
 
 
-def generate_report(stats):
+def generate_report(stats, campaign=None):
     """Generate and save campaign report."""
-    success_rate = (stats['sent'] / stats['total'] * 100) if stats['total'] > 0 else 0
+    campaign = campaign or DEFAULT_CAMPAIGN
+    success_rate = ((stats['sent'] + stats['scheduled']) / stats['total'] * 100) if stats['total'] > 0 else 0
+    
+    concurrency = stats.get('concurrency')
+    if concurrency:
+        concurrency_text = (
+            f"adaptive, limit {concurrency['limit']} (peak {concurrency['peak_limit']}, "
+            f"{concurrency['increases']} increases, {concurrency['decreases']} cuts)"
+        )
+    else:
+        concurrency_text = f"fixed, {GENERATION_WORKERS} workers"
+    hedging = stats.get('hedging')
+    if hedging:
+        hedge_rate = hedging['hedges'] / hedging['requests'] * 100 if hedging['requests'] else 0
+        win_rate = hedging['hedge_wins'] / hedging['hedges'] * 100 if hedging['hedges'] else 0
+        hedging_text = (
+            f"{hedging['hedges']} of {hedging['requests']} requests ({hedge_rate:.1f}%), "
+            f"hedge won {hedging['hedge_wins']} ({win_rate:.1f}%)"
+        )
+    else:
+        hedging_text = "off"
+    pacing = stats.get('pacing')
+    if pacing:
+        pacing_text = f"{pacing['waits']} requests delayed ({pacing['wait_seconds']:.1f}s total), {pacing['rate_limited']} rate-limit responses"
+    else:
+        pacing_text = "off"
+    trips_text = ', '.join(f"{name} {count}" for name, count in stats.get('circuit_trips', {}).items()) or 'none'
+    quota_text = ', '.join(f"{name} {left}" for name, left in stats.get('quota_remaining', {}).items()) or 'unlimited'
     
     report = f"""
 ==========================================
 EMAIL CAMPAIGN REPORT
 ==========================================
 Campaign Date: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-Event: {EVENT_NAME}
+Event: {campaign.event_name} (capacity weight {campaign.weight:g})
 
 Total profiles: {stats['total']}
 Valid emails: {stats['valid']}
 Invalid emails: {stats['invalid']}
 Unsubscribed: {stats['unsubscribed']}
+Already sent (incremental skip): {stats['already_sent']}
+Already scheduled (awaiting delivery): {stats['already_scheduled']}
+Frequency capped (cross-campaign): {stats['frequency_capped']}
+Deferred (over quota cap / provider quota): {stats['deferred']}
+Not processed (interrupted): {stats['interrupted']}
 
 Successfully generated: {stats['generated']}
+Generation requests: {stats['generation_requests']} (batch size {GENERATION_BATCH_SIZE})
+Generation concurrency: {concurrency_text}
+Hedged requests: {hedging_text}
+Header pacing: {pacing_text}
+Regenerated (placeholders / near-duplicates): {stats['regenerated']}
+Reused from similarity cache: {stats['cache_hits']}
+Reused stored bodies: {stats['reused_bodies']}
 Successfully sent: {stats['sent']}
+Scheduled for later delivery: {stats['scheduled']}
 Failed: {stats['failed']}
+Permanent failures (suppressed): {stats['bounced']}
+Spilled to disk (send backlog): {stats['spilled']}
+Parked during provider outages: {stats['parked']} (circuit trips: {trips_text})
+Provider quota left: {quota_text}
 
 Success rate: {success_rate:.2f}%
 Dry run mode: {DRY_RUN}
 
 Total execution time: {stats['duration']:.2f} seconds
-Average time per email: {stats['duration']/stats['valid']:.2f} seconds
+Average time per email: {stats['duration']/max(stats['valid'], 1):.2f} seconds
 ==========================================
 """
     
@@ -272,7 +1299,7 @@ Average time per email: {stats['duration']/stats['valid']:.2f} seconds
     
     # Save report
     os.makedirs('reports', exist_ok=True)
-    report_filename = f'reports/campaign_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
+    report_filename = timestamped_path('reports/campaign', '.txt')
     with open(report_filename, 'w') as f:
         f.write(report)
     
@@ -280,64 +1307,417 @@ Average time per email: {stats['duration']/stats['valid']:.2f} seconds
     return report
 
 
-def main():
-    start_time = time.time()
+def load_profiles(sources=None, records=None):
+    """
+    Load and validate profiles from one or more files, directories or glob
+    patterns (see profile_ingest.py), or from a list of profile dicts.
+    Returns (valid profiles, total row count).
+    """
+    if records is not None:
+        logging.info(f"Loading {len(records)} profiles from the request")
+        profiles, total = load_profile_records(records)
+    else:
+        logging.info(f"Loading profiles from: {sources}")
+        profiles, total = load_profile_sources(sources)
+    logging.info(f"Loaded {total} profiles")
     
-    csv_path = "data/4_profiles.csv"
-    logging.info(f"Starting email campaign: {EVENT_NAME}")
-    logging.info(f"Loading profiles from: {csv_path}")
-    logging.info(f"Dry run mode: {DRY_RUN}")
+    profiles = validate_csv(profiles)
+    logging.info(f"Validated {len(profiles)} profiles with valid emails")
+    
+    return profiles, total
+
+
+# What run_campaign decided per recipient; 'deferred' and 'interrupted' were never reached
+RECIPIENT_OUTCOMES = (
+    'unsubscribed', 'already_sent', 'already_scheduled', 'frequency_capped',
+    'sent', 'scheduled', 'failed', 'deferred', 'interrupted'
+)
+
+
+def run_campaign(profiles, total=None, stop_event=None, on_tracker=None, campaign=None):
+    """
+    Generate and send invitations for already-validated profiles, then save the
+    backup and report. Returns (stats, generated_emails_data); stats['outcomes']
+    maps each recipient's lowercased address to what the run decided for it
+    (see RECIPIENT_OUTCOMES).
+    
+    Setting stop_event (by default the module shutdown_event, set by the signal
+    handlers) stops the run gracefully: no new recipients are started, in-flight
+    generation gets SHUTDOWN_TIMEOUT seconds to finish and its bodies are kept in
+    the message store for the next run, and the backup and report still cover
+    the partial work.
+    
+    on_tracker, if given, receives the run's ProgressTracker as soon as it exists;
+    the caller then reports progress itself (no status endpoint or status line).
     
-    # Load and validate CSV
+    campaign (default: DEFAULT_CAMPAIGN, from .env) sets the event and sender.
+    While several campaigns run in this process, they share generation and
+    send capacity, and the planned quota budgets, by campaign.weight.
+    """
+    campaign = campaign or DEFAULT_CAMPAIGN
+    for turns in (generation_turns, send_turns):
+        turns.register(campaign.event_name, campaign.weight)
     try:
-        profiles = pd.read_csv(csv_path)
-        logging.info(f"Loaded {len(profiles)} profiles")
-        
-        profiles = validate_csv(profiles)
-        logging.info(f"Validated {len(profiles)} profiles with valid emails")
+        return _run_campaign(profiles, total, stop_event, on_tracker, campaign)
+    finally:
+        for turns in (generation_turns, send_turns):
+            turns.unregister(campaign.event_name)
+
+
+def _run_campaign(profiles, total, stop_event, on_tracker, campaign):
+    start_time = time.time()
+    stop_event = stop_event or shutdown_event
+    # Tells the generation workers to stop: set on shutdown or when a provider stays down too long
+    halt = threading.Event()
     
-    except Exception as e:
-        logging.error(f"Failed to load/validate CSV: {e}")
-        return
+    breakers = (generation_breaker, send_breaker)
+    trips_before = {breaker.name: breaker.trips for breaker in breakers}
+    hedging_before = request_hedger.snapshot() if request_hedger is not None else None
+    pacing_before = rate_limit_pacer.snapshot() if rate_limit_pacer is not None else None
+    for breaker in breakers:
+        breaker.restart_outage_clock()
+    total = len(profiles) if total is None else total
+    
+    logging.info(f"Starting email campaign: {campaign.event_name}")
+    logging.info(f"Dry run mode: {DRY_RUN}")
+    logging.info(f"Generation batch size: {GENERATION_BATCH_SIZE}")
     
     # Statistics
     stats = {
-        'total': len(pd.read_csv(csv_path)),
+        'total': total,
         'valid': len(profiles),
-        'invalid': len(pd.read_csv(csv_path)) - len(profiles),
+        'invalid': total - len(profiles),
         'unsubscribed': 0,
         'generated': 0,
         'sent': 0,
         'failed': 0,
+        'bounced': 0,
+        'deferred': 0,
+        'interrupted': 0,
+        'regenerated': 0,
+        'cache_hits': 0,
+        'already_sent': 0,
+        'reused_bodies': 0,
+        'generation_requests': 0,
+        'parked': 0,
+        'spilled': 0,
+        'frequency_capped': 0,
+        'scheduled': 0,
+        'already_scheduled': 0,
         'duration': 0
     }
+    outcomes = {}
+    
+    def decide(profile, outcome):
+        outcomes[profile['email'].strip().lower()] = outcome
     
     # Storage for generated emails
     generated_emails_data = []
     
     print(f"\nProcessing {len(profiles)} profiles...\n")
     
-    for i, profile in profiles.iterrows():
-        # Check if unsubscribed
+    # Bodies imported from an offline batch job (see batch_jobs.py) skip generation
+    message_store = load_message_store()
+    
+    # Contacts already emailed as often as FREQUENCY_CAP allows, by any campaign (see contact_history.py)
+    frequency_capped = capped_recipients()
+    
+    # Messages for this event still waiting in the send schedule (see send_scheduler.py)
+    already_scheduled = scheduled_recipients(campaign.event_name)
+    
+    # Drop unsubscribed recipients first so generation batches only hold sendable profiles
+    pending_unordered = []
+    for _, profile in profiles.iterrows():
         if is_unsubscribed(profile['email']):
             logging.info(f"Skipping {profile['email']} - unsubscribed")
             stats['unsubscribed'] += 1
+            decide(profile, 'unsubscribed')
+            continue
+        if INCREMENTAL_RUNS and was_already_sent(message_store, profile['email'], campaign.event_name):
+            stats['already_sent'] += 1
+            decide(profile, 'already_sent')
+            continue
+        if profile['email'].strip().lower() in already_scheduled:
+            stats['already_scheduled'] += 1
+            decide(profile, 'already_scheduled')
+            continue
+        rule = frequency_capped.get(profile['email'].strip().lower())
+        if rule:
+            logging.info(f"Skipping {profile['email']} - frequency cap reached ({rule})")
+            stats['frequency_capped'] += 1
+            decide(profile, 'frequency_capped')
+            continue
+        pending_unordered.append(profile)
+    if stats['already_sent']:
+        logging.info(f"Incremental run: skipping {stats['already_sent']} recipients already sent for {campaign.event_name}")
+    
+    # Most valuable recipients first; anything beyond the quota cap waits for a later run
+    priority_rules = load_priority_rules()
+    pending = []
+    for score, profile in prioritize(pending_unordered, priority_rules):
+        profile['priority_score'] = score
+        pending.append(profile)
+    
+    if MAX_RECIPIENTS and len(pending) > MAX_RECIPIENTS:
+        stats['deferred'] = len(pending) - MAX_RECIPIENTS
+        logging.info(f"Quota cap: processing top {MAX_RECIPIENTS} recipients by priority, deferring {stats['deferred']}")
+        for profile in pending[MAX_RECIPIENTS:]:
+            decide(profile, 'deferred')
+        pending = pending[:MAX_RECIPIENTS]
+    
+    # Only plan what today's and this month's remaining provider quota can cover
+    # (scheduled sends reserve their quota when they go out); campaigns running side by side
+    # split it by weight
+    send_budget = None if DRY_RUN or SEND_AT else remaining_quota(EMAIL_TRANSPORT)
+    if send_budget is not None:
+        send_budget = send_turns.share(campaign.event_name, send_budget)
+    if send_budget is not None and len(pending) > send_budget:
+        stats['deferred'] += len(pending) - send_budget
+        logging.warning(f"{EMAIL_TRANSPORT} quota: {send_budget} sends left, deferring {len(pending) - send_budget} recipients")
+        for profile in pending[send_budget:]:
+            decide(profile, 'deferred')
+        pending = pending[:send_budget]
+    generation_budget = remaining_quota(GENERATION_BACKEND)
+    if generation_budget is not None:
+        generation_budget = generation_turns.share(campaign.event_name, generation_budget)
+        generation_budget = int(generation_budget * (1 - QUOTA_PLANNING_MARGIN)) * GENERATION_BATCH_SIZE
+    
+    # Generation runs in worker threads and hands finished bodies to the send loop below;
+    # both stages pull from priority queues so high-value recipients go first
+    generation_queue = queue.PriorityQueue()
+    send_queue = SpillQueue(
+        SEND_QUEUE_HIGH_WATERMARK,
+        SEND_QUEUE_LOW_WATERMARK,
+        SPILL_DIR,
+        encode=spillable_send_item
+    )
+    stats_lock = threading.Lock()
+    
+    # New bodies are compared against everything already written for this event
+    dedup_index = None
+    if NEAR_DUPLICATE_THRESHOLD:
+        dedup_index = NearDuplicateIndex(NEAR_DUPLICATE_THRESHOLD)
+        for record in message_store.values():
+            if record.get('event') == campaign.event_name and record.get('body'):
+                dedup_index.add(record['email'], record['body'])
+    
+    # Earlier bodies for this event (with their profile fields) can be adapted to similar recipients
+    reuse_cache = None
+    if SIMILARITY_CACHE_THRESHOLD:
+        reuse_cache = SimilarityCache(SIMILARITY_CACHE_THRESHOLD, max_reuse=SIMILARITY_CACHE_MAX_REUSE)
+        for record in message_store.values():
+            if record.get('event') == campaign.event_name and record.get('body') and record.get('full_name') and record.get('company'):
+                reuse_cache.add(record, record['body'])
+    
+    to_generate = []
+    planned = []
+    for profile in pending:
+        body = get_stored_body(message_store, profile['email'], profile_content_hash(profile), campaign.event_name)
+        if body:
+            send_queue.put(queue_item(-profile['priority_score'], (profile, body, None)))
+        elif generation_budget is None or len(to_generate) < generation_budget:
+            to_generate.append(profile)
+        else:
+            # Stored bodies further down the list can still be sent
+            stats['deferred'] += 1
+            decide(profile, 'deferred')
             continue
+        planned.append(profile)
+    if len(planned) < len(pending):
+        logging.warning(
+            f"{GENERATION_BACKEND} quota: room for about {generation_budget} generations, "
+            f"deferring {len(pending) - len(planned)} recipients"
+        )
+    pending = planned
+    stats['reused_bodies'] = len(pending) - len(to_generate)
+    if stats['reused_bodies']:
+        logging.info(f"Using {stats['reused_bodies']} stored bodies from {MESSAGE_STORE_PATH}")
+    
+    # Live progress from measured throughput, capped by the known rate limits
+    tracker = ProgressTracker(len(pending))
+    tracker.add_to_stage('awaiting_generation', len(to_generate))
+    tracker.watch('send_queue', send_queue.in_memory)
+    tracker.watch('send_queue_spilled', send_queue.on_disk)
+    if generation_limiter is not None:
+        tracker.watch('generation_limit', lambda: generation_limiter.snapshot()['limit'])
+        tracker.watch('generation_in_flight', lambda: generation_limiter.in_flight)
+    if request_hedger is not None:
+        tracker.watch('hedged_requests', lambda: request_hedger.snapshot()['hedges'])
+    if rate_limit_pacer is not None:
+        tracker.watch('rate_limit_remaining', lambda: {
+            key: value for key, value in rate_limit_pacer.snapshot().items() if key.startswith('remaining_')
+        })
+    tracker.watch('circuits', lambda: {breaker.name: breaker.snapshot()['state'] for breaker in breakers})
+    if smtp_pool is None:
+        tracker.set_ceiling('send_delay', 60.0 / (RATE_LIMIT_DELAY + 1.5))
+    elif SMTP_SEND_DELAY:
+        tracker.set_ceiling('send_delay', 60.0 / SMTP_SEND_DELAY)
+    if GENERATION_BACKEND == "groq":
+        tracker.set_ceiling('groq_rpm', GROQ_REQUESTS_PER_MINUTE * GENERATION_BATCH_SIZE)
+    
+    status_server = None
+    status_stop = threading.Event()
+    if on_tracker is not None:
+        on_tracker(tracker)
+    else:
+        status_server = start_status_server(tracker, STATUS_PORT) if STATUS_PORT else None
+        if STATUS_LINE_INTERVAL:
+            start_status_printer(tracker, STATUS_LINE_INTERVAL, status_stop)
+    
+    # One completion per batch when batching is enabled
+    for batch_start in range(0, len(to_generate), GENERATION_BATCH_SIZE):
+        batch = to_generate[batch_start:batch_start + GENERATION_BATCH_SIZE]
+        generation_queue.put(queue_item(-batch[0]['priority_score'], batch))
+    
+    workers = []
+    for _ in range(GENERATION_THREADS):
+        generation_queue.put(queue_item(float('inf'), None))
+        worker = threading.Thread(
+            target=generation_worker,
+            args=(generation_queue, send_queue, stats, stats_lock, tracker, halt, dedup_index, reuse_cache, campaign),
+            daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+    if generation_limiter is not None:
+        logging.info(
+            f"Started {GENERATION_THREADS} generation workers ({GENERATION_BACKEND} backend), "
+            f"adaptive concurrency limit {generation_limiter.snapshot()['limit']}"
+        )
+    else:
+        logging.info(f"Started {GENERATION_THREADS} generation workers ({GENERATION_BACKEND} backend)")
+    
+    # Sends go out one at a time (Resend) or, through the SMTP pool, up to one per pool
+    # connection; a send in flight may still put its recipient back into send_queue
+    send_pool = ThreadPoolExecutor(max_workers=SEND_CONCURRENCY, thread_name_prefix='send') if SEND_CONCURRENCY > 1 else None
+    send_slots = threading.Semaphore(SEND_CONCURRENCY)
+    stop_sending = threading.Event()
+    processed = 0
+    sending = 0
+    
+    def deliver(profile, body, subject, html_body, plain_body, email_record):
+        """Send one message and account for it. Returns 'sent', 'failed', 'parked' or 'stopped'."""
+        nonlocal processed
+        try:
+            send_email(profile['email'], subject, html_body, plain_body, campaign)
+            if not DRY_RUN:
+                record_contacts([(profile['email'], campaign.event_name, None)])
         
-        print(f"[{i+1}/{len(profiles)}] Processing {profile['full_name']} ({profile['email']})")
+        except QuotaExhaustedError as e:
+            # Send budget spent mid-run: stop here and keep the remaining bodies for the next run
+            with stats_lock:
+                processed -= 1
+            send_queue.put(queue_item(-profile['priority_score'], (profile, body, None)))
+            logging.error(f"Stopping: {e}")
+            print(f"   Stopped: {e}")
+            return 'stopped'
         
-        try:
-            # Generate email body
-            body = generate_invitation(profile)
+        except Exception as e:
+            # Send provider outage: put the recipient back instead of failing it
+            if isinstance(e, CircuitOpenError) or (classify_send_error(e) == 'transient' and not send_breaker.is_closed()):
+                with stats_lock:
+                    processed -= 1
+                    stats['parked'] += 1
+                send_queue.put(queue_item(-profile['priority_score'], (profile, body, None)))
+                print(f"   Parked: {e}")
+                return 'parked'
+            
+            email_record['sent_status'] = 'failed'
+            email_record['error_message'] = str(e)
+            email_record['failure_type'] = classify_send_error(e)
+            with stats_lock:
+                stats['failed'] += 1
+                if email_record['failure_type'] == 'permanent':
+                    stats['bounced'] += 1
+            if email_record['failure_type'] == 'permanent':
+                suppress_permanent_failure(profile['email'], e)
+            decide(profile, 'failed')
+            tracker.record('failed')
+            print(f"   Failed: {e}")
+        
+        else:
+            with stats_lock:
+                stats['sent'] += 1
+            decide(profile, 'sent')
+            tracker.record('sent')
+            email_record['sent_status'] = 'sent'
+            print(f"   Success: Email sent")
+        
+        with stats_lock:
             stats['generated'] += 1
+        generated_emails_data.append(email_record)
+        append_to_message_store([message_store_record(email_record, profile, campaign)])
+        return email_record['sent_status']
+    
+    def deliver_in_pool(*message):
+        nonlocal sending
+        try:
+            if deliver(*message) == 'stopped':
+                stop_sending.set()
+        except Exception:
+            logging.exception(f"Send of {message[0]['email']} failed unexpectedly")
+        finally:
+            with stats_lock:
+                sending -= 1
+            send_slots.release()
+    
+    while (processed < len(pending) or sending) and not stop_event.is_set() and not stop_sending.is_set():
+        exhausted = [breaker.name for breaker in breakers if breaker.exhausted()]
+        if exhausted:
+            logging.error(
+                f"{', '.join(exhausted)} unavailable for over {CIRCUIT_MAX_OUTAGE_SECONDS:.0f}s - "
+                f"stopping; remaining recipients are left for the next run"
+            )
+            break
+        
+        try:
+            _, _, (profile, body, generation_error) = send_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        with stats_lock:
+            i = processed
+            processed += 1
+        print(f"[{i+1}/{len(pending)}] Processing {profile['full_name']} ({profile['email']})")
+        
+        # Suppressions arriving from the webhook receiver mid-run still stop the send
+        if is_suppressed(profile['email']):
+            logging.info(f"Skipping {profile['email']} - suppressed during the run")
+            with stats_lock:
+                stats['unsubscribed'] += 1
+            decide(profile, 'unsubscribed')
+            tracker.record('skipped')
+            continue
+        
+        # Another campaign may have reached this contact since the run started
+        rule = frequency_cap_reached(profile['email'])
+        if rule:
+            logging.info(f"Skipping {profile['email']} - frequency cap reached during the run ({rule})")
+            with stats_lock:
+                stats['frequency_capped'] += 1
+            decide(profile, 'frequency_capped')
+            tracker.record('skipped')
+            continue
+        
+        # Generation budget spent (possibly by another process): leave the recipient for a later run
+        if isinstance(generation_error, QuotaExhaustedError):
+            logging.warning(f"Deferring {profile['email']}: {generation_error}")
+            with stats_lock:
+                stats['deferred'] += 1
+            decide(profile, 'deferred')
+            tracker.record('skipped')
+            continue
+        
+        try:
+            if generation_error is not None:
+                raise generation_error
             
             # Generate personalized subject with A/B testing
-            subject, variant = get_subject_line(profile)
+            subject, variant = get_subject_line(profile, campaign=campaign)
             logging.info(f"Using subject variant {variant} for {profile['email']}: {subject}")
             
             # Create both HTML and plain text versions
-            html_body = minimal_html_wrap(body, profile['email'])
-            plain_body = generate_plain_text(body, profile['email'])
+            html_body = minimal_html_wrap(body, profile['email'], campaign)
+            plain_body = generate_plain_text(body, profile['email'], campaign)
             
             # Store generated email
             email_record = {
@@ -348,33 +1728,73 @@ def main():
                 'subject_variant': variant,
                 'body': body,
                 'sent_status': 'pending',
-                'error_message': None
+                'error_message': None,
+                'failure_type': None
             }
             
-            # Send email with both versions
-            try:
-                send_email(profile['email'], subject, html_body, plain_body)
-                stats['sent'] += 1
-                email_record['sent_status'] = 'sent'
-                print(f"   Success: Email sent")
+            # SEND_AT: hand the finished message to the send schedule instead of sending it now
+            send_at = scheduled_send_time(profile.get('timezone'), i, len(pending), campaign.event_date)
+            if send_at is not None:
+                email_record['sent_status'] = 'scheduled'
+                email_record['send_at'] = datetime.fromtimestamp(send_at).isoformat(timespec='seconds')
+                if not DRY_RUN:
+                    schedule_messages([{
+                        'email': profile['email'],
+                        'event': campaign.event_name,
+                        'send_at': send_at,
+                        'subject': subject,
+                        'html_body': html_body,
+                        'plain_body': plain_body,
+                        'record': message_store_record(dict(email_record, sent_status='sent'), profile, campaign),
+                        'campaign': campaign.to_dict()
+                    }])
+                with stats_lock:
+                    stats['scheduled'] += 1
+                    stats['generated'] += 1
+                decide(profile, 'scheduled')
+                tracker.record('scheduled')
+                generated_emails_data.append(email_record)
+                append_to_message_store([message_store_record(email_record, profile, campaign)])
+                print(f"   Scheduled for {email_record['send_at']}")
+                continue
             
-            except Exception as e:
-                stats['failed'] += 1
-                email_record['sent_status'] = 'failed'
-                email_record['error_message'] = str(e)
-                print(f"   Failed: {e}")
+            # A send provider outage holds new sends until its circuit lets calls through again
+            if not send_breaker.wait_until_available(stop_event):
+                with stats_lock:
+                    processed -= 1
+                send_queue.put(queue_item(-profile['priority_score'], (profile, body, None)))
+                continue
             
-            generated_emails_data.append(email_record)
+            # Campaigns in this process take turns at starting a send; the pause after each one is
+            # held there, so campaigns running side by side never send faster than a single run
+            send_slots.acquire()
+            if not send_turns.acquire(campaign.event_name, campaign.weight, stop_event=stop_event):
+                send_slots.release()
+                with stats_lock:
+                    processed -= 1
+                send_queue.put(queue_item(-profile['priority_score'], (profile, body, None)))
+                break
             
-            # Rate limiting with random variation (more human-like)
-            if i < len(profiles) - 1:
-                # Random delay between base delay and base delay + 3 seconds
-                delay = random.uniform(RATE_LIMIT_DELAY, RATE_LIMIT_DELAY + 3)
-                logging.info(f"Rate limiting: waiting {delay:.1f} seconds...")
-                time.sleep(delay)
+            if send_pool is None:
+                try:
+                    outcome = deliver(profile, body, subject, html_body, plain_body, email_record)
+                finally:
+                    send_slots.release()
+                    # Rate limiting with random variation (more human-like)
+                    send_turns.release(campaign.event_name, hold=send_spacing())
+                if outcome == 'stopped':
+                    break
+            else:
+                send_turns.release(campaign.event_name, hold=send_spacing())
+                with stats_lock:
+                    sending += 1
+                send_pool.submit(deliver_in_pool, profile, body, subject, html_body, plain_body, email_record)
         
         except Exception as e:
-            stats['failed'] += 1
+            with stats_lock:
+                stats['failed'] += 1
+            decide(profile, 'failed')
+            tracker.record('failed')
             logging.error(f"Error processing {profile['full_name']}: {e}")
             print(f"   Error: {e}")
             
@@ -386,26 +1806,114 @@ def main():
                 'subject_variant': None,
                 'body': None,
                 'sent_status': 'failed',
-                'error_message': str(e)
+                'error_message': str(e),
+                'failure_type': None
             })
     
+    if send_pool is not None:
+        # Sends in flight finish (or put their recipient back) before the leftovers are counted
+        send_pool.shutdown(wait=True)
+    halt.set()
+    if processed < len(pending):
+        # Graceful shutdown: let in-flight generation finish, then keep what was already paid for
+        logging.warning(f"Shutdown: waiting up to {SHUTDOWN_TIMEOUT}s for in-flight generation")
+        deadline = time.time() + SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.join(timeout=max(0, deadline - time.time()))
+        if any(worker.is_alive() for worker in workers):
+            logging.warning("Shutdown timeout reached - abandoning generation still in flight")
+        
+        kept = []
+        while True:
+            try:
+                _, _, (profile, body, generation_error) = send_queue.get_nowait()
+            except queue.Empty:
+                break
+            if body is not None:
+                kept.append((profile, {
+                    'timestamp': datetime.now().isoformat(),
+                    'full_name': profile['full_name'],
+                    'email': profile['email'],
+                    'subject': None,
+                    'subject_variant': None,
+                    'body': body,
+                    'sent_status': 'generated',
+                    'error_message': None,
+                    'failure_type': None
+                }))
+        generated_emails_data.extend(record for _, record in kept)
+        append_to_message_store([message_store_record(record, profile, campaign) for profile, record in kept])
+        
+        with stats_lock:
+            stats['interrupted'] = len(pending) - processed
+        logging.warning(
+            f"Campaign interrupted: {stats['interrupted']} recipients not sent, "
+            f"{len(kept)} generated bodies kept in {MESSAGE_STORE_PATH} for the next run"
+        )
+    else:
+        for worker in workers:
+            worker.join()
+    
+    # Whoever the send loop never got to was interrupted, kept bodies included
+    for profile in pending:
+        outcomes.setdefault(profile['email'].strip().lower(), 'interrupted')
+    # Workers abandoned at the shutdown timeout may still be counting
+    with stats_lock:
+        stats['outcomes'] = outcomes
+        stats['spilled'] = send_queue.spilled_total
+    send_queue.close()
+    
+    status_stop.set()
+    if status_server:
+        status_server.shutdown()
+    print(tracker.status_line())
+    
     # Save backup
     if generated_emails_data:
         backup_file = save_generated_emails(generated_emails_data)
         print(f"\nBackup saved: {backup_file}")
     
     # Generate report
-    stats['duration'] = time.time() - start_time
-    generate_report(stats)
+    remaining = {provider: remaining_quota(provider) for provider in (GENERATION_BACKEND, EMAIL_TRANSPORT)}
+    with stats_lock:
+        stats['duration'] = time.time() - start_time
+        if generation_limiter is not None:
+            stats['concurrency'] = generation_limiter.snapshot()
+        stats['circuit_trips'] = {breaker.name: breaker.trips - trips_before[breaker.name] for breaker in breakers}
+        if request_hedger is not None:
+            hedging = request_hedger.snapshot()
+            stats['hedging'] = {key: hedging[key] - hedging_before[key] for key in ('requests', 'hedges', 'hedge_wins')}
+        if rate_limit_pacer is not None:
+            pacing = rate_limit_pacer.snapshot()
+            stats['pacing'] = {key: pacing[key] - pacing_before[key] for key in ('waits', 'wait_seconds', 'rate_limited')}
+        stats['quota_remaining'] = {provider: left for provider, left in remaining.items() if left is not None}
+        generate_report(stats, campaign)
     
     logging.info("Campaign completed")
     
+    return stats, generated_emails_data
+
+
+def main():
+    sources = sys.argv[1:] or PROFILE_SOURCES
+    
+    # Load and validate profiles
+    try:
+        profiles, total = load_profiles(sources)
+    
+    except Exception as e:
+        logging.error(f"Failed to load/validate profiles: {e}")
+        return
+    
+    install_signal_handlers()
+    run_campaign(profiles, total)
+    
     # Print deliverability tips
     print("\n" + "="*50)
     print("DELIVERABILITY TIPS:")
     print("="*50)
     print("1. Check that all DNS records (SPF, DKIM, DMARC) are verified in Resend")
-    print("2. Start with small batches (10-20 emails) to warm up your domain")
+    print("2. Start with small batches (10-20 emails) to warm up your domain - see warmup_scheduler.py")
     print("3. Ask initial recipients to move emails from Promotions to Primary")
     print("4. Encourage recipients to reply - this improves sender reputation")
     print("5. Monitor Resend dashboard for bounce rates and spam reports")
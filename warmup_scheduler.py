@@ -0,0 +1,297 @@
+"""
+Multi-day warm-up scheduler for large campaigns.
+
+A new sending domain has to ramp up slowly. Instead of splitting the CSV by hand,
+this scheduler walks through one large profile CSV following a ramp curve
+(e.g. 20, 50, 150, 500 emails on days 1-4), then continues at a sustained daily
+cap. Its position is persisted in a state file, so each invocation releases
+exactly the allowance of the current day and never re-sends earlier recipients.
+If the failure rate of a day exceeds the threshold, the schedule halts until an
+operator resumes it. Bounces and complaints reported later by webhook (see
+webhook_server.py) count too: before each release, the previous release's
+recipients are looked up in the suppression store.
+
+Usage:
+    python warmup_scheduler.py data/big_list.csv            # release today's allowance once
+    python warmup_scheduler.py data/big_list.csv --daemon   # keep running, one release per day
+    python warmup_scheduler.py data/big_list.csv --status   # show schedule position
+    python warmup_scheduler.py data/big_list.csv --resume   # clear a halt after investigating
+"""
+import os
+import sys
+import json
+import logging
+from datetime import datetime, date, timedelta
+
+from v4_improved import (
+    DEFAULT_CAMPAIGN,
+    DRY_RUN,
+    install_signal_handlers,
+    is_unsubscribed,
+    load_profiles,
+    run_campaign,
+    shutdown_event,
+)
+from suppression import count_suppressions
+
+WARMUP_RAMP = [int(n) for n in os.getenv("WARMUP_RAMP", "20,50,150,500").split(',') if n.strip()]
+WARMUP_SUSTAINED_DAILY = int(os.getenv("WARMUP_SUSTAINED_DAILY", str(WARMUP_RAMP[-1] if WARMUP_RAMP else 500)))
+WARMUP_MAX_FAILURE_RATE = float(os.getenv("WARMUP_MAX_FAILURE_RATE", "0.05"))
+# Ignore the failure rate on days with too few sends to be meaningful
+WARMUP_MIN_SAMPLE = int(os.getenv("WARMUP_MIN_SAMPLE", "10"))
+WARMUP_STATE_DIR = os.getenv("WARMUP_STATE_DIR", "output/warmup")
+
+# Run outcomes that leave a recipient for the next release: the run never got to them
+CARRY_OVER_OUTCOMES = ('interrupted', 'deferred')
+# Suppression reasons the webhook records after a send succeeded
+LATE_FAILURE_REASONS = ('bounced', 'complained')
+
+
+def state_path_for(csv_path):
+    """State file for a campaign CSV (one schedule per CSV and event)."""
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    event = (DEFAULT_CAMPAIGN.event_name or 'event').replace(' ', '_').lower()
+    return os.path.join(WARMUP_STATE_DIR, f"{stem}_{event}.json")
+
+
+def load_state(csv_path):
+    """Load the schedule state, or start a fresh schedule."""
+    path = state_path_for(csv_path)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    return {
+        'csv_path': csv_path,
+        'event': DEFAULT_CAMPAIGN.event_name,
+        'day_index': 0,
+        'offset': 0,
+        'last_release_date': None,
+        'halted': None,
+        'carry_over': [],
+        'last_release_sent': [],
+        'history': []
+    }
+
+
+def save_state(csv_path, state):
+    """Persist state atomically so a crash never leaves a half-written file."""
+    path = state_path_for(csv_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def daily_allowance(day_index):
+    """Number of emails released on a given schedule day (0-based)."""
+    if day_index < len(WARMUP_RAMP):
+        return WARMUP_RAMP[day_index]
+    return WARMUP_SUSTAINED_DAILY
+
+
+def failure_rate(stats):
+    """Share of attempted sends that failed in one release (permanent bounces included)."""
+    attempted = stats['sent'] + stats['failed']
+    return stats['failed'] / attempted if attempted else 0.0
+
+
+def late_failure_rate(state):
+    """
+    Bounces and complaints reported by webhook for the recipients sent to in
+    the previous release, as ({reason: count}, rate). Most hard bounces and all
+    complaints arrive after the send succeeded, so the run never saw them.
+    """
+    recipients = state.get('last_release_sent') or []
+    if not recipients:
+        return {}, 0.0
+    counts = count_suppressions(recipients, LATE_FAILURE_REASONS)
+    return counts, sum(counts.values()) / len(recipients)
+
+
+def select_release(profiles, offset, allowance, carry_over=()):
+    """
+    Take the next `allowance` sendable profiles: first the recipients carried
+    over from an interrupted release, then new rows starting at `offset`.
+    Returns (selected rows, new offset). Unsubscribed rows are passed over
+    without using up the allowance.
+    """
+    carried = set(email.lower() for email in carry_over)
+    selected = [
+        index for index, email in profiles['email'].items()
+        if email.lower() in carried and not is_unsubscribed(email)
+    ][:allowance]
+    position = offset
+
+    while position < len(profiles) and len(selected) < allowance:
+        profile = profiles.iloc[position]
+        position += 1
+        if is_unsubscribed(profile['email']):
+            logging.info(f"Warm-up: skipping {profile['email']} - unsubscribed")
+            continue
+        selected.append(profile.name)
+
+    return profiles.loc[selected], position
+
+
+def carry_over_recipients(emails, outcomes):
+    """
+    Recipients of a release that go first in the next one: those the run
+    never reached. Sent, failed, scheduled, capped, unsubscribed and
+    already-sent recipients are done with, so they don't use up another day.
+    """
+    return [
+        email for email in emails
+        if outcomes.get(email.strip().lower(), 'interrupted') in CARRY_OVER_OUTCOMES
+    ]
+
+
+def release_today(csv_path):
+    """
+    Release today's allowance if it hasn't been released yet.
+    Returns the run stats, or None when nothing was sent. A dry run rehearses
+    the release without moving the schedule.
+    """
+    state = load_state(csv_path)
+    today = date.today().isoformat()
+
+    if state['halted']:
+        logging.warning(f"Warm-up halted: {state['halted']}. Run with --resume after investigating.")
+        return None
+
+    if state['last_release_date'] == today:
+        logging.info(f"Warm-up: today's allowance for {csv_path} was already released")
+        return None
+    
+    counts, late_rate = late_failure_rate(state)
+    if counts and state['history']:
+        state['history'][-1].update(late_bounced=counts.get('bounced', 0), complained=counts.get('complained', 0))
+    if len(state.get('last_release_sent') or []) >= WARMUP_MIN_SAMPLE and late_rate > WARMUP_MAX_FAILURE_RATE:
+        state['halted'] = (f"bounce/complaint rate {late_rate:.1%} reported for the {state['last_release_date']} "
+                           f"release exceeded {WARMUP_MAX_FAILURE_RATE:.1%}")
+        logging.error(f"Warm-up halted: {state['halted']}")
+        if not DRY_RUN:
+            save_state(csv_path, state)
+        return None
+
+    profiles, _ = load_profiles(csv_path)
+    profiles = profiles.reset_index(drop=True)
+
+    if state['offset'] >= len(profiles) and not state.get('carry_over'):
+        logging.info(f"Warm-up: all {len(profiles)} profiles in {csv_path} have been released")
+        return None
+
+    allowance = daily_allowance(state['day_index'])
+    release, new_offset = select_release(profiles, state['offset'], allowance, state.get('carry_over', []))
+    logging.info(f"Warm-up day {state['day_index'] + 1}: releasing {len(release)} of {allowance} allowed emails")
+
+    if DRY_RUN:
+        logging.info("Warm-up: dry run, the schedule position is not saved")
+    
+    # Record the position before sending, so an interrupted run never re-sends this slice
+    state['offset'] = new_offset
+    state['last_release_date'] = today
+    state['day_index'] += 1
+    if not DRY_RUN:
+        save_state(csv_path, state)
+
+    stats, _ = run_campaign(release)
+    
+    # Recipients not reached (interrupted run, provider quota spent) go first in the next release
+    state['carry_over'] = carry_over_recipients(release['email'], stats['outcomes'])
+    if state['carry_over']:
+        logging.warning(f"Warm-up: {len(state['carry_over'])} recipients carried over to the next release")
+    # Checked for late bounces and complaints before the next release
+    state['last_release_sent'] = [
+        email for email in release['email'] if stats['outcomes'].get(email.strip().lower()) == 'sent'
+    ]
+
+    rate = failure_rate(stats)
+    state['history'].append({
+        'date': today,
+        'allowance': allowance,
+        'released': len(release),
+        'sent': stats['sent'],
+        'failed': stats['failed'],
+        'bounced': stats['bounced'],
+        'failure_rate': round(rate, 4)
+    })
+
+    if stats['sent'] + stats['failed'] >= WARMUP_MIN_SAMPLE and rate > WARMUP_MAX_FAILURE_RATE:
+        state['halted'] = f"failure rate {rate:.1%} on {today} exceeded {WARMUP_MAX_FAILURE_RATE:.1%}"
+        logging.error(f"Warm-up halted: {state['halted']}")
+
+    if not DRY_RUN:
+        save_state(csv_path, state)
+    return stats
+
+
+def print_status(csv_path):
+    """Print where the schedule stands."""
+    state = load_state(csv_path)
+    print(f"\nWarm-up schedule for {csv_path} ({state['event']})")
+    print(f"Next day: {state['day_index'] + 1} (allowance {daily_allowance(state['day_index'])})")
+    print(f"Profiles released so far: {state['offset']}")
+    print(f"Last release: {state['last_release_date']}")
+    print(f"Halted: {state['halted'] or 'no'}")
+    for day in state['history']:
+        print(f"  {day['date']}: sent {day['sent']}/{day['released']}, bounced {day.get('bounced', 0)}, "
+              f"failure rate {day['failure_rate']:.1%}, later bounced {day.get('late_bounced', 0)}, "
+              f"complained {day.get('complained', 0)}")
+
+
+def seconds_until_tomorrow():
+    """Seconds until shortly after the next local midnight."""
+    now = datetime.now()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (tomorrow - now).total_seconds() + 60
+
+
+def run_daemon(csv_path):
+    """Release once per day until the list is exhausted or the schedule halts."""
+    while True:
+        release_today(csv_path)
+        state = load_state(csv_path)
+        if state['halted']:
+            break
+
+        profiles, _ = load_profiles(csv_path)
+        if state['offset'] >= len(profiles) and not state.get('carry_over'):
+            logging.info("Warm-up complete")
+            break
+
+        wait = seconds_until_tomorrow()
+        logging.info(f"Warm-up: next release in {wait / 3600:.1f} hours")
+        if shutdown_event.wait(wait):
+            logging.info("Warm-up daemon stopped")
+            break
+
+
+def main(argv):
+    if not argv:
+        print(__doc__)
+        return 1
+
+    csv_path = argv[0]
+    flags = set(argv[1:])
+    install_signal_handlers()
+
+    if '--status' in flags:
+        print_status(csv_path)
+    elif '--resume' in flags:
+        state = load_state(csv_path)
+        state['halted'] = None
+        # The operator has looked at the last release; don't halt on its bounces again
+        state['last_release_sent'] = []
+        save_state(csv_path, state)
+        logging.info(f"Warm-up schedule for {csv_path} resumed")
+    elif '--daemon' in flags:
+        run_daemon(csv_path)
+    else:
+        release_today(csv_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,230 @@
+"""
+Webhook receiver feeding the suppression store.
+
+Handles:
+- POST /webhooks/resend   Resend delivery events (email.bounced, email.complained,
+                          contact unsubscribes), verified with the Svix signature
+                          headers when RESEND_WEBHOOK_SECRET is set
+- POST /unsubscribe       RFC 8058 one-click unsubscribes (List-Unsubscribe-Post)
+- GET  /unsubscribe       Confirmation page for the footer unsubscribe link
+
+Requests are acknowledged immediately and queued; a writer thread commits them to
+the suppression store in batches, and running campaigns pick them up within
+SUPPRESSION_REFRESH_SECONDS. Point UNSUBSCRIBE_BASE_URL and the Resend webhook at
+this server (through your reverse proxy or tunnel).
+
+Usage:
+    python webhook_server.py
+"""
+import os
+import hmac
+import json
+import time
+import queue
+import base64
+import hashlib
+import logging
+import threading
+from html import escape
+from urllib.parse import urlparse, parse_qs, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from suppression import add_suppressions
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8787"))
+RESEND_WEBHOOK_SECRET = os.getenv("RESEND_WEBHOOK_SECRET")
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "500"))
+WEBHOOK_FLUSH_INTERVAL = float(os.getenv("WEBHOOK_FLUSH_INTERVAL", "1"))
+# Reject signed webhooks older than this (replay protection)
+SIGNATURE_TOLERANCE_SECONDS = 300
+
+UNSUBSCRIBE_PAGE = """<html>
+<body style="font-family:Arial,sans-serif;font-size:14px;color:#333;">
+<p>{message}</p>
+{form}
+</body>
+</html>"""
+
+
+def verify_svix_signature(secret, headers, body, now=None):
+    """Verify Resend's Svix webhook signature headers against the raw body."""
+    msg_id = headers.get('svix-id')
+    timestamp = headers.get('svix-timestamp')
+    signatures = headers.get('svix-signature')
+    if not (msg_id and timestamp and signatures):
+        return False
+
+    try:
+        if abs((now or time.time()) - int(timestamp)) > SIGNATURE_TOLERANCE_SECONDS:
+            return False
+        key = base64.b64decode(secret.split('_', 1)[1] if secret.startswith('whsec_') else secret)
+    except ValueError:
+        return False
+
+    signed = f"{msg_id}.{timestamp}.".encode('utf-8') + body
+    expected = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode('ascii')
+
+    for signature in signatures.split():
+        version, _, value = signature.partition(',')
+        if version == 'v1' and hmac.compare_digest(value, expected):
+            return True
+    return False
+
+
+def suppressions_from_resend_event(event):
+    """
+    Map one Resend webhook event to suppression entries (email, reason, source, detail).
+    Transient bounces and unrelated events map to nothing.
+    """
+    event_type = event.get('type', '')
+    data = event.get('data') or {}
+    recipients = data.get('to') or []
+    if isinstance(recipients, str):
+        recipients = [recipients]
+
+    if event_type == 'email.bounced':
+        bounce = data.get('bounce') or {}
+        if bounce.get('type', 'Permanent').lower() != 'permanent':
+            return []
+        detail = bounce.get('message') or bounce.get('subType')
+        return [(email, 'bounced', 'resend_webhook', detail) for email in recipients]
+
+    if event_type == 'email.complained':
+        return [(email, 'complained', 'resend_webhook', None) for email in recipients]
+
+    if event_type.endswith('unsubscribed') or (event_type == 'contact.updated' and data.get('unsubscribed')):
+        email = data.get('email')
+        return [(email, 'unsubscribed', 'resend_webhook', None)] if email else []
+
+    return []
+
+
+def suppression_writer(events, stop_event):
+    """Drain queued entries and commit them in batches until stopped."""
+    while not (stop_event.is_set() and events.empty()):
+        batch = []
+        deadline = time.time() + WEBHOOK_FLUSH_INTERVAL
+        while len(batch) < WEBHOOK_BATCH_SIZE:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(events.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        if batch:
+            try:
+                add_suppressions(batch)
+            except Exception as e:
+                logging.error(f"Failed to commit {len(batch)} suppressions, re-queueing: {e}")
+                for entry in batch:
+                    events.put(entry)
+                time.sleep(WEBHOOK_FLUSH_INTERVAL)
+
+
+def make_handler(events):
+    """Build the request handler class bound to the shared event queue."""
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def _respond(self, status, body=b'', content_type='text/plain'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _unsubscribe_email(self, url, body=b''):
+            params = parse_qs(url.query)
+            if not params.get('email') and body:
+                params = parse_qs(body.decode('utf-8', 'replace'))
+            emails = params.get('email') or []
+            return emails[0].strip() if emails else None
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/unsubscribe':
+                self._respond(404)
+                return
+
+            email = self._unsubscribe_email(url)
+            if not email:
+                self._respond(400, b'Missing email')
+                return
+
+            form = (
+                f'<form method="post" action="/unsubscribe?{escape(urlencode({"email": email}))}">'
+                '<button type="submit">Unsubscribe</button></form>'
+            )
+            page = UNSUBSCRIBE_PAGE.format(message=f"Unsubscribe {escape(email)} from future invitations?", form=form)
+            self._respond(200, page.encode('utf-8'), 'text/html; charset=utf-8')
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self._read_body()
+
+            if url.path == '/unsubscribe':
+                email = self._unsubscribe_email(url, body)
+                if not email:
+                    self._respond(400, b'Missing email')
+                    return
+                events.put((email, 'unsubscribed', 'one_click', None))
+                page = UNSUBSCRIBE_PAGE.format(message=f"{escape(email)} has been unsubscribed.", form='')
+                self._respond(200, page.encode('utf-8'), 'text/html; charset=utf-8')
+                return
+
+            if url.path == '/webhooks/resend':
+                if RESEND_WEBHOOK_SECRET and not verify_svix_signature(RESEND_WEBHOOK_SECRET, self.headers, body):
+                    logging.warning("Rejected Resend webhook with invalid signature")
+                    self._respond(401, b'Invalid signature')
+                    return
+                try:
+                    event = json.loads(body)
+                except ValueError:
+                    self._respond(400, b'Invalid JSON')
+                    return
+
+                for entry in suppressions_from_resend_event(event):
+                    events.put(entry)
+                self._respond(200, b'ok')
+                return
+
+            self._respond(404)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return WebhookHandler
+
+
+def run_server(host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    """Serve webhooks until interrupted, then flush pending suppressions."""
+    events = queue.Queue()
+    stop_event = threading.Event()
+    writer = threading.Thread(target=suppression_writer, args=(events, stop_event), daemon=True)
+    writer.start()
+
+    server = ThreadingHTTPServer((host, port), make_handler(events))
+    server.daemon_threads = True
+    logging.info(f"Webhook receiver listening on http://{host}:{port}")
+    if not RESEND_WEBHOOK_SECRET:
+        logging.warning("RESEND_WEBHOOK_SECRET not set - Resend webhook signatures are not verified")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down webhook receiver")
+    finally:
+        server.server_close()
+        stop_event.set()
+        writer.join()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run_server()